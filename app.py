@@ -5,7 +5,7 @@ st.set_page_config(
     page_title="مهووس — تسعير ذكي",
     page_icon="🧪",
     layout="wide",
-    initial_sidebar_state=True,
+    initial_sidebar_state="expanded",
 )
 
 from styles import apply
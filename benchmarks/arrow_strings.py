@@ -0,0 +1,103 @@
+"""
+benchmarks/arrow_strings.py — string[pyarrow] مقابل object: الذاكرة والزمن والتطابق
+
+    python -m benchmarks.arrow_strings [--rows 100000] [--run-rows 5000] [--out arrow.json]
+
+  memory    ← memory_usage(deep=True) لملف مهووس + المنافسين بالنوعين (--rows صف)
+  features  ← _features بمسار Python ومسار Arrow: الزمن، ذروة tracemalloc، التطابق الحرفي
+  pipeline  ← run_analysis (بدون AI) + find_missing على أول --run-rows صف من كل ملف بالمسارين؛
+              النتائج يجب أن تتطابق بعد التحويل لـ object، مع ذاكرة DataFrame النتائج
+الخروج 1 إذا اختلف أي ناتج بين المسارين.
+"""
+import argparse, json, logging, sys, time, tracemalloc
+
+from benchmarks.matching import _isolate, _meta
+
+
+def _mb(df):
+    return round(df.memory_usage(deep=True).sum() / 2**20, 2) if len(df) else 0.0
+
+
+def _objects(df):
+    """المسار القديم: كل أعمدة النصوص object"""
+    return df.astype({c: object for c in df.columns if df[c].dtype != object
+                      and df[c].dtype.kind not in "biufcM"})
+
+
+def _measure(fn):
+    """الزمن بدون tracemalloc (يبطئ مسار Python أكثر)، ثم الذروة في تشغيل ثانٍ"""
+    t0 = time.perf_counter()
+    out = fn()
+    dt = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, round(dt, 3), round(peak / 2**20, 1)
+
+
+def _same(a, b):
+    import pandas as pd
+    try:
+        pd.testing.assert_frame_equal(_objects(a), _objects(b), check_dtype=False)
+        return True
+    except AssertionError as e:
+        print(f"[arrow] اختلاف: {str(e)[:300]}", file=sys.stderr)
+        return False
+
+
+def run(rows=100000, run_rows=5000):
+    logging.disable(logging.CRITICAL)
+    from benchmarks.catalog import make_catalog
+    from engines import engine
+
+    our, comps, _ = make_catalog(rows, competitors=2)
+    obj = {"our": _objects(our), **{k: _objects(v) for k, v in comps.items()}}
+    arw = {"our": engine.arrow_strings(our), **{k: engine.arrow_strings(v) for k, v in comps.items()}}
+    memory = {k: {"object_mb": _mb(obj[k]), "arrow_mb": _mb(arw[k])} for k in obj}
+
+    names = obj["our"]["المنتج"].tolist()
+    engine.ARROW_STRINGS = False
+    f_obj, t_obj, p_obj = _measure(lambda: engine._features(names))
+    engine.ARROW_STRINGS = True
+    f_arw, t_arw, p_arw = _measure(lambda: engine._features(names))
+    features = {"rows": len(names), "object_s": t_obj, "arrow_s": t_arw,
+                "object_peak_mb": p_obj, "arrow_peak_mb": p_arw, "identical": f_obj == f_arw}
+
+    def pipeline(frames, arrow):
+        engine.ARROW_STRINGS = arrow
+        engine.clear_caches(); _isolate()
+        o = frames["our"].head(run_rows)
+        c = {k: v.head(run_rows) for k, v in frames.items() if k != "our"}
+        res = engine.run_analysis(o, c, use_ai=False)
+        return res, engine.find_missing(o, c)
+
+    t0 = time.perf_counter(); r_obj, m_obj = pipeline(obj, False)
+    t1 = time.perf_counter(); r_arw, m_arw = pipeline(arw, True)
+    t2 = time.perf_counter()
+    engine.ARROW_STRINGS = True
+    run = {"rows": run_rows, "object_s": round(t1 - t0, 3), "arrow_s": round(t2 - t1, 3),
+           "results_object_mb": _mb(_objects(r_obj)), "results_arrow_mb": _mb(r_arw),
+           "missing_object_mb": _mb(_objects(m_obj)), "missing_arrow_mb": _mb(m_arw),
+           "results_identical": _same(r_obj, r_arw), "missing_identical": _same(m_obj, m_arw)}
+    return {"memory": memory, "features": features, "pipeline": run}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=100000)
+    ap.add_argument("--run-rows", type=int, default=5000)
+    ap.add_argument("--out", default="")
+    a = ap.parse_args(argv)
+    report = {"meta": _meta(), **run(a.rows, a.run_rows)}
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f: f.write(text)
+    print(text)
+    ok = (report["features"]["identical"] and report["pipeline"]["results_identical"]
+          and report["pipeline"]["missing_identical"])
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+benchmarks/catalog.py — مولّد كتالوج اصطناعي (عربي/إنجليزي) للقياس والجودة
+
+كل منتج لدينا يظهر عند المنافس بصياغة مختلفة: ماركة أو اسم بالعربية،
+مرادفات EDP/EDT، كتابة الحجم (100ml / 100 ml / 100 مل)، أخطاء إملائية.
+ومعه منتجات مشتّتة (حجم/تركيز آخر، تستر، عينات) ومنتجات غير موجودة لدينا.
+
+    our, comps, truth = make_catalog(1000, competitors=2, seed=0)
+    truth[(competitor, comp_id)] → our_id للمطابق الحقيقي أو None
+"""
+import random, re
+import pandas as pd
+
+# (إنجليزي, عربي أو None) — العربي فقط حيث يعرفه المطبِّع (_SYN) أو قائمة الماركات
+BRANDS = [("Dior", "ديور"), ("Chanel", "شانيل"), ("Armani", "أرماني"), ("Versace", "فرساتشي"),
+          ("Guerlain", "غيرلان"), ("Tom Ford", "توم فورد"), ("Lattafa", "لطافة"),
+          ("Ajmal", "أجمل"), ("Rasasi", "رصاصي"), ("Amouage", "أمواج"), ("Creed", "كريد"),
+          ("Gucci", "قوتشي"), ("Prada", "برادا"), ("Hermes", "هيرميس"), ("Valentino", "فالنتينو"),
+          ("Cartier", "كارتييه"), ("Bvlgari", "بولغاري"), ("Xerjoff", None), ("Montale", None),
+          ("Mancera", None), ("Kilian", None), ("Afnan", None), ("Armaf", None)]
+WORDS = [("Sauvage", "سوفاج"), ("Bleu", "بلو"), ("Aventus", "أفينتوس"), ("Oud", "عود"),
+         ("Musk", "مسك"), ("Velvet", None), ("Amber", None), ("Rose", None), ("Noir", None),
+         ("Royal", None), ("Silver", None), ("Night", None), ("Wood", None), ("Ocean", None),
+         ("Leather", None), ("Vanilla", None), ("Iris", None), ("Code", None), ("Eros", None),
+         ("Luna", None), ("Nova", None), ("Saffron", None), ("Tobacco", None), ("Intense", None)]
+TYPES = {"EDP": ["EDP", "Eau de Parfum", "او دو بارفان", "بارفان"],
+         "EDT": ["EDT", "Eau de Toilette", "او دو تواليت", "تواليت"],
+         "EDC": ["EDC", "Eau de Cologne", "كولون"]}
+SIZES = [30, 50, 75, 90, 100, 125, 150, 200]
+
+
+def _size(r, ml):
+    return r.choice([f"{ml}ml", f"{ml} ml", f"{ml} مل", f"{ml}ML"])
+
+
+def _typo(r, w):
+    if len(w) < 4: return w
+    i = r.randrange(1, len(w) - 2)
+    return r.choice([w[:i] + w[i+1:],                          # حذف حرف
+                     w[:i] + w[i+1] + w[i] + w[i+2:],          # تبديل حرفين
+                     w[:i] + w[i] + w[i:]])                    # تكرار حرف
+
+
+def _variant(r, p, arabic=0.3, typo=0.15):
+    """صياغة المنافس لنفس المنتج"""
+    (be, ba), words, tp, ml = p
+    brand = ba if ba and r.random() < arabic else be
+    ws = []
+    for we, wa in words:
+        w = wa if wa and r.random() < arabic else we
+        ws.append(_typo(r, w) if wa is None and r.random() < typo else w)
+    if r.random() < 0.15: ws.reverse()
+    return " ".join([brand, *ws, r.choice(TYPES[tp]), _size(r, ml)])
+
+
+def _canonical(p):
+    (be, _), words, tp, ml = p
+    return " ".join([be, *(w for w, _ in words), tp, f"{ml}ml"])
+
+
+def make_catalog(n, competitors=2, seed=0, match_rate=0.6, distract_rate=0.25,
+                 tester_rate=0.03, sample_rate=0.02, extra_rate=0.15):
+    """
+    → (our_df, {اسم المنافس: df}, truth)
+    الأعمدة: لدينا (المنتج, السعر, no) | المنافس (المنتج, السعر, ID)
+    """
+    r = random.Random(seed)
+    seen, products = set(), []
+    while len(products) < n:
+        p = (r.choice(BRANDS), tuple(r.sample(WORDS, r.choice((1, 2, 2, 3)))),
+             r.choice(("EDP", "EDP", "EDT", "EDC")), r.choice(SIZES))
+        k = (p[0][0], tuple(w for w, _ in p[1]), p[2], p[3])
+        if k in seen: continue
+        seen.add(k); products.append(p)
+
+    prices = [r.randint(80, 1500) for _ in products]
+    our = pd.DataFrame({"المنتج": [_canonical(p) for p in products], "السعر": prices,
+                        "no": [f"M{i}" for i in range(n)]})
+
+    comps, truth = {}, {}
+    for c in range(competitors):
+        cname, rows = f"منافس{c + 1}", []
+
+        def add(name, price, match=None):
+            cid = f"C{c}-{len(rows)}"
+            rows.append({"المنتج": name, "السعر": price, "ID": cid})
+            truth[(cname, cid)] = match
+
+        for i, p in enumerate(products):
+            if r.random() < match_rate:
+                add(_variant(r, p), round(prices[i] * r.uniform(0.8, 1.2)), f"M{i}")
+            if r.random() < distract_rate:          # نفس العطر بحجم أو تركيز آخر
+                (b, words, tp, ml) = p
+                if r.random() < 0.5:
+                    q = (b, words, tp, r.choice([s for s in SIZES if abs(s - ml) > 30] or [ml * 2]))
+                else:
+                    q = (b, words, r.choice([t for t in TYPES if t != tp]), ml)
+                if (q[0][0], tuple(w for w, _ in q[1]), q[2], q[3]) not in seen:
+                    add(_variant(r, q), r.randint(80, 1500))
+            if r.random() < tester_rate:
+                add(_variant(r, p) + r.choice([" Tester", " تستر"]), round(prices[i] * 0.7))
+            if r.random() < sample_rate:
+                add(re.sub(r"\s*\d+\s*(ml|ML|مل)$", "", _variant(r, p))
+                    + r.choice([" Sample 2ml", " عينة 5 مل"]), 25)
+        for _ in range(int(n * extra_rate)):          # غير موجود لدينا (يظهر في المفقودات)
+            q = (r.choice(BRANDS), tuple(r.sample(WORDS, 2)), r.choice(list(TYPES)), r.choice(SIZES))
+            if (q[0][0], tuple(w for w, _ in q[1]), q[2], q[3]) in seen: continue
+            add(_variant(r, q), r.randint(80, 1500))
+        r.shuffle(rows)
+        comps[cname] = pd.DataFrame(rows)
+    return our, comps, truth
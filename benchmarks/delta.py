@@ -0,0 +1,84 @@
+"""
+benchmarks/delta.py — وضع الدلتا: كم صفاً يُعاد مطابقته فعلاً، وهل الناتج = تشغيل كامل؟
+
+    python -m benchmarks.delta [--rows 2000] [--changes 5] [--out delta.json]
+
+لكل سيناريو: تشغيل كامل على الملفات الأصلية (لقطة)، ثم run_analysis(delta=True) على
+الملفات بعد التغيير، ثم تشغيل كامل بقاعدة نظيفة على نفس الملفات للمقارنة:
+  prices    ← تغيّر أسعار --changes صف عند منافس          → لا إعادة مطابقة
+  unrelated ← منتج لا يشبه أي شيء عندنا أُضيف لمنافس       → لا إعادة مطابقة
+  related   ← --changes صف جديد (صياغة أخرى لمنتجات موجودة) → ما يجتاز البحث الكامل فقط
+  removed   ← حذف --changes صف مطابق من منافس              → من كان بين مرشحيه فقط
+الخروج 1 إذا اختلف ناتج الدلتا عن التشغيل الكامل أو تجاوز المُعاد الحد المتوقع.
+"""
+import argparse, json, logging, sys
+
+from benchmarks.matching import _isolate, _meta
+
+_COLS = ["المنتج", "منتج_المنافس", "معرف_المنافس", "سعر_المنافس", "القرار", "المنافس"]
+
+
+def _scenarios(comps, truth, k):
+    import pandas as pd
+    name = next(iter(comps))
+    c = comps[name]
+    matched = c[[truth.get((name, i)) is not None for i in c["ID"]]].head(k)
+
+    prices = dict(comps)
+    prices[name] = c.assign(السعر=[p + 7 if i < k else p for i, p in enumerate(c["السعر"])])
+
+    unrelated = dict(comps)
+    unrelated[name] = pd.concat([c, pd.DataFrame([{"المنتج": "Zzyzx Ceramic Candle Holder Large",
+                                                    "السعر": 55.0, "ID": "NEW-UNREL"}])],
+                                ignore_index=True)
+
+    related = dict(comps)
+    extra = matched.assign(ID=[f"NEW-{i}" for i in range(len(matched))],
+                           المنتج=[f"{n} New" for n in matched["المنتج"]])
+    related[name] = pd.concat([c, extra], ignore_index=True)
+
+    removed = dict(comps)
+    removed[name] = c.drop(index=matched.index).reset_index(drop=True)
+    return {"prices": (prices, 0), "unrelated": (unrelated, 0),
+            "related": (related, None), "removed": (removed, None)}
+
+
+def run(rows=2000, changes=5):
+    logging.disable(logging.CRITICAL)
+    from benchmarks.catalog import make_catalog
+    from engines import engine
+
+    our, comps, truth = make_catalog(rows, competitors=2)
+    report = {}
+    for label, (after, limit) in _scenarios(comps, truth, changes).items():
+        engine.clear_caches(); _isolate()
+        engine.run_analysis(our, comps, use_ai=False, delta=True)
+        d = engine.run_analysis(our, after, use_ai=False, delta=True)
+        engine.clear_caches(); _isolate()
+        full = engine.run_analysis(our, after, use_ai=False)
+        same = d[_COLS].astype(str).equals(full[_COLS].astype(str))
+        rep = d.attrs["delta"]
+        bound = limit if limit is not None else changes * 5   # مرشحو كل صف متغيّر ≤ 5 منتجات
+        report[label] = {"rows": len(d), "recomputed": rep["recomputed"], "reused": rep["reused"],
+                         "added": rep["added"], "removed": rep["removed"],
+                         "max_expected": bound, "identical": same,
+                         "ok": same and rep["recomputed"] <= bound}
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--changes", type=int, default=5)
+    ap.add_argument("--out", default="")
+    a = ap.parse_args(argv)
+    report = {"meta": _meta(), "scenarios": run(a.rows, a.changes)}
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f: f.write(text)
+    print(text)
+    return 0 if all(s["ok"] for s in report["scenarios"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+benchmarks/fake_llm.py — مزود LLM وهمي محلي (Gemini / OpenRouter / Cohere)
+لقياس زمن الاستجابة والتحوّط والتقييد بدون شبكة ولا مفاتيح حقيقية.
+
+    srv = FakeLLM(delays={"gemini": lambda: 0.2}).start()
+    client = LLMClient(gemini_keys=["k"*30], **srv.client_kwargs())
+"""
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLM:
+    """
+    delays: {"gemini"|"openrouter"|"cohere": دالة → ثوانٍ} لحقن التأخير
+    throttle: {مفتاح: عدد ردود 429 قبل النجاح}
+    reply: دالة (المزود, نص الطلب) → نص الرد
+    """
+    def __init__(self, delays=None, throttle=None, reply=None, retry_after=1):
+        self.delays      = delays or {}
+        self.throttle    = dict(throttle or {})
+        self.reply       = reply or (lambda provider, text: f"{provider}: {text[-40:]}")
+        self.retry_after = retry_after
+        self.calls       = []
+        self._lock       = threading.Lock()
+        self._srv        = None
+
+    # ── التشغيل ──
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            def log_message(self, *a): pass
+            def do_POST(self):
+                n = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(n) or b"{}")
+                fake._handle(self, body)
+
+        self._srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._srv.daemon_threads = True
+        threading.Thread(target=self._srv.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._srv:
+            self._srv.shutdown(); self._srv.server_close()
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self._srv.server_port}"
+
+    def client_kwargs(self):
+        """معاملات LLMClient للإشارة إلى هذا الخادم"""
+        return dict(gemini_base=self.base,
+                    openrouter_url=f"{self.base}/openrouter", openrouter_key="fake",
+                    cohere_url=f"{self.base}/cohere", cohere_key="fake")
+
+    # ── الطلبات ──
+    def _send(self, h, status, payload, headers=()):
+        b = json.dumps(payload, ensure_ascii=False).encode()
+        h.send_response(status)
+        h.send_header("Content-Type", "application/json")
+        h.send_header("Content-Length", str(len(b)))
+        for k, v in headers: h.send_header(k, v)
+        h.end_headers(); h.wfile.write(b)
+
+    def _handle(self, h, body):
+        path = h.path
+        provider = ("openrouter" if path.startswith("/openrouter") else
+                    "cohere" if path.startswith("/cohere") else "gemini")
+        key = h.headers.get("x-goog-api-key", "")
+        with self._lock:
+            self.calls.append((provider, key, time.time()))
+            left = self.throttle.get(key, 0)
+            if left: self.throttle[key] = left - 1
+        if left:
+            return self._send(h, 429, {"error": "quota"}, [("Retry-After", str(self.retry_after))])
+        delay = self.delays.get(provider)
+        if delay: time.sleep(delay())
+
+        if provider == "openrouter":
+            text = self.reply(provider, body["messages"][-1]["content"])
+            return self._send(h, 200, {"choices": [{"message": {"content": text}}]})
+        if provider == "cohere":
+            return self._send(h, 200, {"generations": [{"text": self.reply(provider, body["prompt"])}]})
+
+        text = self.reply(provider, body["contents"][-1]["parts"][0]["text"])
+        if ":streamGenerateContent" in path:
+            return self._stream(h, text)
+        return self._send(h, 200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+    def _stream(self, h, text, pieces=8, gap=0.02):
+        """رد Gemini المجزأ: مصفوفة JSON تُرسل على دفعات (chunked)"""
+        step = max(1, len(text) // pieces)
+        parts = [text[i:i+step] for i in range(0, len(text), step)]
+        objs = [json.dumps({"candidates": [{"content": {"parts": [{"text": p}]}}]},
+                           ensure_ascii=False) for p in parts]
+        h.send_response(200)
+        h.send_header("Content-Type", "application/json")
+        h.send_header("Transfer-Encoding", "chunked")
+        h.end_headers()
+        for i, o in enumerate(objs):
+            chunk = (("[" if i == 0 else ",\r\n") + o + ("]" if i == len(objs) - 1 else "")).encode()
+            h.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk)); h.wfile.flush()
+            time.sleep(gap)
+        h.wfile.write(b"0\r\n\r\n")
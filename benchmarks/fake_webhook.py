@@ -0,0 +1,70 @@
+"""
+benchmarks/fake_webhook.py — webhook Make.com وهمي محلي
+يسجّل الدفعات بمفتاح Idempotency-Key (المكرر لا يُحتسب مرتين كما في Make)
+ويحقن أعطالاً: 503 بنسبة fail_rate، أو رفض كل الطلبات ما دام down=True.
+
+    hook = FakeWebhook(fail_rate=0.2).start()
+    send_price_updates(rows, url=hook.url)
+"""
+import json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeWebhook:
+    def __init__(self, fail_rate=0.0, delay=0.0, seed=1):
+        self.fail_rate  = fail_rate
+        self.delay      = delay
+        self.down       = False
+        self.requests   = 0
+        self.duplicates = 0
+        self.received   = {}            # مفتاح → منتجات الدفعة
+        self.max_bytes  = 0
+        self._rnd       = random.Random(seed)
+        self._lock      = threading.Lock()
+        self._srv       = None
+
+    def start(self):
+        hook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            def log_message(self, *a): pass
+            def do_POST(self):
+                n = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(n)
+                status = hook._handle(self.headers.get("Idempotency-Key", ""), raw)
+                body = b"Accepted" if status == 200 else b"error"
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers(); self.wfile.write(body)
+
+        self._srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._srv.daemon_threads = True
+        threading.Thread(target=self._srv.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._srv:
+            self._srv.shutdown(); self._srv.server_close()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._srv.server_port}/hook"
+
+    def _handle(self, key, raw):
+        if self.delay: time.sleep(self.delay)
+        with self._lock:
+            self.requests += 1
+            self.max_bytes = max(self.max_bytes, len(raw))
+            if self.down or self._rnd.random() < self.fail_rate:
+                return 503
+            if key in self.received:
+                self.duplicates += 1
+            else:
+                self.received[key] = json.loads(raw).get("products", [])
+        return 200
+
+    def products(self):
+        """كل المنتجات المستلمة (بدون الدفعات المكررة)"""
+        with self._lock:
+            return [p for ps in self.received.values() for p in ps]
@@ -0,0 +1,61 @@
+"""
+benchmarks/hedging.py — زمن الذيل لصفحة AI مع/بدون التحوّط بين المزودين
+
+    python -m benchmarks.hedging --n 200 --slow-rate 0.03 --slow 6
+
+Gemini الوهمي يرد عادةً خلال ~0.3ث ويتأخر `--slow` ثانية بنسبة `--slow-rate`؛
+OpenRouter الوهمي يرد خلال ~0.6ث. يقارن p50/p95/p99 لـ:
+  serial — الأسلوب القديم (انتظار Gemini كاملاً ثم البديل)
+  hedged — LLMClient.hedged (البديل يبدأ بعد p95 زمن Gemini)
+"""
+import argparse, json, random, sys, time
+
+from benchmarks.fake_llm import FakeLLM
+from engines.llm_client import LLMClient
+
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * (len(xs) - 1)))] if xs else 0.0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--n", type=int, default=100)
+    ap.add_argument("--slow-rate", type=float, default=0.03)
+    ap.add_argument("--slow", type=float, default=5.0)
+    ap.add_argument("--seed", type=int, default=7)
+    a = ap.parse_args(argv)
+
+    rnd = random.Random(a.seed)
+    srv = FakeLLM(delays={
+        "gemini":     lambda: a.slow if rnd.random() < a.slow_rate else rnd.uniform(0.2, 0.4),
+        "openrouter": lambda: rnd.uniform(0.5, 0.7),
+    }).start()
+    client = LLMClient(gemini_keys=["fake-key-" + "x" * 24], rpm=100000,
+                       **srv.client_kwargs())
+    payload = {"contents": [{"parts": [{"text": "ping"}]}]}
+    msgs = [{"role": "user", "content": "ping"}]
+    gem = lambda: client.gemini_text(payload, timeout=a.slow + 5)
+    orr = lambda: client.openrouter(msgs, timeout=a.slow + 5)
+
+    out = {}
+    for mode in ("serial", "hedged"):
+        lat = []
+        for _ in range(a.n):
+            t0 = time.time()
+            if mode == "serial":
+                gem() or orr()
+            else:
+                client.hedged([("Gemini", gem), ("OpenRouter", orr)])
+            lat.append(time.time() - t0)
+        out[mode] = {k: round(_pct(lat, q), 3)
+                     for k, q in (("p50", .5), ("p95", .95), ("p99", .99))}
+    out["hedge_deadline"] = round(client.p95("Gemini"), 3)
+    srv.stop()
+    json.dump(out, sys.stdout, indent=2); print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
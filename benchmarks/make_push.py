@@ -0,0 +1,96 @@
+"""
+benchmarks/make_push.py — إرسال Make.com على دفعات مقابل webhook وهمي
+
+    python -m benchmarks.make_push --n 5000 --fail-rate 0.3
+
+1) إرسال n منتج مع أعطال 503 عشوائية (إعادة المحاولة داخل كل دفعة)
+2) انقطاع كامل منتصف الإرسال → دفعات فاشلة في الصندوق الصادر
+3) resume_outbox() بعد عودة الخادم
+4) إعادة الضغط على «إرسال» بنفس البيانات → لا شيء يُرسل
+5) «اليوم التالي»: --daily-change من المنتجات تغيّر سعرها → يُرسل ما تغيّر فقط
+6) عودة السعر لقيمته السابقة في نفس اليوم (90 → 80 → 90 → 80) → كل عودة تُرسل والسجل يتبعها
+7) الإرسال التجريبي (⚙️ النظام) مرتين → كل ضغطة تصل، ولا شيء في السجل ولا الصندوق
+(خطوات 3–6 بـ only_changed=True كما في زر «إرسال» بصفحة النتائج)
+يطبع JSON: الطلبات، الدفعات، المكرر، وهل وصل كل منتج مرة واحدة بالضبط.
+"""
+import argparse, json, os, sys, tempfile, threading, time
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--n", type=int, default=5000)
+    ap.add_argument("--fail-rate", type=float, default=0.3)
+    ap.add_argument("--outage", type=float, default=0.5, help="ثوانٍ بعد البدء ينقطع الخادم")
+    ap.add_argument("--daily-change", type=float, default=0.05)
+    a = ap.parse_args(argv)
+
+    from utils import db_manager
+    db_manager.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db_manager.init_db()
+    from utils import make_helper as mh
+    from benchmarks.fake_webhook import FakeWebhook
+
+    rows = [{"معرف_المنتج": f"P{i}", "المنتج": f"عطر تجريبي {i} EDP 100ml", "السعر": 100 + i % 400,
+             "سعر_المنافس": 90 + i % 380, "الفرق": 10, "القرار": "🔴 سعر أعلى",
+             "المنافس": "اختبار", "الماركة": "Dior", "نسبة_التطابق": 90} for i in range(a.n)]
+    hook = FakeWebhook(fail_rate=a.fail_rate, delay=0.05).start()
+    out = {"products": a.n}
+
+    # انقطاع كامل أثناء الإرسال
+    threading.Timer(a.outage, lambda: setattr(hook, "down", True)).start()
+    t0 = time.time()
+    r1 = mh.send_price_updates(rows, url=hook.url, only_changed=True)
+    out["first_push"] = {"success": r1["success"], "sent": r1.get("count", 0),
+                         "seconds": round(time.time() - t0, 2)}
+    out["outbox_after_outage"] = db_manager.outbox_stats()
+
+    hook.down, hook.fail_rate = False, 0.1
+    r2 = mh.resume_outbox()
+    out["resume"] = {"success": r2["success"], "sent": r2.get("count", 0)}
+
+    before = hook.requests
+    r3 = mh.send_price_updates(rows, url=hook.url, only_changed=True)
+    out["repeat_push"] = {"requests": hook.requests - before, "message": r3["message"]}
+
+    got = [p["product_no"] for p in hook.products()]
+
+    k = int(a.n * a.daily_change)
+    day2 = [dict(r, **{"سعر_المنافس": r["سعر_المنافس"] - 5}) if i < k else r for i, r in enumerate(rows)]
+    before, seen = hook.requests, len(hook.products())
+    preview = mh.preview_price_updates(day2)
+    r4 = mh.send_price_updates(day2, url=hook.url, only_changed=True)
+    out["daily_rerun"] = {"preview": preview, "sent": r4.get("count", 0),
+                          "requests": hook.requests - before,
+                          "products_received": len(hook.products()) - seen}
+    # السعر يعود للقيمة الأصلية ثم لقيمة اليوم التالي — كلاهما تغيير حقيقي عن آخر ما وصل
+    revert = []
+    for label, data in (("back", rows), ("again", day2)):
+        before, seen = hook.requests, len(hook.products())
+        r = mh.send_price_updates(data, url=hook.url, only_changed=True)
+        new = hook.products()[seen:]
+        want = {d["معرف_المنتج"]: float(d["سعر_المنافس"]) for d in data[:k]}
+        ledger = db_manager.ledger_get(want)
+        revert.append({"step": label, "sent": r.get("count", 0), "products_received": len(new),
+                       "ok": (sorted(p["product_no"] for p in new) == sorted(want)
+                              and all(abs(ledger[n][1] - v) < 0.01 for n, v in want.items()))})
+    out["price_revert"] = revert
+
+    hook.fail_rate = 0.0
+    before, outbox = hook.requests, db_manager.outbox_stats()
+    test = dict(rows[0], **{"معرف_المنتج": "TEST_001"})
+    tries = [mh.send_test_update(test, url=hook.url)["success"] for _ in range(2)]
+    out["test_send"] = {"requests": hook.requests - before,
+                        "ok": (all(tries) and hook.requests - before == 2
+                               and not db_manager.ledger_get({"TEST_001"})
+                               and db_manager.outbox_stats() == outbox)}
+
+    out.update(requests=hook.requests, chunks=len(hook.received), duplicates=hook.duplicates,
+               max_request_kb=round(hook.max_bytes / 1024, 1),
+               exactly_once=sorted(got) == sorted(r["معرف_المنتج"] for r in rows))
+    hook.stop()
+    print(json.dumps(out, ensure_ascii=False, indent=1))
+    return 0 if out["exactly_once"] and all(r["ok"] for r in revert) and out["test_send"]["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
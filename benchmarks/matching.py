@@ -0,0 +1,127 @@
+"""
+benchmarks/matching.py — قياس أداء محرك المطابقة على كتالوج اصطناعي
+
+    python -m benchmarks.matching --sizes 1000,10000,100000 --out bench.json
+    python -m benchmarks.matching --sizes 1000 --compare bench.json
+
+المراحل: normalize, extract_brand, CompIndex build, CompIndex.search,
+run_analysis (بدون AI), find_missing, export_excel.
+run_analysis و find_missing يُتخطيان فوق --max-full (الأحجام الكبيرة بطيئة
+بطبيعتها) — مرّر --max-full 100000 لتشغيلها. النتائج JSON للمقارنة بين التشغيلات.
+"""
+import argparse, json, os, platform, subprocess, sys, tempfile, time
+from datetime import datetime
+
+
+def _isolate():
+    """قواعد بيانات مؤقتة: لا ذاكرة مطابقة ولا snapshot من تشغيل سابق"""
+    d = tempfile.mkdtemp(prefix="mahwous_bench_")
+    from engines import engine
+    from utils import db_manager
+    engine.DB_PATH = os.path.join(d, "engine.db"); engine._init_db()
+    db_manager.DB_PATH = os.path.join(d, "app.db"); db_manager.init_db()
+    return d
+
+
+def _stage(items, fn, repeat=1):
+    """أفضل زمن من repeat محاولة"""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None or dt < best else best
+    return {"seconds": round(best, 4), "items": items,
+            "per_item_us": round(best / items * 1e6, 2) if items else 0.0}, out
+
+
+def run_size(n, competitors=2, seed=0, repeat=1, max_full=10000, queries=2000):
+    from benchmarks.catalog import make_catalog
+    from engines.engine import (normalize, extract_brand, CompIndex, run_analysis,
+                                find_missing, export_excel, build_indices, our_catalog)
+    _isolate()
+    our, comps, _ = make_catalog(n, competitors=competitors, seed=seed)
+    names = our["المنتج"].tolist() + [x for df in comps.values() for x in df["المنتج"].tolist()]
+    res = {"rows_ours": len(our), "rows_competitors": sum(len(d) for d in comps.values())}
+
+    res["normalize"], _ = _stage(len(names), lambda: [normalize(x) for x in names], repeat)
+    res["extract_brand"], _ = _stage(len(names), lambda: [extract_brand(x) for x in names], repeat)
+    res["compindex_build"], indices = _stage(
+        res["rows_competitors"],
+        lambda: {c: CompIndex(df, "المنتج", "ID", c) for c, df in comps.items()}, repeat)
+
+    cat = our_catalog(our)
+    qs = list(range(0, len(cat), max(1, len(cat) // queries)))[:queries]
+    idx = next(iter(indices.values()))
+    norms, brands, sizes, types = cat.norms, cat.brands, cat.sizes, cat.types
+    res["compindex_search"], _ = _stage(
+        len(qs), lambda: [idx.search(norms[i], brands[i], sizes[i], types[i])
+                          for i in qs], repeat)
+
+    if n <= max_full:
+        indices = build_indices(comps)
+        res["run_analysis"], results = _stage(
+            len(our), lambda: run_analysis(our, comps, use_ai=False, indices=indices, catalog=cat), 1)
+        res["find_missing"], missing = _stage(
+            res["rows_competitors"], lambda: find_missing(our, comps, indices=indices, catalog=cat), repeat)
+        res["export_excel"], _ = _stage(len(results), lambda: export_excel(results), repeat)
+        res["matched"] = int((results["منتج_المنافس"] != "—").sum())
+        res["missing"] = len(missing)
+    else:
+        res["skipped"] = ["run_analysis", "find_missing", "export_excel"]
+    return res
+
+
+def _meta():
+    import numpy, pandas, rapidfuzz
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, timeout=10).stdout.strip()
+    except Exception:
+        rev = ""
+    return {"timestamp": datetime.now().isoformat(timespec="seconds"), "git": rev,
+            "python": platform.python_version(), "pandas": pandas.__version__,
+            "numpy": numpy.__version__, "rapidfuzz": rapidfuzz.__version__,
+            "cpus": os.cpu_count(), "machine": platform.machine()}
+
+
+def compare(new, old):
+    """نسبة الزمن الجديد/القديم لكل مرحلة (<1 أسرع)"""
+    out = {}
+    for n, stages in new["results"].items():
+        prev = old.get("results", {}).get(n, {})
+        for k, v in stages.items():
+            if isinstance(v, dict) and isinstance(prev.get(k), dict) and prev[k]["seconds"]:
+                out.setdefault(n, {})[k] = round(v["seconds"] / prev[k]["seconds"], 3)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--competitors", type=int, default=2)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--max-full", type=int, default=10000)
+    ap.add_argument("--out", default="")
+    ap.add_argument("--compare", default="", help="ملف JSON سابق للمقارنة")
+    a = ap.parse_args(argv)
+
+    report = {"meta": _meta(), "results": {}}
+    for n in [int(x) for x in a.sizes.split(",") if x.strip()]:
+        report["results"][str(n)] = run_size(n, a.competitors, a.seed, a.repeat, a.max_full)
+        print(f"[bench] {n}: " + " ".join(
+            f"{k}={v['seconds']}s" for k, v in report["results"][str(n)].items()
+            if isinstance(v, dict)), file=sys.stderr)
+    if a.compare:
+        with open(a.compare, encoding="utf-8") as f:
+            report["ratio_vs_baseline"] = compare(report, json.load(f))
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f: f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+benchmarks/names.py — جدول الأسماء العام: الاستخراج لكل ملف مقابل NameTable
+
+    python -m benchmarks.names [--rows 20000] [--competitors 5] [--out names.json]
+
+per_file ← _features لكل ملف على حدة (مهووس + كل منافس + find_missing مرة أخرى)
+interned ← NameTable.intern لنفس القوائم: كل اسم مميز يُستخرج مرة واحدة
+لكلٍّ: الزمن، ذروة tracemalloc، وعدد الأسماء التي استُخرجت خصائصها فعلاً.
+"""
+import argparse, json, logging, sys, time, tracemalloc
+
+from benchmarks.matching import _meta
+
+
+def _measure(fn):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    tracemalloc.start()
+    keep = fn()                      # النتيجة حيّة عند قراءة الذاكرة = ما يبقى في الفهارس
+    cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return round(dt, 3), round(cur / 2**20, 1), round(peak / 2**20, 1)
+
+
+def run(rows=20000, competitors=5):
+    logging.disable(logging.CRITICAL)
+    from benchmarks.catalog import make_catalog
+    from engines import engine
+
+    our, comps, _ = make_catalog(rows, competitors=competitors)
+    lists = [[n.strip() for n in our["المنتج"].fillna("").astype(str)]]
+    lists += [c["المنتج"].fillna("").astype(str).tolist() for c in comps.values()]
+    lists += lists[1:]               # find_missing بدون فهارس كان يعيد التطبيع
+    rows_total = sum(map(len, lists))
+
+    def per_file():
+        return [engine._features(l) for l in lists]
+
+    def interned():
+        t = engine.NameTable()
+        return t, [t.intern(l) for l in lists]
+
+    a = _measure(per_file)
+    b = _measure(interned)
+    table = interned()[0]
+    return {"rows": rows_total, "distinct": len(table),
+            "per_file": {"seconds": a[0], "retained_mb": a[1], "peak_mb": a[2],
+                         "extracted": sum(len(set(l)) for l in lists)},
+            "interned": {"seconds": b[0], "retained_mb": b[1], "peak_mb": b[2],
+                         "extracted": len(table)},
+            "reuse": table.stats()["reuse"]}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--competitors", type=int, default=5)
+    ap.add_argument("--out", default="")
+    a = ap.parse_args(argv)
+    report = {"meta": _meta(), **run(a.rows, a.competitors)}
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f: f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
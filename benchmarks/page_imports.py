@@ -0,0 +1,91 @@
+"""
+benchmarks/page_imports.py — زمن التحميل البارد لكل صفحة Streamlit
+
+    python -m benchmarks.page_imports [--repeat 3] [--out pages.json] [--compare old.json]
+
+كل صفحة تُشغَّل في عملية جديدة (cold) داخل مجلد مؤقت فارغ وبدون نتائج في الجلسة
+(أول زيارة): زمن import streamlit، زمن تنفيذ سكربت الصفحة، عدد الوحدات الإضافية،
+الوحدات الثقيلة التي حُمّلت، وملفات قواعد البيانات التي أُنشئت.
+الصفحات تعمل في "bare mode" (بدون خادم) — st.* تعمل والتحذيرات تُكتم.
+"""
+import argparse, glob, json, os, subprocess, sys, tempfile
+
+from benchmarks.matching import _meta
+
+ROOT  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("pandas", "numpy", "pyarrow", "rapidfuzz", "requests", "openpyxl",
+         "engines.engine", "engines.llm_client", "utils.db_manager")
+
+_PROBE = r"""
+import json, logging, os, runpy, sys, time
+logging.disable(logging.CRITICAL)
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import streamlit
+t1 = time.perf_counter(); base = set(sys.modules)
+err = ""
+try:
+    runpy.run_path({page!r}, run_name="__main__")
+except BaseException as e:       # st.stop() وما شابه في bare mode
+    err = type(e).__name__
+t2 = time.perf_counter()
+print(json.dumps({{"streamlit_s": t1 - t0, "page_s": t2 - t1,
+                  "modules": len(set(sys.modules) - base),
+                  "heavy": [m for m in {heavy!r} if m in sys.modules and m not in base],
+                  "files": sorted(os.listdir(".")), "exit": err}}))
+"""
+
+
+def probe(page):
+    with tempfile.TemporaryDirectory(prefix="mahwous_pages_") as d:
+        env = {**os.environ, "PYTHONPATH": ROOT, "PYTHONWARNINGS": "ignore"}
+        r = subprocess.run([sys.executable, "-c", _PROBE.format(root=ROOT, page=page, heavy=HEAVY)],
+                           cwd=d, env=env, capture_output=True, text=True, timeout=120)
+    line = next((l for l in reversed(r.stdout.splitlines()) if l.startswith("{")), None)
+    if not line:
+        return {"error": (r.stderr or r.stdout)[-500:]}
+    return json.loads(line)
+
+
+def run(repeat=3):
+    pages = [os.path.join(ROOT, "app.py")] + sorted(glob.glob(os.path.join(ROOT, "pages", "*.py")))
+    out = {}
+    for p in pages:
+        runs = [probe(p) for _ in range(repeat)]
+        ok = [x for x in runs if "error" not in x]
+        if not ok:
+            out[os.path.basename(p)] = runs[0]; continue
+        best = min(ok, key=lambda x: x["page_s"])
+        out[os.path.basename(p)] = {
+            "page_s": round(best["page_s"], 4),
+            "streamlit_s": round(min(x["streamlit_s"] for x in ok), 4),
+            "modules": best["modules"], "heavy": best["heavy"],
+            "db_files": [f for f in best["files"] if f.endswith(".db")], "exit": best["exit"]}
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default="")
+    ap.add_argument("--compare", default="", help="تقرير سابق: نسبة زمن الصفحة الجديد/القديم")
+    a = ap.parse_args(argv)
+    report = {"meta": _meta(), "pages": run(a.repeat)}
+    for name, r in report["pages"].items():
+        print(f"[pages] {name}: {r.get('page_s', '-')}s +{r.get('modules', '-')} وحدة "
+              f"{','.join(r.get('heavy', [])) or '—'}", file=sys.stderr)
+    if a.compare:
+        with open(a.compare, encoding="utf-8") as f:
+            old = json.load(f)["pages"]
+        report["ratio_vs_baseline"] = {
+            k: round(v["page_s"] / old[k]["page_s"], 3) for k, v in report["pages"].items()
+            if "page_s" in v and old.get(k, {}).get("page_s")}
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f: f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+benchmarks/quality.py — جودة المطابقة على مجموعة معنونة (gold set)
+
+    python -m benchmarks.quality                          # benchmarks/gold.csv بدون AI
+    python -m benchmarks.quality --synthetic 2000         # كتالوج اصطناعي (catalog.py)
+    python -m benchmarks.quality --ai record --recording rec.json   # Gemini حقيقي + تسجيل
+    python -m benchmarks.quality --ai replay --recording rec.json   # إعادة الأحكام المسجّلة
+    python -m benchmarks.quality --out q.json --check q_base.json   # بوابة: لا تراجع في الجودة
+
+gold.csv: our_product, our_price, comp_product, comp_price, is_match
+أي زوج غير مُعلَّم بـ 1 يُعدّ غير مطابق (الأمثلة السالبة المكتوبة = مشتّتات صعبة).
+
+المقاييس على القرار النهائي لكل منتج لدينا (الصف الذي يعرضه التطبيق):
+  precision = المطابقات الصحيحة / كل المطابقات المُعلنة بنسبة ≥ العتبة
+  recall    = المطابقات الصحيحة / منتجاتنا التي لها مطابق حقيقي
+عند MATCH_THRESHOLD و AUTO_THRESHOLD، و"final" = قرار التشغيل بعد AI/المقيّم المحلي.
+routed_to_ai = العناصر التي وصلت فعلاً لطابور Gemini، ambiguous = المنطقة الغامضة
+(MATCH_THRESHOLD ≤ score < AUTO_THRESHOLD) التي كانت ستُرسل لو كان AI مفعّلاً.
+"""
+import argparse, csv, hashlib, json, os, sys
+import pandas as pd
+
+from benchmarks.matching import _isolate, _meta
+
+GOLD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gold.csv")
+COMP_NAME = "gold"
+
+
+# ══ تحميل المجموعة المعنونة ══════════════════
+def load_gold(path=GOLD_PATH):
+    """→ (our_df, {COMP_NAME: comp_df}, {our_id: {comp_id مطابق}})"""
+    ours, comps, positives = {}, {}, {}
+    with open(path, encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            o = ours.setdefault(r["our_product"].strip(),
+                                (f"G{len(ours)}", float(r["our_price"] or 0)))
+            c = comps.setdefault(r["comp_product"].strip(),
+                                 (f"K{len(comps)}", float(r["comp_price"] or 0)))
+            if str(r["is_match"]).strip() in ("1", "true", "True", "yes"):
+                positives.setdefault(o[0], set()).add(c[0])
+    our = pd.DataFrame({"المنتج": list(ours), "السعر": [v[1] for v in ours.values()],
+                        "no": [v[0] for v in ours.values()]})
+    comp = pd.DataFrame({"المنتج": list(comps), "السعر": [v[1] for v in comps.values()],
+                         "ID": [v[0] for v in comps.values()]})
+    return our, {COMP_NAME: comp}, positives
+
+
+def synthetic_gold(n, seed=0):
+    """نفس الصيغة من catalog.make_catalog (منافس واحد: القرار = أفضل مرشح عنده)"""
+    from benchmarks.catalog import make_catalog
+    our, comps, truth = make_catalog(n, competitors=1, seed=seed)
+    positives = {}
+    for (_, cid), oid in truth.items():
+        if oid: positives.setdefault(oid, set()).add(cid)
+    return our, comps, positives
+
+
+# ══ بديل Gemini: أحكام مسجّلة بدل الشبكة ═══════
+def _item_key(it):
+    """مفتاح لكل عنصر (لا لكل دفعة) — حجم الدفعة يتغير مع BatchPlanner"""
+    return hashlib.sha1(json.dumps([it["our"], [c["name"] for c in it["candidates"]]],
+                                   ensure_ascii=False).encode()).hexdigest()[:16]
+
+
+class GeminiStub:
+    """
+    يحل محل engines.engine._ai_batch أثناء التشغيل.
+    mode: replay (من التسجيل؛ غير المسجّل → أفضل مرشح) | record (Gemini حقيقي + حفظ)
+          | oracle (الإجابة الصحيحة من العناوين — الحد الأعلى لما يمكن أن يسترده AI)
+    """
+    def __init__(self, mode, recording=None, positives=None, real=None):
+        self.mode, self.path, self.positives, self.real = mode, recording, positives or {}, real
+        self.verdicts, self.items, self.batches, self.misses = {}, 0, 0, 0
+        if mode == "replay":
+            with open(recording, encoding="utf-8") as f:
+                self.verdicts = json.load(f)
+
+    def __call__(self, batch, planner=None):
+        self.batches += 1; self.items += len(batch)
+        if self.mode == "record":
+            out = self.real(batch, planner)
+            if out is not None:
+                self.verdicts.update({_item_key(it): v for it, v in zip(batch, out)})
+            return out
+        if self.mode == "oracle":
+            return [next((j for j, c in enumerate(it["candidates"])
+                          if c.get("product_id") in self.positives.get(it["our_id"], ())), -1)
+                    for it in batch]
+        out = []
+        for it in batch:
+            v = self.verdicts.get(_item_key(it))
+            if v is None: self.misses += 1
+            out.append(None if v is None else int(v))   # None → أفضل مرشح بدون تسجيل حكم
+        return out
+
+    def save(self):
+        if self.mode == "record" and self.path:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.verdicts, f, ensure_ascii=False, indent=0)
+
+
+# ══ المقاييس ═════════════════════════════════
+def _prf(rows, positives, min_score=None):
+    pred = [r for r in rows
+            if r["معرف_المنافس"] and (min_score is None or r["نسبة_التطابق"] >= min_score)]
+    tp = sum(1 for r in pred if r["معرف_المنافس"] in positives.get(r["معرف_المنتج"], ()))
+    n_pos = sum(1 for r in rows if positives.get(r["معرف_المنتج"]))
+    return {"predicted": len(pred), "correct": tp,
+            "precision": round(tp / len(pred), 4) if pred else None,
+            "recall": round(tp / n_pos, 4) if n_pos else None}
+
+
+def evaluate(df, positives):
+    from engines.engine import MATCH_THRESHOLD, AUTO_THRESHOLD
+    # صفوف بلا مطابق (مفقود / رفض Gemini) معرف_المنافس فيها فارغ
+    rows = df[["معرف_المنتج", "معرف_المنافس", "نسبة_التطابق", "مصدر_المطابقة"]].to_dict("records")
+    score = [r["نسبة_التطابق"] for r in rows if r["معرف_المنافس"]]
+    out = {"products": len(rows), "with_true_match": sum(1 for r in rows if positives.get(r["معرف_المنتج"])),
+           f"at_match_{MATCH_THRESHOLD}": _prf(rows, positives, MATCH_THRESHOLD),
+           f"at_auto_{AUTO_THRESHOLD}": _prf(rows, positives, AUTO_THRESHOLD),
+           "final": _prf(rows, positives),
+           "ambiguous": sum(1 for s in score if MATCH_THRESHOLD <= s < AUTO_THRESHOLD)}
+    # الأخطاء الأولى للفحص اليدوي
+    out["errors"] = [{"our": r["معرف_المنتج"], "got": r["معرف_المنافس"],
+                      "score": r["نسبة_التطابق"], "src": r["مصدر_المطابقة"]}
+                     for r in rows if r["معرف_المنافس"]
+                     and r["معرف_المنافس"] not in positives.get(r["معرف_المنتج"], ())][:20]
+    return out
+
+
+def run(our, comps, positives, ai="off", recording=None):
+    from engines import engine
+    _isolate()
+    real = engine._ai_batch
+    stub = None if ai == "off" else GeminiStub(ai, recording, positives, real)
+    if stub: engine._ai_batch = stub
+    try:
+        df = engine.run_analysis(our, comps, use_ai=ai != "off")
+    finally:
+        engine._ai_batch = real
+    out = evaluate(df, positives)
+    out["routed_to_ai"] = stub.items if stub else 0
+    if stub:
+        out["ai_batches"] = stub.batches
+        out["replay_misses"] = stub.misses
+        stub.save()
+    return out
+
+
+def check(new, base, tol=0.005):
+    """تراجع precision/recall عن خط الأساس بأكثر من tol → قائمة المخالفات"""
+    bad = []
+    for k, v in base.items():
+        if not (isinstance(v, dict) and "precision" in v): continue
+        for m in ("precision", "recall"):
+            a, b = (new.get(k) or {}).get(m), v.get(m)
+            if b is not None and (a is None or a < b - tol):
+                bad.append(f"{k}.{m}: {a} < {b}")
+    return bad
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--gold", default=GOLD_PATH)
+    ap.add_argument("--synthetic", type=int, default=0, help="حجم كتالوج اصطناعي بدل gold.csv")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--ai", choices=("off", "replay", "record", "oracle"), default="off")
+    ap.add_argument("--recording", default="", help="ملف أحكام Gemini (replay/record)")
+    ap.add_argument("--out", default="")
+    ap.add_argument("--check", default="", help="تقرير سابق: فشل عند أي تراجع")
+    ap.add_argument("--tol", type=float, default=0.005)
+    a = ap.parse_args(argv)
+    if a.ai in ("replay", "record") and not a.recording:
+        ap.error("--recording مطلوب مع replay/record")
+
+    our, comps, positives = (synthetic_gold(a.synthetic, a.seed) if a.synthetic
+                             else load_gold(a.gold))
+    res = run(our, comps, positives, a.ai, a.recording)
+    report = {"meta": {**_meta(), "source": f"synthetic:{a.synthetic}:{a.seed}" if a.synthetic
+                       else os.path.basename(a.gold), "ai": a.ai}, **res}
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f: f.write(text)
+    print(text)
+    if a.check:
+        with open(a.check, encoding="utf-8") as f:
+            bad = check(res, json.load(f), a.tol)
+        for b in bad: print(f"[quality] تراجع: {b}", file=sys.stderr)
+        return 1 if bad else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+benchmarks/rerun.py — كلفة إعادة تشغيل صفحة التحليل (تغيير قائمة منسدلة)
+
+    python -m benchmarks.rerun [--rows 20000] [--competitors 5] [--out rerun.json]
+
+يكتب ملف مهووس + N منافس كـ CSV في مجلد مؤقت ثم يقيس:
+  cold_parse   ← read_file + best_col لكل الملفات (ما كان يحدث في كل rerun)
+  cached_parse ← parse_upload بعد أول قراءة (st.cache_data بمفتاح البصمة)
+  cold_index / cached_index ← our_catalog + build_indices أول مرة ثم من الـ cache
+st.cache_data يعمل بدون خادم (bare mode) فالقياس هو نفس مسار الصفحة.
+"""
+import argparse, json, logging, os, sys, tempfile, time
+
+from benchmarks.matching import _meta
+
+
+class _Upload:
+    """بديل UploadedFile: name + getvalue()"""
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f: self._b = f.read()
+
+    def getvalue(self):
+        return self._b
+
+
+def _timed(fn, repeat):
+    best, out = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter(); out = fn(); dt = time.perf_counter() - t0
+        best = dt if best is None or dt < best else best
+    return round(best, 4), out
+
+
+def run(rows=20000, competitors=5, repeat=3):
+    logging.disable(logging.CRITICAL)
+    from benchmarks.catalog import make_catalog
+    from engines import engine
+    from utils.uploads import parse_upload, clear_upload_cache, NAME_COLS, PRICE_COLS, ID_COLS
+
+    our, comps, _ = make_catalog(rows, competitors=competitors)
+    d = tempfile.mkdtemp(prefix="mahwous_rerun_")
+    paths = [os.path.join(d, "mahwous.csv")]
+    our.to_csv(paths[0], index=False)
+    for name, cdf in comps.items():
+        paths.append(os.path.join(d, f"{name}.csv")); cdf.to_csv(paths[-1], index=False)
+    ups = [_Upload(p) for p in paths]
+
+    def cold():
+        out = []
+        for p in paths:
+            with open(p, "rb") as f:
+                df, _ = engine.read_file(f)
+            out.append((df, [engine.best_col(df, c) for c in (NAME_COLS, PRICE_COLS, ID_COLS)]))
+        return out
+
+    clear_upload_cache()
+    t_cold, _ = _timed(cold, 1)
+    t_first, _ = _timed(lambda: [parse_upload(u) for u in ups], 1)
+    t_cached, parsed = _timed(lambda: [parse_upload(u) for u in ups], repeat)
+
+    our_df = parsed[0][0]
+    comp_dfs = {os.path.splitext(u.name)[0]: p[0] for u, p in zip(ups[1:], parsed[1:])}
+    index = lambda: (engine.our_catalog(our_df), engine.build_indices(comp_dfs))
+    t_icold, _ = _timed(index, 1)
+    t_icached, _ = _timed(index, repeat)
+    report = {"rows": rows, "competitors": competitors,
+              "bytes": sum(len(u.getvalue()) for u in ups),
+              "cold_parse_s": t_cold, "first_cached_parse_s": t_first, "cached_parse_s": t_cached,
+              "cold_index_s": t_icold, "cached_index_s": t_icached,
+              "index_cache": engine.cache_info()}
+    clear_upload_cache()
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--competitors", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default="")
+    a = ap.parse_args(argv)
+    report = {"meta": _meta(), **run(a.rows, a.competitors, a.repeat)}
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f: f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
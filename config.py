@@ -1,20 +1,55 @@
 """
 config.py — الإعدادات المركزية لنظام مهووس
+
+القيم السرية: st.secrets (فقط إذا كان Streamlit محمّلاً أصلاً — داخل التطبيق)
+ثم متغيرات البيئة ثم ملف TOML (MAHWOUS_CONFIG أو .streamlit/secrets.toml).
+استيراد المحرك من CLI أو عامل خلفي لا يسحب Streamlit.
 """
-import streamlit as st
-import json, os
+import json, os, sys
 
 APP_VERSION     = "v21.0"
 GEMINI_MODEL    = "gemini-2.0-flash"
 ROWS_PER_PAGE   = 25
 DB_PATH         = "mahwous.db"
 
+# ── مصادر الإعدادات ─────────────────────────
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_TOML = None
+
+def _toml():
+    """أول ملف TOML موجود — يُقرأ مرة واحدة"""
+    global _TOML
+    if _TOML is None:
+        _TOML = {}
+        try:
+            import tomllib
+        except ImportError:
+            try: import tomli as tomllib
+            except ImportError: return _TOML
+        for path in (os.environ.get("MAHWOUS_CONFIG", ""),
+                     os.path.join(".streamlit", "secrets.toml"),
+                     os.path.join(_HERE, ".streamlit", "secrets.toml"),
+                     os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml")):
+            if path and os.path.isfile(path):
+                try:
+                    with open(path, "rb") as f:
+                        _TOML = tomllib.load(f)
+                    break
+                except (OSError, ValueError):
+                    pass
+    return _TOML
+
+def _st_secret(key):
+    """st.secrets فقط إذا كان Streamlit مستورداً بالفعل — لا نستورده هنا"""
+    st = sys.modules.get("streamlit")
+    return st.secrets.get(key) if st is not None else None
+
 # ── قراءة Secrets آمنة ──────────────────────
 def _s(key, default=""):
     for fn in [
-        lambda: st.secrets[key],
-        lambda: st.secrets.get(key),
+        lambda: _st_secret(key),
         lambda: os.environ.get(key, ""),
+        lambda: _toml().get(key),
     ]:
         try:
             v = fn()
@@ -46,16 +81,40 @@ def _parse_keys():
 
 GEMINI_API_KEYS = _parse_keys()
 
+OPENROUTER_API_KEY = _s("OPENROUTER_API_KEY", "")
+COHERE_API_KEY     = _s("COHERE_API_KEY", "")
+
+# حد ابتدائي لكل مفتاح (طلب/دقيقة) — يُعدَّل تلقائياً من ردود 429؛ مفاتيح الخطة المدفوعة: ارفعه
+try:
+    GEMINI_RPM = max(1, int(float(_s("GEMINI_RPM", 15))))
+except (TypeError, ValueError):
+    GEMINI_RPM = 15
+
 WEBHOOK_UPDATE_PRICES = _s("WEBHOOK_UPDATE_PRICES",
     "https://hook.eu2.make.com/99oljy0d6r3chwg6bdfsptcf6bk8htsd")
 WEBHOOK_NEW_PRODUCTS  = _s("WEBHOOK_NEW_PRODUCTS",
     "https://hook.eu2.make.com/xvubj23dmpxu8qzilstd25cnumrwtdxm")
+MAKE_CHUNK_SIZE  = 200      # أقصى عدد منتجات في طلب webhook واحد
+MAKE_CHUNK_BYTES = 200_000  # وأقصى حجم JSON للطلب
+MAKE_PARALLEL    = 3        # طلبات متزامنة لـ Make
+MAKE_RETRIES     = 4
 
 # ── إعدادات المطابقة ────────────────────────
 MATCH_THRESHOLD = 62   # الحد الأدنى للمطابقة
 AUTO_THRESHOLD  = 97   # فوق هذا → تلقائي بدون AI
 PRICE_TOLERANCE = 10   # ريال → ✅ موافق عليها
-AI_BATCH_SIZE   = 12   # عدد المنتجات لكل استدعاء Gemini
+AI_BATCH_SIZE   = 12   # حجم الدفعة الابتدائي — يتكيّف حسب الزمن وأخطاء التحليل
+AI_PROMPT_BUDGET = 2500  # حد tokens البرومبت لكل دفعة Gemini
+AI_TARGET_LATENCY = 8.0  # ثوانٍ — أبطأ من هذا → دفعات أصغر
+AI_WORKERS      = 3    # دفعات Gemini المتزامنة أثناء التحليل
+
+# ── ذاكرة مؤقتة للملفات المرفوعة والفهارس ────
+UPLOAD_CACHE_ENTRIES = 12    # ملفات مقروءة محفوظة (st.cache_data) ببصمة المحتوى
+UPLOAD_CACHE_TTL     = 3600  # ثوانٍ
+INDEX_CACHE_MB       = 256   # حد تقريبي لفهارس المنافسين وكتالوج مهووس في الذاكرة
+
+# ── نصوص Arrow ──────────────────────────────
+ARROW_STRINGS   = True   # أعمدة النصوص string[pyarrow] + استخراج خصائص عبر pyarrow.compute
 
 # ── كلمات الاستبعاد ─────────────────────────
 REJECT_KEYWORDS = ["sample","عينة","عينه","decant","تقسيم","تقسيمة","split","miniature"]
@@ -130,5 +189,13 @@ BRANDS_AR = [
     "درعة","نسمات نجد","خلاصات","قصة",
 ]
 
-# دمج موحد لاستخدامه في المحرك
-ALL_BRANDS = sorted(set(BRANDS_EN + BRANDS_AR))
+# دمج موحد لاستخدامه في المحرك — يُبنى عند أول وصول (config.ALL_BRANDS)
+_ALL_BRANDS = None
+
+def __getattr__(name):
+    global _ALL_BRANDS
+    if name == "ALL_BRANDS":
+        if _ALL_BRANDS is None:
+            _ALL_BRANDS = sorted(set(BRANDS_EN + BRANDS_AR))
+        return _ALL_BRANDS
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,15 +4,22 @@ engines/ai_engine.py v19.0
 - fragranticarabia.com → صور + مكونات العطور
 - Mahwous وصف خاص للمنتجات المفقودة
 - تحقق منتج | بحث سوق | تحليل مجمع | دردشة
+- إثراء جماعي للمفقودات (عدة عطور في طلب واحد) مع حفظ واستئناف
 """
-import requests, json, re, time
-from config import GEMINI_API_KEYS, OPENROUTER_API_KEY, COHERE_API_KEY
+import inspect, json, re, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial, wraps
+from engines.llm_client import get_client
+try:
+    from config import AI_WORKERS
+except Exception:
+    AI_WORKERS = 3
+try:
+    from utils import db_manager as _dbm
+except Exception:
+    _dbm = None
 
 _GM  = "gemini-2.0-flash"
-_GU  = f"https://generativelanguage.googleapis.com/v1beta/models/{_GM}:generateContent"
-_GUS = f"https://generativelanguage.googleapis.com/v1beta/models/{_GM}:streamGenerateContent"
-_OR  = "https://openrouter.ai/api/v1/chat/completions"
-_CO  = "https://api.cohere.ai/v1/generate"
 _FR  = "https://www.fragranticarabia.com"
 
 # ══ System Prompts مخصصة لكل قسم ══════════════
@@ -37,6 +44,78 @@ PAGE_PROMPTS = {
 أجب JSON: {"market_price":0,"price_range":{"min":0,"max":0},"competitors":[{"name":"","price":0}],"recommendation":""}""",
 }
 
+# ══ Cache الردود (جدول ai_cache في db_manager) ══
+# المفتاح: (الدالة, المدخلات المطبّعة, النموذج, إصدار البرومبت) — غيّر الإصدار عند تعديل البرومبت
+_CACHE_TTL = {                       # ثوانٍ
+    "verify":      30 * 86400,
+    "market":      6 * 3600,         # أسعار السوق تتغير بسرعة
+    "fragrantica": 180 * 86400,      # المكونات لا تتغير تقريباً
+    "description": 30 * 86400,
+    "mahwous":     86400,
+}
+_PROMPT_VERSION = {"verify": 1, "market": 1, "fragrantica": 1, "description": 1, "mahwous": 1}
+
+_inflight      = {}                  # single-flight: مفتاح → Event
+_inflight_lock = threading.Lock()
+
+def _norm_arg(v):
+    if isinstance(v, str):
+        from engines.engine import normalize
+        return normalize(v)
+    if isinstance(v, float):
+        return round(v)
+    if isinstance(v, dict):
+        return json.dumps(v, ensure_ascii=False, sort_keys=True, default=str)
+    return v
+
+def _cached(kind, ok=lambda r: bool(r)):
+    """
+    cache بالمحتوى + TTL لكل نوع + single-flight: الاستدعاءات المتزامنة المتطابقة
+    تنتظر الاستدعاء الأول بدل تكرار الطلب. ok: متى يُخزَّن الرد.
+    """
+    def deco(fn):
+        sig = inspect.signature(fn)
+        @wraps(fn)
+        def wrapper(*args, **kw):
+            # نفس الاستدعاء بأي صيغة (f(a, b) / f(a, b=b) / مع القيم الافتراضية) → نفس المفتاح
+            try:
+                bound = sig.bind(*args, **kw)
+            except TypeError:
+                return fn(*args, **kw)
+            bound.apply_defaults()
+            raw = json.dumps([kind, {k: _norm_arg(v) for k, v in bound.arguments.items()},
+                              get_client().model, _PROMPT_VERSION[kind]],
+                             ensure_ascii=False, default=str)
+            h = hashlib.sha256(raw.encode()).hexdigest()
+            if _dbm:
+                hit = _dbm.cache_get(h, _CACHE_TTL[kind])
+                if hit is not None: return hit
+
+            with _inflight_lock:
+                ev = _inflight.get(h)
+                leader = ev is None
+                if leader:
+                    ev = _inflight[h] = threading.Event()
+            if not leader:
+                ev.wait(120)
+                if _dbm:
+                    hit = _dbm.cache_get(h, _CACHE_TTL[kind])
+                    if hit is not None: return hit
+                return fn(*args, **kw)      # فشل الأول → نحاول بأنفسنا
+            try:
+                out = fn(*args, **kw)
+                if _dbm and ok(out): _dbm.cache_set(h, out, kind)
+                return out
+            finally:
+                with _inflight_lock:
+                    _inflight.pop(h, None)
+                ev.set()
+        return wrapper
+    return deco
+
+_ok = lambda r: bool(r and r.get("success"))
+
+
 # ══ استدعاء Gemini ══════════════════════════
 def _call_gemini(prompt, system="", grounding=False, stream=False):
     full = f"{system}\n\n{prompt}" if system else prompt
@@ -46,60 +125,36 @@ def _call_gemini(prompt, system="", grounding=False, stream=False):
     }
     if grounding:
         payload["tools"] = [{"google_search": {}}]
-
-    for key in GEMINI_API_KEYS:
-        if not key: continue
-        try:
-            r = requests.post(f"{_GU}?key={key}", json=payload, timeout=35)
-            if r.status_code == 200:
-                data = r.json()
-                if data.get("candidates"):
-                    parts = data["candidates"][0]["content"]["parts"]
-                    return "".join(p.get("text","") for p in parts)
-            elif r.status_code == 429:
-                time.sleep(1); continue
-        except: continue
-    return None
+    return get_client().gemini_text(payload, timeout=35)
 
 def _call_openrouter(prompt, system=""):
-    if not OPENROUTER_API_KEY: return None
-    try:
-        msgs = []
-        if system: msgs.append({"role":"system","content":system})
-        msgs.append({"role":"user","content":prompt})
-        r = requests.post(_OR, json={
-            "model":"google/gemini-2.0-flash-001",
-            "messages":msgs,"temperature":0.3,"max_tokens":4096
-        }, headers={"Authorization":f"Bearer {OPENROUTER_API_KEY}"}, timeout=35)
-        if r.status_code == 200:
-            return r.json()["choices"][0]["message"]["content"]
-    except: pass
-    return None
+    msgs = []
+    if system: msgs.append({"role":"system","content":system})
+    msgs.append({"role":"user","content":prompt})
+    return get_client().openrouter(msgs, timeout=35)
 
 def _call_cohere(prompt, system=""):
-    if not COHERE_API_KEY: return None
-    try:
-        full = f"{system}\n\n{prompt}" if system else prompt
-        r = requests.post(_CO, json={
-            "model":"command-r-plus","prompt":full,"max_tokens":4096,"temperature":0.3
-        }, headers={"Authorization":f"Bearer {COHERE_API_KEY}"}, timeout=35)
-        if r.status_code == 200:
-            return r.json().get("generations",[{}])[0].get("text","")
-    except: pass
-    return None
+    full = f"{system}\n\n{prompt}" if system else prompt
+    return get_client().cohere(full, timeout=35)
+
+_PROVIDERS = {
+    "Gemini":        lambda p, s: _call_gemini(p, s),
+    "Gemini+Search": lambda p, s: _call_gemini(p, s, grounding=True),
+    "OpenRouter":    _call_openrouter,
+    "Cohere":        _call_cohere,
+}
+
+def _ask(prompt, system="", chain=("Gemini", "OpenRouter", "Cohere")):
+    """
+    سلسلة مزودين مع التحوّط: إذا تأخر الأول عن p95 زمنه يبدأ التالي بالتوازي،
+    وأول رد صالح يفوز → (نص أو None, المصدر)
+    """
+    return get_client().hedged([(n, partial(_PROVIDERS[n], prompt, system)) for n in chain])
 
 def call_ai(prompt, page="general"):
     sys = PAGE_PROMPTS.get(page, PAGE_PROMPTS["general"])
-    for fn in [lambda: _call_gemini(prompt, sys),
-               lambda: _call_openrouter(prompt, sys),
-               lambda: _call_cohere(prompt, sys)]:
-        r = fn()
-        if r: return {"success":True,"response":r,"source":fn.__name__ if hasattr(fn,"__name__") else "AI"}
-    # fallback source names
-    for r, src in [(_call_gemini(prompt,sys),"Gemini"),
-                   (_call_openrouter(prompt,sys),"OpenRouter"),
-                   (_call_cohere(prompt,sys),"Cohere")]:
-        if r: return {"success":True,"response":r,"source":src}
+    r, src = _ask(prompt, sys)
+    if r: return {"success":True,"response":r,"source":src}
     return {"success":False,"response":"❌ فشل الاتصال بجميع مزودي AI","source":"none"}
 
 # ══ Gemini Chat مع History ══════════════════
@@ -118,31 +173,23 @@ def gemini_chat(message, history=None, system_extra=""):
     payload = {"contents":contents,
                "generationConfig":{"temperature":0.4,"maxOutputTokens":4096,"topP":0.9}}
 
-    for key in GEMINI_API_KEYS:
-        if not key: continue
-        try:
-            r = requests.post(f"{_GU}?key={key}", json=payload, timeout=40)
-            if r.status_code == 200:
-                data = r.json()
-                if data.get("candidates"):
-                    text = data["candidates"][0]["content"]["parts"][0]["text"]
-                    return {"success":True,"response":text,"source":"Gemini Flash"}
-            elif r.status_code == 429:
-                time.sleep(1); continue
-        except: continue
+    text = get_client().gemini_text(payload, timeout=40)
+    if text:
+        return {"success":True,"response":text,"source":"Gemini Flash"}
 
     r = _call_openrouter(message, sys)
     if r: return {"success":True,"response":r,"source":"OpenRouter"}
     return {"success":False,"response":"❌ فشل الاتصال","source":"none"}
 
 # ══ تحقق منتج ═══════════════════════════════
+@_cached("verify", _ok)
 def verify_match(p1, p2, pr1=0, pr2=0):
     prompt = f"""تحقق من تطابق هذين المنتجين:
 منتج 1: {p1} | السعر: {pr1:.0f} ر.س
 منتج 2: {p2} | السعر: {pr2:.0f} ر.س
 هل هما نفس العطر؟ (ماركة + اسم + حجم + نوع EDP/EDT)"""
     sys = PAGE_PROMPTS["verify"]
-    txt = _call_gemini(prompt, sys) or _call_openrouter(prompt, sys)
+    txt, _ = _ask(prompt, sys, ("Gemini", "OpenRouter"))
     if not txt: return {"success":False,"match":False,"confidence":0,"reason":"فشل AI"}
     try:
         clean = re.sub(r'```json|```','',txt).strip()
@@ -153,12 +200,13 @@ def verify_match(p1, p2, pr1=0, pr2=0):
         return {"success":True,"match":"true" in txt.lower(),"confidence":70,"reason":txt[:200]}
 
 # ══ بحث أسعار السوق ═════════════════════════
+@_cached("market", _ok)
 def search_market_price(product_name, our_price=0):
     prompt = (f"ما هو سعر السوق السعودي الحالي لـ: «{product_name}»؟\n"
               f"سعرنا الحالي: {our_price:.0f} ر.س\n"
               "اذكر: سعر السوق، نطاق الأسعار، أهم 3 منافسين وأسعارهم، توصيتك.")
     sys = PAGE_PROMPTS["market_search"]
-    txt = _call_gemini(prompt, sys, grounding=True) or _call_gemini(prompt, sys) or _call_openrouter(prompt, sys)
+    txt, _ = _ask(prompt, sys, ("Gemini+Search", "Gemini", "OpenRouter"))
     if not txt: return {"success":False,"market_price":0}
     try:
         clean = re.sub(r'```json|```','',txt).strip()
@@ -169,6 +217,7 @@ def search_market_price(product_name, our_price=0):
     return {"success":True,"market_price":our_price,"recommendation":txt[:300]}
 
 # ══ بحث صورة ومكونات من Fragrantica Arabia ══
+@_cached("fragrantica", _ok)
 def fetch_fragrantica_info(product_name):
     """
     يبحث عن صورة + مكونات العطر من Fragrantica Arabia
@@ -194,9 +243,7 @@ def fetch_fragrantica_info(product_name):
   "fragrantica_url": "رابط الصفحة"
 }}"""
 
-    txt = _call_gemini(prompt, grounding=True)
-    if not txt:
-        txt = _call_gemini(prompt)
+    txt, _ = _ask(prompt, "", ("Gemini+Search", "Gemini"))
     if not txt:
         return {"success":False}
     try:
@@ -209,7 +256,8 @@ def fetch_fragrantica_info(product_name):
     return {"success":False,"description_ar":txt[:200] if txt else ""}
 
 # ══ وصف مهووس للمنتجات المفقودة ════════════
-def generate_mahwous_description(product_name, price, fragrantica_data=None):
+@_cached("description")                  # الوصف الاحتياطي لا يُخزَّن
+def _describe(product_name, price, fragrantica_data=None):
     """
     يولّد وصفاً بتنسيق مهووس الاحترافي:
     اسم العطر، الماركة، المكونات، الوصف الشعري، السعر المقترح
@@ -246,16 +294,21 @@ def generate_mahwous_description(product_name, price, fragrantica_data=None):
 ---
 أجب بالعربية فقط."""
 
-    txt = _call_gemini(prompt) or _call_openrouter(prompt) or _call_cohere(prompt)
-    return txt or f"🌟 {product_name}\n💰 السعر: {price:.0f} ر.س"
+    txt, _ = _ask(prompt)
+    return txt
+
+def generate_mahwous_description(product_name, price, fragrantica_data=None):
+    return (_describe(product_name, price, fragrantica_data)
+            or f"🌟 {product_name}\n💰 السعر: {price:.0f} ر.س")
 
 # ══ بحث mahwous.com ══════════════════════════
+@_cached("mahwous", _ok)
 def search_mahwous(product_name):
     prompt = f"""هل العطر «{product_name}» متوفر في متجر مهووس؟
 أجب JSON: {{"likely_available":true/false,"confidence":0-100,
 "similar_products":[],"add_recommendation":"عالية/متوسطة/منخفضة",
 "reason":"سبب مختصر","suggested_price":0}}"""
-    txt = _call_gemini(prompt, grounding=True) or _call_gemini(prompt)
+    txt, _ = _ask(prompt, "", ("Gemini+Search", "Gemini"))
     if not txt: return {"success":False}
     try:
         clean = re.sub(r'```json|```','',txt).strip()
@@ -265,6 +318,96 @@ def search_mahwous(product_name):
     except: pass
     return {"success":True,"likely_available":False,"confidence":50,"reason":txt[:150]}
 
+# ══ إثراء جماعي للمنتجات المفقودة ══════════════
+_ENRICH_TEXT = ("image_url", "description_ar", "description", "fragrantica_url")
+
+def _enrich_batch(items):
+    """
+    items: [(norm, الاسم, السعر)] → صفوف enrichment.
+    طلب grounded واحد يجمع Fragrantica + وصف مهووس لعدة عطور (بدل طلبين لكل عطر).
+    """
+    lines = "\n".join(f"{i+1}. {n} | السعر: {p:.0f} ر.س" for i, (_, n, p) in enumerate(items))
+    prompt = f"""ابحث في موقع {_FR} عن كل عطر في هذه القائمة:
+{lines}
+
+لكل عطر أحتاج:
+1. رابط صورة المنتج ورابط صفحته
+2. المكونات (Top / Middle / Base notes)
+3. وصفاً قصيراً بالعربية
+4. وصفاً بتنسيق متجر مهووس: 🌟 الاسم | ✨ جملة تسويقية | 📝 فقرة 2-3 جمل |
+   🌸 مكونات العطر (القمة/القلب/القاعدة) | 👤 مناسب لـ | 💰 السعر
+إذا لم تجد العطر اترك حقوله فارغة — لا تخترع مكونات.
+
+أجب JSON فقط:
+{{"results":[{{"i":1,"image_url":"","top_notes":[],"middle_notes":[],"base_notes":[],
+"description_ar":"","description":"","fragrantica_url":""}}]}}"""
+
+    txt, src = _ask(prompt, "", ("Gemini+Search", "Gemini"))
+    if not txt: return []
+    try:
+        clean = re.sub(r'```json|```','',txt).strip()
+        s=clean.find('{'); e=clean.rfind('}')+1
+        res = json.loads(clean[s:e]).get("results", [])
+    except: return []
+    out = {}
+    for r in res:
+        try: i = int(r.get("i", 0)) - 1
+        except (TypeError, ValueError, AttributeError): continue
+        if not (0 <= i < len(items)) or not (r.get("description") or r.get("top_notes")):
+            continue
+        norm, name, _ = items[i]
+        out[norm] = {"norm": norm, "name": name, "source": src,
+                     **{k: str(r.get(k) or "") for k in _ENRICH_TEXT},
+                     **{k: [str(x) for x in (r.get(k) or [])]
+                        for k in ("top_notes", "middle_notes", "base_notes")}}
+    return list(out.values())
+
+def enrich_missing(missing_df, batch_size=6, workers=AI_WORKERS, progress_cb=None, rounds=2):
+    """
+    إثراء مخرجات find_missing: إزالة التكرار بالاسم المطبّع، عدة عطور في كل طلب،
+    الدفعات بالتوازي، وكل دفعة تُحفظ فور وصولها في جدول enrichment —
+    لذلك إعادة التشغيل بعد انقطاع تكمل من حيث توقفت (المُثرى سابقاً لا يُطلب).
+    ما فشل في جولة يُعاد في الجولة التالية بدفعات أصغر.
+    → ({norm: صف}, إحصائيات)
+    """
+    from engines.engine import normalize
+    todo = {}
+    if missing_df is not None and len(missing_df):
+        prices = missing_df.get("سعر المنافس", [0] * len(missing_df))
+        for name, price in zip(missing_df["منتج المنافس"], prices):
+            n = normalize(name)
+            if n and n not in todo:
+                try: pr = float(price or 0)
+                except (TypeError, ValueError): pr = 0.0
+                todo[n] = (str(name), pr)
+
+    done    = _dbm.load_enrichment(todo) if _dbm else {}
+    pending = [(n, *todo[n]) for n in todo if n not in done]
+    stats   = {"unique": len(todo), "cached": len(done), "enriched": 0, "calls": 0, "failed": 0}
+    total   = max(len(pending), 1)
+
+    for _ in range(rounds):
+        if not pending: break
+        batches = [pending[i:i+batch_size] for i in range(0, len(pending), batch_size)]
+        failed  = []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            futs = {ex.submit(_enrich_batch, b): b for b in batches}
+            for f in as_completed(futs):
+                b = futs[f]
+                try: rows = f.result()
+                except Exception: rows = []
+                stats["calls"] += 1
+                if _dbm: _dbm.save_enrichment(rows)
+                for r in rows: done[r["norm"]] = r
+                stats["enriched"] += len(rows)
+                failed += [it for it in b if it[0] not in done]
+                if progress_cb: progress_cb(min(stats["enriched"] / total, 1.0))
+        pending    = failed
+        batch_size = max(1, batch_size // 2)
+
+    stats["failed"] = len(pending)
+    return done, stats
+
 # ══ تحقق مكرر ═══════════════════════════════
 def check_duplicate(product_name, our_products):
     if not our_products:
@@ -0,0 +1,230 @@
+"""
+engines/cli.py — تشغيل التحليل بدون Streamlit (cron / تشغيلات ليلية)
+
+    python -m engines.cli --our mahwous.xlsx --comp "نايس=nice.csv" --comp golden.xlsx \\
+        --our-cols name=اسم المنتج,price=سعر,id=no --out runs/ --history --json
+
+الأعمدة: name/price/id — إن لم تُحدَّد تُخمَّن كما في صفحة التحليل (best_col).
+--comp-cols مرة واحدة → لكل المنافسين، أو مرة لكل --comp بنفس الترتيب.
+
+المخرجات في --out/<التوقيت>/: results.csv, missing.csv, results.xlsx, missing.xlsx,
+summary.json (الأعداد + زمن كل مرحلة + العدّادات). stdout مع --json = summary فقط؛
+سجلات المحرك والتقدّم على stderr.
+
+رموز الخروج: 0 نجاح | 2 وسائط خاطئة | 3 ملف/عمود غير صالح | 4 فشل التحليل | 5 فشل كتابة المخرجات
+"""
+import argparse, json, logging, os, sys, time, traceback
+from datetime import datetime
+
+EXIT_OK, EXIT_USAGE, EXIT_INPUT, EXIT_RUN, EXIT_OUTPUT = 0, 2, 3, 4, 5
+
+_NAME  = ["المنتج","اسم المنتج","Product","Name","name","اسم"]
+_PRICE = ["السعر","سعر","Price","price"]
+_OUR_ID  = ["no","NO","No","معرف","ID","id","SKU","sku","الكود","رقم المنتج"]
+_COMP_ID = ["ID","id","معرف","SKU","sku","الكود","code","no","NO"]
+
+
+class InputError(Exception):
+    pass
+
+
+def _log(msg):
+    print(msg, file=sys.stderr, flush=True)
+
+
+def _cols(spec):
+    """'name=اسم المنتج,price=سعر' → {'name': 'اسم المنتج', 'price': 'سعر'}"""
+    out = {}
+    for part in (spec or "").split(","):
+        if not part.strip(): continue
+        k, sep, v = part.partition("=")
+        if not sep or k.strip() not in ("name", "price", "id"):
+            raise InputError(f"تعيين أعمدة غير صالح: {part!r} (name=…,price=…,id=…)")
+        out[k.strip()] = v.strip()
+    return out
+
+
+def _read(path, stats):
+    from engines.engine import read_file
+    if not os.path.isfile(path):
+        raise InputError(f"الملف غير موجود: {path}")
+    with stats.stage("parse"), open(path, "rb") as f:
+        df, err = read_file(f)
+    if err or df is None:
+        raise InputError(f"{path}: {err or 'تعذّرت القراءة'}")
+    return df
+
+
+def _map(df, path, cols, guesses):
+    """→ {name, price, id} بعد التحقق من وجود الأعمدة"""
+    from engines.engine import best_col
+    out = {}
+    for k in ("name", "price", "id"):
+        col = cols.get(k)
+        if col is None:
+            col = best_col(df, guesses[k]) if k != "id" else next(
+                (c for c in guesses[k] if c in df.columns), None)
+        elif col not in df.columns:
+            raise InputError(f"{path}: العمود {col!r} غير موجود — المتاح: {', '.join(map(str, df.columns))}")
+        out[k] = col
+    return out
+
+
+def load_inputs(our_path, comps, our_cols="", comp_cols=(), stats=None):
+    """
+    comps: ['اسم=مسار' أو 'مسار'] → (our_df, {اسم: df}) بأسماء أعمدة المحرك
+    كما تفعل صفحة التحليل: المنتج/السعر/معرف_المنتج لدينا، المنتج/السعر(/ID) للمنافس.
+    """
+    from engines.stats import RunStats
+    stats = stats or RunStats()
+    our = _read(our_path, stats)
+    m = _map(our, our_path, _cols(our_cols), {"name": _NAME, "price": _PRICE, "id": _OUR_ID})
+    ren = {m["name"]: "المنتج", m["price"]: "السعر"}
+    if m["id"]: ren[m["id"]] = "معرف_المنتج"
+    our = our.rename(columns={k: v for k, v in ren.items() if k != v})
+
+    comp_cols = list(comp_cols or [])
+    if len(comp_cols) not in (0, 1, len(comps)):
+        raise InputError("--comp-cols: مرة واحدة لكل المنافسين أو مرة لكل --comp")
+    comp_dfs = {}
+    for i, spec in enumerate(comps):
+        # ملف موجود يُقرأ كما هو حتى لو احتوى اسمه "=" (a=b.csv)؛ وإلا 'اسم=مسار'
+        if os.path.isfile(spec):
+            name, path = "", spec
+        else:
+            name, sep, path = spec.partition("=")
+            if not sep:
+                name, path = "", spec
+        name = name.strip() or os.path.splitext(os.path.basename(path))[0]
+        cdf = _read(path, stats)
+        spec_cols = comp_cols[i] if len(comp_cols) > 1 else (comp_cols[0] if comp_cols else "")
+        cm = _map(cdf, path, _cols(spec_cols), {"name": _NAME, "price": _PRICE, "id": _COMP_ID})
+        ren = {cm["name"]: "المنتج", cm["price"]: "السعر"}
+        if cm["id"] and cm["id"] != "ID":
+            cdf = cdf.drop(columns=["ID"], errors="ignore")
+            ren[cm["id"]] = "ID"
+        comp_dfs[name] = cdf.rename(columns={k: v for k, v in ren.items() if k != v})
+    return our, comp_dfs
+
+
+def record_history(results):
+    """كل صف مطابق → price_history (نفس اليوم يُحدَّث، يوم جديد يُضاف) → عدد الأسعار المتغيرة"""
+    from utils.db_manager import upsert_price_history
+    changed = 0
+    for r in results.to_dict("records"):
+        if r.get("منتج_المنافس") in (None, "", "—") or not r.get("المنافس"): continue
+        changed += bool(upsert_price_history(
+            r["المنتج"], r["المنافس"], r["سعر_المنافس"], our_price=r["السعر"],
+            diff=r["الفرق"], match_score=r["نسبة_التطابق"], decision=r["القرار"],
+            product_id=r.get("معرف_المنافس") or ""))
+    return changed
+
+
+def write_outputs(out_dir, results, missing, excel=True):
+    os.makedirs(out_dir, exist_ok=True)
+    from engines.engine import export_excel, NAME_ID_COLS
+    files = {}
+    flat = results.drop(columns=["جميع_المرشحين", *NAME_ID_COLS], errors="ignore")
+    for name, df in (("results", flat), ("missing", missing)):
+        p = os.path.join(out_dir, f"{name}.csv")
+        df.to_csv(p, index=False, encoding="utf-8-sig")
+        files[f"{name}_csv"] = p
+        if excel:
+            p = os.path.join(out_dir, f"{name}.xlsx")
+            with open(p, "wb") as f:
+                f.write(export_excel(df, sheet="النتائج" if name == "results" else "المفقودة"))
+            files[f"{name}_xlsx"] = p
+    return files
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m engines.cli",
+                                 description="تحليل مهووس بدون واجهة: مطابقة + مفقودات + تصدير")
+    ap.add_argument("--our", required=True, help="ملف مهووس (CSV/Excel)")
+    ap.add_argument("--comp", action="append", required=True, metavar="[NAME=]PATH",
+                    help="ملف منافس — يتكرر (حتى أي عدد)")
+    ap.add_argument("--our-cols", default="", help="name=…,price=…,id=…")
+    ap.add_argument("--comp-cols", action="append", default=[], help="name=…,price=…,id=…")
+    ap.add_argument("--out", default="runs", help="مجلد المخرجات (يُنشأ مجلد فرعي بالتوقيت)")
+    ap.add_argument("--no-ai", action="store_true", help="بدون Gemini (الغامض يُقبل كأفضل مرشح)")
+    ap.add_argument("--ai-workers", type=int, default=None, help="دفعات Gemini المتزامنة")
+    ap.add_argument("--delta", action="store_true", help="إعادة مطابقة ما تغيّر فقط منذ آخر تشغيل")
+    ap.add_argument("--no-excel", action="store_true", help="CSV فقط (تصدير Excel بطيء للملفات الكبيرة)")
+    ap.add_argument("--history", action="store_true", help="تسجيل أسعار المنافسين في price_history")
+    ap.add_argument("--json", action="store_true", help="summary كـ JSON على stdout")
+    a = ap.parse_args(argv)
+    # سجلات المحرك ([stats]/[ai]/[delta]) → stderr حتى يبقى stdout لـ JSON
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(message)s")
+
+    from engines import engine
+    from engines.stats import RunStats
+    stats = RunStats()
+    t0 = time.perf_counter()
+    try:
+        our, comps = load_inputs(a.our, a.comp, a.our_cols, a.comp_cols, stats)
+    except InputError as e:
+        _log(f"❌ {e}")
+        return EXIT_INPUT
+    _log(f"[cli] {len(our):,} منتج | " + " | ".join(f"{k}: {len(v):,}" for k, v in comps.items()))
+
+    if a.ai_workers:
+        engine.AI_WORKERS = max(1, a.ai_workers)
+    last = [-1]
+    def progress(p):
+        step = int(p * 10)
+        if step > last[0]:
+            last[0] = step; _log(f"[cli] {step * 10}%")
+
+    try:
+        with stats.stage("index"):
+            catalog = engine.our_catalog(our)
+            indices = engine.build_indices(comps)
+        results = engine.run_analysis(our, comps, progress_cb=progress, use_ai=not a.no_ai,
+                                      delta=a.delta, indices=indices, catalog=catalog, stats=stats)
+        with stats.stage("find_missing"):
+            missing = engine.find_missing(our, comps, indices=indices, catalog=catalog)
+    except Exception:
+        _log(traceback.format_exc())
+        return EXIT_RUN
+
+    out_dir = os.path.join(a.out, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    try:
+        with stats.stage("export"):
+            files = write_outputs(out_dir, results, missing, excel=not a.no_excel)
+    except OSError as e:
+        _log(f"❌ تعذّرت كتابة المخرجات: {e}")
+        return EXIT_OUTPUT
+
+    changed = None
+    if a.history:
+        with stats.stage("history"):
+            changed = record_history(results)
+
+    matched = int((results["منتج_المنافس"] != "—").sum()) if len(results) else 0
+    report  = stats.report()
+    summary = {
+        "ok": True, "out_dir": out_dir, "files": files,
+        "products": len(our), "competitors": {k: len(v) for k, v in comps.items()},
+        "matched": matched, "missing": len(missing),
+        "decisions": results["القرار"].value_counts().to_dict() if len(results) else {},
+        "price_history_changed": changed, "wall_seconds": round(time.perf_counter() - t0, 3),
+        **report,
+    }
+    for k in ("delta", "ai", "profile"):
+        if results.attrs.get(k): summary[k] = results.attrs[k]
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1, default=str)
+
+    from utils.db_manager import log_analysis
+    log_analysis(os.path.basename(a.our), ", ".join(comps), len(our), matched, len(missing),
+                 summary="cli", stats=report)
+
+    if a.json:
+        print(json.dumps(summary, ensure_ascii=False, default=str))
+    else:
+        _log(f"✅ {matched:,} مطابق | {len(missing):,} مفقود | {summary['wall_seconds']} ث → {out_dir}")
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,57 @@
 """
 engines/engine.py — محرك المطابقة v21
-منطق واضح: Fuzzy → Gemini للغامض فقط (62-96%) → تلقائي للواضح (97%+)
+منطق واضح: Fuzzy → مقيّم محلي ثم Gemini للغامض فقط (62-96%) → تلقائي للواضح (97%+)
 """
-import re, io, json, hashlib, sqlite3, time
+import re, io, copy, json, hashlib, logging, sqlite3, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import wraps
+import numpy as np
 import pandas as pd
 from rapidfuzz import fuzz, process as rf_process
 
+log = logging.getLogger(__name__)   # سجلات التشغيل — لا print على stdout
+
 try:
-    from config import (REJECT_KEYWORDS, ALL_BRANDS, BRANDS_EN, BRANDS_AR,
-                        MATCH_THRESHOLD, AUTO_THRESHOLD, PRICE_TOLERANCE,
+    from config import (REJECT_KEYWORDS, MATCH_THRESHOLD, AUTO_THRESHOLD, PRICE_TOLERANCE,
                         TESTER_KEYWORDS, SET_KEYWORDS, GEMINI_API_KEYS,
-                        DB_PATH, AI_BATCH_SIZE)
+                        DB_PATH, AI_BATCH_SIZE, AI_WORKERS,
+                        AI_PROMPT_BUDGET, AI_TARGET_LATENCY, INDEX_CACHE_MB,
+                        ARROW_STRINGS)
 except Exception:
     REJECT_KEYWORDS = ["sample","عينة","decant","تقسيم","split"]
-    ALL_BRANDS = []; BRANDS_EN = []; BRANDS_AR = []
     MATCH_THRESHOLD=62; AUTO_THRESHOLD=97; PRICE_TOLERANCE=10
     TESTER_KEYWORDS=["tester","تستر"]; SET_KEYWORDS=["set","طقم","مجموعة"]
-    GEMINI_API_KEYS=[]; DB_PATH="mahwous.db"; AI_BATCH_SIZE=12
+    GEMINI_API_KEYS=[]; DB_PATH="mahwous.db"; AI_BATCH_SIZE=12; AI_WORKERS=3
+    AI_PROMPT_BUDGET=2500; AI_TARGET_LATENCY=8.0; INDEX_CACHE_MB=256
+    ARROW_STRINGS=True
+
+from engines.stats import RunStats
+
+# عميل Gemini (requests) والمقيّم والـ profiling وقاعدة التطبيق تُستورد عند أول استخدام:
+# الصفحات والـ CLI التي تحتاج normalize/read_file فقط لا تدفع كلفتها
+def _db():
+    """utils.db_manager — None إذا تعذّر استيراده (المحرك يعمل بدون ذاكرة المطابقة)"""
+    try:
+        from utils import db_manager
+        return db_manager
+    except Exception:
+        return None
+
 
-import requests as _req
+def profiled(name):
+    """engines.profiling.profiled مؤجَّل: يُستورد ويُغلَّف عند أول استدعاء"""
+    def deco(fn):
+        wrapped = []
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not wrapped:
+                from engines.profiling import profiled as _profiled
+                wrapped.append(_profiled(name)(fn))
+            return wrapped[0](*args, **kwargs)
+        return wrapper
+    return deco
 
 # ══ مرادفات الترادف للعطور ═══════════════════
 _SYN = {
@@ -40,20 +72,31 @@ _SYN = {
     "أ":"ا","إ":"ا","آ":"ا","ة":"ه","ى":"ي","ؤ":"و","ئ":"ي",
 }
 
-_GURL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-
 # ══ Cache SQLite ══════════════════════════════
+_DB_READY = None   # المسار الذي أُنشئت جداوله — التهيئة عند أول استخدام لا عند الاستيراد
+
 def _init_db():
+    global _DB_READY
     try:
         cn = sqlite3.connect(DB_PATH, check_same_thread=False)
         cn.execute("CREATE TABLE IF NOT EXISTS ai_cache(h TEXT PRIMARY KEY, v TEXT)")
+        cn.execute("""CREATE TABLE IF NOT EXISTS comp_snapshot(
+            competitor TEXT, norm TEXT, pid TEXT, price REAL,
+            PRIMARY KEY(competitor, norm, pid))""")
+        cn.execute("CREATE TABLE IF NOT EXISTS row_snapshot(k TEXT PRIMARY KEY, norm TEXT, v TEXT)")
         cn.commit(); cn.close()
+        _DB_READY = DB_PATH
     except Exception:
         pass
 
+def _connect():
+    if _DB_READY != DB_PATH:
+        _init_db()
+    return sqlite3.connect(DB_PATH, check_same_thread=False)
+
 def _cget(k):
     try:
-        cn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        cn = _connect()
         r = cn.execute("SELECT v FROM ai_cache WHERE h=?",(k,)).fetchone()
         cn.close()
         return json.loads(r[0]) if r else None
@@ -62,13 +105,44 @@ def _cget(k):
 
 def _cset(k,v):
     try:
-        cn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        cn = _connect()
         cn.execute("INSERT OR REPLACE INTO ai_cache VALUES(?,?)",(k,json.dumps(v,ensure_ascii=False)))
         cn.commit(); cn.close()
     except Exception:
         pass
 
-_init_db()
+# ══ لقطة آخر تحليل (لوضع الدلتا) ══════════════
+def _load_snapshot():
+    """
+    → (comp, rows)
+    comp: {منافس: {(norm, pid): price}} | rows: {مفتاح منتجنا: (norm, {src, best, cands})}
+    """
+    comp, rows = {}, {}
+    try:
+        cn = _connect()
+        for c, n, p, pr in cn.execute("SELECT competitor, norm, pid, price FROM comp_snapshot"):
+            comp.setdefault(c, {})[(n, p)] = pr
+        for k, n, v in cn.execute("SELECT k, norm, v FROM row_snapshot"):
+            rows[k] = (n, json.loads(v))
+        cn.close()
+    except Exception:
+        pass
+    return comp, rows
+
+def _save_snapshot(indices, rows):
+    try:
+        cn = _connect()
+        cn.execute("DELETE FROM comp_snapshot")
+        cn.execute("DELETE FROM row_snapshot")
+        for cname, idx in indices.items():
+            cn.executemany("INSERT OR REPLACE INTO comp_snapshot VALUES(?,?,?,?)",
+                           [(cname, n, p, pr) for (n, p), pr in idx.price_map().items()])
+        cn.executemany("INSERT OR REPLACE INTO row_snapshot VALUES(?,?,?)",
+                       [(k, n, json.dumps(v, ensure_ascii=False, default=float))
+                        for k, (n, v) in rows.items()])
+        cn.commit(); cn.close()
+    except Exception:
+        pass
 
 # ══ دوال أساسية ════════════════════════════
 def read_file(f):
@@ -88,7 +162,8 @@ def read_file(f):
         else:
             return None, "صيغة غير مدعومة — CSV أو Excel فقط"
         df.columns = df.columns.str.strip()
-        return df.dropna(how='all').reset_index(drop=True), None
+        df = df.dropna(how='all').reset_index(drop=True)
+        return (arrow_strings(df) if ARROW_STRINGS else df), None
     except Exception as e:
         return None, str(e)
 
@@ -106,19 +181,38 @@ def extract_size(text):
     m = re.findall(r'(\d+(?:\.\d+)?)\s*(?:ml|مل|ملي)', text.lower())
     return float(m[0]) if m else 0.0
 
+_BRAND_TABLE = None
+
+def _brands():
+    """[(ماركة, مطبّعة, lower)] — تُبنى عند أول استخراج ماركة وتُطبّع مرة واحدة"""
+    global _BRAND_TABLE
+    if _BRAND_TABLE is None:
+        try:
+            from config import ALL_BRANDS
+        except Exception:
+            ALL_BRANDS = []
+        _BRAND_TABLE = [(b, normalize(b), b.lower()) for b in ALL_BRANDS]
+    return _BRAND_TABLE
+
 def extract_brand(text):
     if not isinstance(text, str): return ""
-    n = normalize(text)
-    tl = text.lower()
-    for b in ALL_BRANDS:
-        nb = normalize(b)
-        if nb and (nb in n or b.lower() in tl):
+    return _brand_of(text, normalize(text))
+
+def _brand_of(text, n):
+    return _brand_lc(text.lower(), n)
+
+def _brand_lc(tl, n):
+    """tl: النص الخام بأحرف صغيرة | n: المطبّع"""
+    for b, nb, bl in _brands():
+        if nb and (nb in n or bl in tl):
             return b
     return ""
 
 def extract_type(text):
     if not isinstance(text, str): return ""
-    n = normalize(text)
+    return _type_of(normalize(text))
+
+def _type_of(n):
     if "extrait" in n: return "EXTRAIT"
     if "edp" in n: return "EDP"
     if "edt" in n: return "EDT"
@@ -136,59 +230,321 @@ def best_col(df, cands):
 def get_price(row):
     for c in ["السعر","سعر","Price","price","PRICE"]:
         if c in row.index:
-            try: return float(str(row[c]).replace(",","").replace(" ",""))
+            v = np.nan if row[c] is pd.NA else row[c]
+            try: return float(str(v).replace(",","").replace(" ",""))
             except Exception: pass
     return 0.0
 
 def get_id(row, col):
     if not col or col not in row.index: return ""
     v = str(row.get(col,""))
-    return "" if v in ("nan","None","") else v
+    return "" if v in ("nan","None","","<NA>") else v
+
+
+# ══ أعمدة نصوص Arrow ══════════════════════════
+_STRING = None
+
+def _string_dtype():
+    """string[pyarrow] أو None إن لم تتوفر pyarrow"""
+    global _STRING
+    if _STRING is None:
+        try:
+            import pyarrow  # noqa: F401
+            _STRING = pd.StringDtype("pyarrow")
+        except ImportError:
+            _STRING = False
+            if ARROW_STRINGS:
+                log.warning("ARROW_STRINGS مفعّل لكن pyarrow غير مثبّتة — أعمدة object ومسار Python")
+    return _STRING or None
+
+def arrow_strings(df):
+    """
+    أعمدة النصوص (object/str التي كل قيمها نصوص) → string[pyarrow].
+    الأعمدة الرقمية وأعمدة القوائم (جميع_المرشحين) كما هي.
+    """
+    dt = _string_dtype()
+    if dt is None: return df
+    conv = {}
+    for c in df.columns:
+        s = df[c]
+        if s.dtype == dt or not (s.dtype == object or isinstance(s.dtype, pd.StringDtype)):
+            continue
+        if pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+            conv[c] = dt
+    return df.astype(conv) if conv else df
+
+def _pyvals(s):
+    """قيم العمود كقائمة Python — NA في string[pyarrow] تُعامل كـ NaN كما في مسار object"""
+    if isinstance(s.dtype, pd.StringDtype) and s.dtype.na_value is pd.NA:
+        return s.to_numpy(dtype=object, na_value=np.nan).tolist()
+    return s.tolist()
+
+
+# ══ استخراج الخصائص دفعة واحدة ═══════════════
+_ARROW_MIN = 2000   # أقل من ذلك: كلفة التحويل لـ Arrow أكبر من المكسب
+
+def _features(names):
+    """
+    names: [str] → (norms, brands, sizes, types)
+    كل اسم مميز يُعالج مرة واحدة، والتطبيع يُحسب مرة ويُعاد استخدامه.
+    القوائم الكبيرة تمر عبر _features_arrow (نفس النتيجة حرفياً).
+    """
+    if ARROW_STRINGS and len(names) >= _ARROW_MIN and _string_dtype() is not None:
+        return _features_arrow(names)
+    memo = {}
+    for t in names:
+        if t not in memo:
+            n = normalize(t)
+            memo[t] = (n, _brand_of(t, n), extract_size(t), _type_of(n))
+    rows = [memo[t] for t in names]
+    return ([r[0] for r in rows], [r[1] for r in rows],
+            [r[2] for r in rows], [r[3] for r in rows])
+
+# مسار Arrow مطابق لـ normalize/extract_size في نطاق ASCII + العربية (U+0600–U+06FF):
+# RE2 يعرّف \w و \s و \d بـ ASCII فقط، لذا الفئات مكتوبة صراحةً كما يفهمها re في Python.
+# الأسماء خارج هذا النطاق (لاتينية بعلامات، رموز...) تُعالج بمسار Python نفسه.
+_WS     = "\t\n\x0b\x0c\r \x1c\x1d\x1e\x1f"
+_WS_RE  = r"\t\n\x0b\x0c\r \x1c-\x1f"
+_DIG_RE = r"[0-9\x{0660}-\x{0669}\x{06F0}-\x{06F9}]"
+_SAFE_RE = r"^[\x00-\x7F\x{0600}-\x{06FF}]*$"
+_JUNK_RE = r"[^0-9A-Za-z_" + _WS_RE + r"\x{0600}-\x{06FF}.]"
+_SIZE_RE = ("(?P<s>" + _DIG_RE + "+(?:\\." + _DIG_RE + "+)?)[" + _WS_RE + "]*(?:ml|مل|ملي)")
+
+def _features_arrow(names):
+    """
+    مثل _features لكن بـ pyarrow.compute على القيم المميزة (dictionary_encode):
+    lower/strip/الترادف/التنظيف/الحجم/النوع كـ kernels. الماركة تبقى حلقة Python
+    على النصوص الجاهزة — أول ماركة بترتيب القائمة لا يقابلها kernel واحد.
+    """
+    import pyarrow as pa, pyarrow.compute as pc
+    enc  = pc.dictionary_encode(pa.array(names, type=pa.string()))
+    d, ix = enc.dictionary, enc.indices.to_numpy()
+    low  = pc.utf8_lower(d)
+    n    = pc.utf8_trim(low, _WS)
+    for k, v in _SYN.items():
+        n = pc.replace_substring(n, k, v)
+    n = pc.replace_substring_regex(n, _JUNK_RE, " ")
+    n = pc.utf8_trim(pc.replace_substring_regex(n, "[" + _WS_RE + "]+", " "), _WS)
+    sz = pc.struct_field(pc.extract_regex(low, _SIZE_RE), [0])
+
+    types = np.full(len(d), "", dtype=object)
+    for tag, tp in (("edc", "EDC"), ("edt", "EDT"), ("edp", "EDP"), ("extrait", "EXTRAIT")):
+        types[pc.match_substring(n, tag).to_numpy(zero_copy_only=False)] = tp   # الأخير يغلب = ترتيب _type_of
+
+    raw, norms, lows = d.to_pylist(), n.to_pylist(), low.to_pylist()
+    sizes, fl = [], {}
+    for s in sz.to_pylist():
+        sizes.append(0.0 if s is None else fl.setdefault(s, float(s)))
+    safe = pc.match_substring_regex(d, _SAFE_RE).to_numpy(zero_copy_only=False)
+    feats = []
+    for j, t in enumerate(raw):
+        if not safe[j]:
+            nn = normalize(t)
+            feats.append((nn, _brand_of(t, nn), extract_size(t), _type_of(nn)))
+            continue
+        feats.append((norms[j], _brand_lc(lows[j], norms[j]), sizes[j], types[j]))
+    rows = [feats[i] for i in ix]
+    return ([r[0] for r in rows], [r[1] for r in rows],
+            [r[2] for r in rows], [r[3] for r in rows])
+
+def _col_prices(df):
+    """مثل get_price لكل صف، بدون iterrows"""
+    out, todo = [0.0] * len(df), range(len(df))
+    for c in ["السعر","سعر","Price","price","PRICE"]:
+        if c not in df.columns: continue
+        vals, nxt = _pyvals(df[c]), []
+        for i in todo:
+            try: out[i] = float(str(vals[i]).replace(",","").replace(" ",""))
+            except Exception: nxt.append(i)
+        todo = nxt
+    return out
+
+def _col_ids(df, col):
+    """مثل get_id لكل صف، بدون iterrows"""
+    if not col or col not in df.columns: return [""] * len(df)
+    return ["" if v in ("nan","None","") else v for v in map(str, _pyvals(df[col]))]
+
+def content_hash(df):
+    """بصمة محتوى DataFrame (القيم + أسماء الأعمدة) أو None"""
+    try:
+        h = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        h.update(json.dumps([str(c) for c in df.columns], ensure_ascii=False).encode())
+        return h.hexdigest()
+    except Exception:
+        return None
+
+
+# ══ جدول الأسماء العام (interning) ═══════════
+class NameTable:
+    """
+    كل اسم خام مميز ← رقم صحيح؛ خصائصه (تطبيع/ماركة/حجم/نوع/عينة) تُحسب مرة واحدة
+    مهما تكرر عبر ملف مهووس وملفات المنافسين و find_missing.
+    إلحاق فقط: رقم الاسم ثابت طوال عمر الجدول. الفهارس تحتفظ بمرجع لجدولها،
+    فاستبداله في clear_caches() لا يُفسد فهرساً قائماً.
+    """
+    def __init__(self):
+        self._ids  = {}
+        self.raw, self.norm, self.brand, self.size, self.type = [], [], [], [], []
+        self.sample, self.valid = [], []   # valid: ليس عينة وليس فارغاً
+        self.looked = 0                    # أسماء مرّت بـ intern (بالتكرار)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.raw)
+
+    def intern(self, names):
+        """[str] → np.int32[] — الأسماء الجديدة فقط تُستخرج خصائصها (دفعة واحدة)"""
+        with self._lock:
+            ids = self._ids
+            new = [n for n in dict.fromkeys(names) if n not in ids]
+            if new:
+                norms, brands, sizes, types = _features(new)
+                ids.update(zip(new, range(len(self.raw), len(self.raw) + len(new))))
+                self.raw += new; self.norm += norms; self.brand += brands
+                self.size += sizes; self.type += types
+                smp = [is_sample(n) for n in new]
+                self.sample += smp
+                self.valid  += [not s and bool(n.strip()) for n, s in zip(new, smp)]
+            self.looked += len(names)
+            return np.fromiter(map(ids.__getitem__, names), dtype=np.int32, count=len(names))
+
+    def id_of(self, name):
+        """رقم الاسم أو -1 إن لم يُسجَّل"""
+        return self._ids.get(name, -1)
+
+    def norm_of(self, name):
+        """الاسم المطبّع — من الجدول إن سبق، وإلا normalize"""
+        i = self._ids.get(name)
+        return self.norm[i] if i is not None else normalize(name)
+
+    def take(self, col, ids):
+        """عمود من الجدول لقائمة أرقام → list"""
+        c = getattr(self, col)
+        return [c[i] for i in ids.tolist()]
+
+    def stats(self):
+        n = len(self.raw)
+        return {"names": n, "looked_up": self.looked,
+                "reuse": round(1 - n / self.looked, 3) if self.looked else 0.0}
+
+
+_NAMES = NameTable()
+NAME_ID_COLS = ("رقم_الاسم", "رقم_اسم_المنافس")   # أعمدة النتائج الداخلية — لا تُصدَّر
+
+def names_table():
+    return _NAMES
 
 
 # ══ فهرس المنافس (يُبنى مرة واحدة) ═══════════
 class CompIndex:
+    """
+    name_ids: أرقام الأسماء في NameTable (صف ← رقم). الخصائص تُقرأ من الجدول؛
+    raw_names/norm_names/brands/sizes/types نسخ list للتوافق مع المستدعين القدامى.
+    """
     def __init__(self, df, name_col, id_col, comp_name):
         self.comp_name  = comp_name
-        self.raw_names  = df[name_col].fillna("").astype(str).tolist()
-        self.norm_names = [normalize(n) for n in self.raw_names]
-        self.brands     = [extract_brand(n) for n in self.raw_names]
-        self.sizes      = [extract_size(n) for n in self.raw_names]
-        self.types      = [extract_type(n) for n in self.raw_names]
-        self.prices     = [get_price(row) for _, row in df.iterrows()]
-        self.ids        = [get_id(row, id_col) for _, row in df.iterrows()]
-        self._valid_idx = [i for i, n in enumerate(self.raw_names) if not is_sample(n) and n.strip()]
-
-    def search(self, our_norm, our_br, our_sz, our_tp, top_n=5):
+        self.name_col   = name_col
+        self.id_col     = id_col
+        self.table      = _NAMES
+        self.name_ids   = self.table.intern(df[name_col].fillna("").astype(str).tolist())
+        self.prices     = _col_prices(df)
+        self.ids        = _col_ids(df, id_col)
+        valid           = self.table.valid
+        self._valid_idx = [i for i, nid in enumerate(self.name_ids.tolist()) if valid[nid]]
+        self._vnorms    = self._vnids = None
+        self._pmap      = None
+        self._kmap      = None
+
+    raw_names  = property(lambda self: self.table.take("raw",   self.name_ids))
+    norm_names = property(lambda self: self.table.take("norm",  self.name_ids))
+    brands     = property(lambda self: self.table.take("brand", self.name_ids))
+    sizes      = property(lambda self: self.table.take("size",  self.name_ids))
+    types      = property(lambda self: self.table.take("type",  self.name_ids))
+
+    def norm(self, idx):
+        return self.table.norm[self.name_ids[idx]]
+
+    def key(self, idx):
+        """مفتاح الصف في ذاكرة المطابقة: المعرف، وإلا الاسم المطبّع"""
+        return self.ids[idx] or self.norm(idx)
+
+    def lookup(self, key):
+        """بحث دقيق بمفتاح الذاكرة → رقم الصف أو None"""
+        if self._kmap is None:
+            self._kmap = {}
+            for i in self._valid_idx:
+                self._kmap.setdefault(self.key(i), i)
+        return self._kmap.get(key)
+
+    def candidate(self, idx, score):
+        t, nid = self.table, int(self.name_ids[idx])
+        return {
+            "name": t.raw[nid], "score": score,
+            "price": self.prices[idx], "product_id": self.ids[idx],
+            "brand": t.brand[nid], "size": t.size[nid], "type": t.type[nid],
+            "competitor": self.comp_name, "name_id": nid,
+        }
+
+    def price_map(self):
+        """{(الاسم المطبّع, المعرف): السعر} — مفتاح المقارنة مع اللقطة السابقة"""
+        if self._pmap is None:
+            self._pmap = {(self.norm(i), self.ids[i]): self.prices[i] for i in self._valid_idx}
+        return self._pmap
+
+    def subset(self, keys):
+        """نفس الفهرس مقصوراً على صفوف {(الاسم المطبّع, المعرف)} — لفحص المضاف في الدلتا"""
+        sub = copy.copy(self)
+        sub._valid_idx = [i for i in self._valid_idx if (self.norm(i), self.ids[i]) in keys]
+        sub._vnorms = sub._vnids = sub._pmap = sub._kmap = None
+        return sub
+
+    def valid_norms(self):
+        """الأسماء المطبّعة للصفوف الصالحة — تُبنى مرة لكل فهرس لا لكل بحث"""
+        if self._vnorms is None:
+            norm, nids = self.table.norm, self.name_ids.tolist()
+            self._vnids  = [nids[i] for i in self._valid_idx]   # int Python: أسرع من فهرسة numpy في الحلقة
+            self._vnorms = [norm[j] for j in self._vnids]
+        return self._vnorms
+
+    def search(self, our_norm, our_br, our_sz, our_tp, top_n=5, stats=None):
+        """stats: RunStats اختياري — زمن fuzzy/rescore وعدّادات الرفض"""
         if not self._valid_idx: return []
-        valid_norms = [self.norm_names[i] for i in self._valid_idx]
+        t0 = time.perf_counter()
+        valid_norms = self.valid_norms()
+        t = self.table
 
         fast = rf_process.extract(
             our_norm, valid_norms,
             scorer=fuzz.token_set_ratio,
             limit=min(20, len(valid_norms))
         )
+        t1 = time.perf_counter()
         cands = []
         seen  = set()
+        n_eval = rej_br = rej_sz = rej_tp = low = 0
         for _, fast_score, vi in fast:
             if fast_score < max(MATCH_THRESHOLD - 15, 40): continue
             idx  = self._valid_idx[vi]
-            name = self.raw_names[idx]
-            if name in seen: continue
-            c_br = self.brands[idx]
-            c_sz = self.sizes[idx]
-            c_tp = self.types[idx]
+            nid  = self._vnids[vi]
+            if nid in seen: continue
+            n_eval += 1
+            c_br = t.brand[nid]
+            c_sz = t.size[nid]
+            c_tp = t.type[nid]
 
             # ── فلاتر صارمة ──
             # ماركة مختلفة → رفض
-            if our_br and c_br and normalize(our_br) != normalize(c_br): continue
+            if our_br and c_br and normalize(our_br) != normalize(c_br):
+                rej_br += 1; continue
             # حجم مختلف بأكثر من 30ml → رفض
-            if our_sz > 0 and c_sz > 0 and abs(our_sz - c_sz) > 30: continue
+            if our_sz > 0 and c_sz > 0 and abs(our_sz - c_sz) > 30:
+                rej_sz += 1; continue
             # نوع مختلف (EDP vs EDT) مع نفس الحجم الدقيق → رفض
-            if our_tp and c_tp and our_tp != c_tp and our_sz > 0 and c_sz > 0 and abs(our_sz - c_sz) <= 3: continue
+            if our_tp and c_tp and our_tp != c_tp and our_sz > 0 and c_sz > 0 and abs(our_sz - c_sz) <= 3:
+                rej_tp += 1; continue
 
             # ── score مركّب ──
-            n1, n2 = our_norm, self.norm_names[idx]
+            n1, n2 = our_norm, t.norm[nid]
             s = (fuzz.token_sort_ratio(n1,n2) * 0.30
                + fuzz.token_set_ratio(n1,n2) * 0.40
                + fuzz.partial_ratio(n1,n2)   * 0.30)
@@ -202,80 +558,299 @@ class CompIndex:
                 s -= 14
 
             score = round(max(0, min(100, s)), 1)
-            if score < MATCH_THRESHOLD: continue
-            seen.add(name)
-            cands.append({
-                "name": name, "score": score,
-                "price": self.prices[idx], "product_id": self.ids[idx],
-                "brand": c_br, "size": c_sz, "type": c_tp,
-                "competitor": self.comp_name,
-            })
+            if score < MATCH_THRESHOLD:
+                low += 1; continue
+            seen.add(nid)
+            cands.append(self.candidate(idx, score))
 
         cands.sort(key=lambda x: x["score"], reverse=True)
+        if stats is not None:
+            t2 = time.perf_counter()
+            stats.add_time("fuzzy", t1 - t0)
+            stats.add_time("rescore", t2 - t1)
+            stats.update(candidates=n_eval, rejected_brand=rej_br, rejected_size=rej_sz,
+                         rejected_type=rej_tp, below_threshold=low)
         return cands[:top_n]
 
 
+# ══ كتالوج مهووس (يُبنى مرة واحدة) ═══════════
+class OurCatalog:
+    """
+    خصائص ملف مهووس (تطبيع/ماركة/حجم/نوع/سعر/معرف) — نظير CompIndex.
+    يُحسب مرة ويُمرَّر لـ run_analysis و find_missing؛ استخدم our_catalog()
+    للاستفادة من الـ cache عند إعادة التشغيل بنفس الملف.
+    الأسماء أرقام في NameTable المشترك مع فهارس المنافسين.
+    """
+    def __init__(self, df):
+        self.name_col  = best_col(df, ["المنتج","اسم المنتج","Product","Name","name","اسم"])
+        self.price_col = best_col(df, ["السعر","سعر","Price","price","PRICE"])
+        self.id_col    = best_col(df, ["no","NO","No","معرف","معرف_المنتج","ID","id","SKU","sku","الكود","كود"])
+        self.table     = _NAMES
+        self.name_ids  = self.table.intern(
+            [n.strip() for n in df[self.name_col].fillna("").astype(str)]
+            if self.name_col else [""] * len(df))
+        self.prices    = _col_prices(df) if self.price_col else [0.0] * len(df)
+        self.ids       = _col_ids(df, self.id_col)
+
+    products = property(lambda self: self.table.take("raw",   self.name_ids))
+    norms    = property(lambda self: self.table.take("norm",  self.name_ids))
+    brands   = property(lambda self: self.table.take("brand", self.name_ids))
+    sizes    = property(lambda self: self.table.take("size",  self.name_ids))
+    types    = property(lambda self: self.table.take("type",  self.name_ids))
+    valid    = property(lambda self: self.table.take("valid", self.name_ids))
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def match_norms(self):
+        """الأسماء المطبّعة بدون العينات — مرجع find_missing"""
+        norm, sample = self.table.norm, self.table.sample
+        return [norm[i] for i in self.name_ids.tolist() if not sample[i]]
+
+
+# ══ ذاكرة الفهارس (ببصمة المحتوى) ═════════════
+class _LRU:
+    """LRU بحد ذاكرة تقريبي — الأقدم استخداماً يُحذف أولاً"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._d, self._size, self._lock = OrderedDict(), {}, threading.Lock()
+
+    def get(self, k):
+        with self._lock:
+            if k in self._d:
+                self._d.move_to_end(k)
+                return self._d[k]
+        return None
+
+    def put(self, k, v, nbytes):
+        with self._lock:
+            self._d[k], self._size[k] = v, nbytes
+            self._d.move_to_end(k)
+            while len(self._d) > 1 and sum(self._size.values()) > self.max_bytes:
+                old, _ = self._d.popitem(last=False)
+                self._size.pop(old, None)
+
+    def clear(self):
+        with self._lock:
+            self._d.clear(); self._size.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._d), "mb": round(sum(self._size.values()) / 2**20, 1)}
+
+
+def _est_bytes(obj):
+    """
+    تقدير حجم فهرس/كتالوج: أرقام الأسماء + السعر والمعرف وقوائم الصفوف الصالحة
+    (تقريبي، بلا مسح للكائنات). النصوص وخصائصها في NameTable المشترك لا تُحسب هنا.
+    """
+    return obj.name_ids.nbytes + len(obj.name_ids) * 120 + sum(map(len, obj.ids))
+
+
+_INDEX_CACHE = _LRU(INDEX_CACHE_MB * 2**20)
+_NAMES_MAX   = 500_000   # أسماء مميزة قبل إعادة بدء الجدول (~150MB)
+
+def our_catalog(df):
+    """OurCatalog مخزّن ببصمة المحتوى — تغيير الخيارات فقط لا يعيد الاستخراج"""
+    k = content_hash(df)
+    cat = _INDEX_CACHE.get(("our", k)) if k else None
+    if cat is None:
+        # الكتالوج يُبنى قبل فهارس المنافسين → إعادة بدء الجدول هنا تبقي التشغيل على جدول واحد
+        if len(_NAMES) > _NAMES_MAX: clear_caches()
+        cat = OurCatalog(df)
+        if k: _INDEX_CACHE.put(("our", k), cat, _est_bytes(cat))
+    return cat
+
+
+def comp_index(df, name_col, id_col, comp_name):
+    """CompIndex مخزّن ببصمة المحتوى + الأعمدة + اسم المنافس"""
+    k = content_hash(df)
+    key = ("comp", k, name_col, id_col, comp_name)
+    idx = _INDEX_CACHE.get(key) if k else None
+    if idx is None:
+        idx = CompIndex(df, name_col, id_col, comp_name)
+        if k: _INDEX_CACHE.put(key, idx, _est_bytes(idx))
+    return idx
+
+
+def clear_caches():
+    """إبطال صريح: الفهارس والكتالوجات المخزّنة + جدول الأسماء (الفهارس القائمة تحتفظ بجدولها)"""
+    global _NAMES
+    _INDEX_CACHE.clear()
+    _NAMES = NameTable()
+
+
+def cache_info():
+    return {**_INDEX_CACHE.stats(), **_NAMES.stats()}
+
+
 # ══ Gemini Batch ═════════════════════════════
-def _ai_batch(batch):
+class BatchPlanner:
+    """
+    تخطيط دفعات Gemini:
+    - الدفعة تُغلق عند حجمها الحالي أو عند ميزانية tokens البرومبت (أيهما أسبق)
+    - الحجم يتكيّف: نجاح سريع → +2 | بطء → ×0.75 | رد غير قابل للتحليل → ×0.5
+    - نسبة الحروف/token تُعايَر من usageMetadata في ردود Gemini
+    - إحصائيات التشغيل: دفعات، tokens، tokens لكل منتج محسوم
+    """
+    def __init__(self, size=AI_BATCH_SIZE, budget=AI_PROMPT_BUDGET,
+                 target_latency=AI_TARGET_LATENCY, min_size=4, max_size=40, chars_per_token=3.0):
+        self.size, self.budget, self.target = float(size), budget, target_latency
+        self.min_size, self.max_size = min_size, max_size
+        self.chars_per_token = chars_per_token   # 3.0: تقدير أولي للنص العربي/الإنجليزي المختلط
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = dict(batches=0, items=0, resolved=0, cached=0, parse_failures=0,
+                              prompt_tokens=0, output_tokens=0, latency=0.0)
+
+    def tokens(self, text):
+        return int(len(text) / self.chars_per_token) + 1
+
+    def full(self, n_items, n_tokens):
+        return n_items >= int(self.size) or n_tokens >= self.budget
+
+    def observe(self, n, latency, ok, prompt_chars, usage=None):
+        with self._lock:
+            st_ = self.stats
+            st_["batches"] += 1; st_["items"] += n; st_["latency"] += latency
+            pt = (usage or {}).get("promptTokenCount")
+            if pt:
+                self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * (prompt_chars / pt)
+            st_["prompt_tokens"] += pt or int(prompt_chars / self.chars_per_token)
+            st_["output_tokens"] += (usage or {}).get("candidatesTokenCount") or 0
+            if not ok:
+                st_["parse_failures"] += 1
+                self.size = max(self.min_size, self.size * 0.5)
+                return
+            st_["resolved"] += n
+            if latency > self.target:
+                self.size = max(self.min_size, self.size * 0.75)
+            else:
+                self.size = min(self.max_size, self.size + 2)
+
+    def hit(self, n):
+        with self._lock:
+            self.stats["cached"] += n; self.stats["resolved"] += n
+
+    def report(self):
+        with self._lock:
+            st_ = dict(self.stats)
+        st_["tokens_per_item"] = round(st_["prompt_tokens"] / st_["resolved"], 1) if st_["resolved"] else 0.0
+        st_["avg_batch"]       = round(st_["items"] / st_["batches"], 1) if st_["batches"] else 0.0
+        st_["latency"]         = round(st_["latency"], 2)
+        st_["next_size"]       = int(self.size)
+        return st_
+
+
+# مخطِّط جديد لكل run_analysis (جلسات Streamlit متزامنة لا تتشارك عدّاداتها)؛
+# آخر حجم/نسبة متعلَّمة فقط تُورَّث للتشغيل التالي في نفس العملية
+_LEARNED = {}
+
+def _new_planner():
+    return BatchPlanner(**_LEARNED)
+
+def _keep_learned(planner):
+    _LEARNED.update(size=planner.size, chars_per_token=planner.chars_per_token)
+
+
+def _shared_prefix(names):
+    """الكلمات المشتركة في بداية كل الأسماء (عادة الماركة) — تُكتب مرة واحدة"""
+    toks = [n.split() for n in names]
+    if len(toks) < 2: return 0
+    k = 0
+    while all(len(t) > k + 1 for t in toks) and len({t[k].lower() for t in toks}) == 1:
+        k += 1
+    return k
+
+
+def _item_line(it):
+    """
+    سطر مضغوط لمنتج ومرشحيه: البادئة المشتركة مرة واحدة،
+    الحجم رقماً (بدون ml) ولا يُكرر إن كان في الاسم، والحقول الفارغة تُحذف.
+    """
+    cands = it["candidates"]
+    names = [str(c["name"]) for c in cands]
+    k = _shared_prefix(names)
+    head = " ".join(names[0].split()[:k]) if k else ""
+    rows = []
+    for j, (c, nm) in enumerate(zip(cands, names)):
+        nm = " ".join(nm.split()[k:])
+        parts = [nm]
+        sz = c.get("size") or 0
+        if sz and not re.search(rf"(?<!\d){int(sz)}(?!\d)", nm): parts.append(f"{int(sz)}")
+        tp = c.get("type") or ""
+        if tp and tp.lower() not in nm.lower(): parts.append(tp)
+        parts.append(f"{float(c.get('price') or 0):.0f}")
+        rows.append(f"{j+1}.{'|'.join(parts)}")
+    return (f"«{it['our']}» {float(it['price'] or 0):.0f}"
+            + (f" [{head}…]" if head else "") + "\n" + "\n".join(rows))
+
+
+def _ai_batch(batch, planner=None):
     """
     batch: [{our, price, candidates:[...]}]
     → [int]  index يبدأ من 0 | -1 = لا يوجد تطابق
+             | None = رقم غير مفهوم لهذا المنتج (يُعامل كأفضل مرشح ولا يُسجَّل كحكم)
+    → None إذا تعذّر الحصول على حكم (يُعامل كأفضل مرشح ولا يُسجَّل كحكم)
     """
     if not GEMINI_API_KEYS or not batch:
-        return [0] * len(batch)
+        return None
+    planner = planner or BatchPlanner()
 
     ck = hashlib.md5(json.dumps(
         [{"o": x["our"], "c": [c["name"] for c in x["candidates"]]} for x in batch],
         ensure_ascii=False, sort_keys=True).encode()).hexdigest()
     cached = _cget(ck)
     if cached is not None:
+        planner.hit(len(batch))
         return cached
 
-    lines = []
-    for i, it in enumerate(batch):
-        cands_text = "\n".join(
-            f"  {j+1}. {c['name']} | {int(c.get('size',0))}ml | {c.get('type','?')} | {c.get('price',0):.0f}ر.س"
-            for j, c in enumerate(it["candidates"])
-        )
-        lines.append(f"[{i+1}] منتجنا: «{it['our']}» ({it['price']:.0f}ر.س)\n{cands_text}")
-
+    lines = [f"[{i+1}] " + (it.get("line") or _item_line(it)) for i, it in enumerate(batch)]
     prompt = (
-        "خبير عطور فاخرة. لكل منتج اختر رقم المرشح المطابق تماماً أو 0 إذا لا يوجد.\n"
-        "شروط التطابق: ✓نفس الماركة ✓نفس الاسم ✓نفس الحجم (±5ml) ✓نفس EDP/EDT إذا مذكور\n\n"
-        + "\n\n".join(lines)
-        + f'\n\nJSON فقط: {{"results":[r1,r2,...,r{len(batch)}]}}'
+        "خبير عطور. لكل منتج اختر رقم المرشح المطابق تماماً أو 0 إذا لا يوجد "
+        "(نفس الماركة والاسم والحجم ±5ml ونفس EDP/EDT). [X…] = بادئة مشتركة لأسماء المرشحين. "
+        "المرشح: الاسم|الحجم|النوع|السعر\n\n"
+        + "\n".join(lines)
+        + f'\n\nJSON فقط: {{"results":[r1,...,r{len(batch)}]}}'
     )
     payload = {
         "contents": [{"parts": [{"text": prompt}]}],
-        "generationConfig": {"temperature": 0, "maxOutputTokens": 300, "topP": 1, "topK": 1}
+        # الرد أرقام فقط: ~3 tokens لكل منتج + الغلاف
+        "generationConfig": {"temperature": 0, "maxOutputTokens": 24 + 4 * len(batch),
+                             "topP": 1, "topK": 1}
     }
-    for attempt in range(3):
-        for key in GEMINI_API_KEYS:
-            if not key: continue
-            try:
-                r = _req.post(f"{_GURL}?key={key}", json=payload, timeout=25)
-                if r.status_code == 200:
-                    txt = r.json()["candidates"][0]["content"]["parts"][0]["text"]
-                    clean = re.sub(r'```json|```','',txt).strip()
-                    s = clean.find('{'); e = clean.rfind('}')+1
-                    if s >= 0 and e > s:
-                        raw = json.loads(clean[s:e]).get("results",[])
-                        out = []
-                        for j, it in enumerate(batch):
-                            n = raw[j] if j < len(raw) else 1
-                            try: n = int(n)
-                            except Exception: n = 1
-                            if 1 <= n <= len(it["candidates"]): out.append(n-1)
-                            elif n == 0: out.append(-1)
-                            else: out.append(0)
-                        _cset(ck, out)
-                        return out
-                elif r.status_code == 429:
-                    time.sleep(2 ** attempt)
-            except Exception:
-                continue
-        time.sleep(1)
-    return [0] * len(batch)
+    # المهلة/429/تدوير المفاتيح داخل العميل؛ هنا نعيد فقط إذا تعذّر تحليل الرد
+    from engines.llm_client import get_client, gemini_text_of
+    for _ in range(2):
+        t0 = time.time()
+        data = get_client().gemini(payload, timeout=25)
+        txt = gemini_text_of(data)
+        if not txt: break
+        usage = data.get("usageMetadata") if isinstance(data, dict) else None
+        try:
+            clean = re.sub(r'```json|```','',txt).strip()
+            s = clean.find('{'); e = clean.rfind('}')+1
+            raw = json.loads(clean[s:e]).get("results",[]) if s >= 0 and e > s else None
+            if not isinstance(raw, list) or len(raw) < len(batch):
+                raise ValueError("رد ناقص")
+        except Exception:
+            planner.observe(len(batch), time.time() - t0, False, len(prompt), usage)
+            continue
+        planner.observe(len(batch), time.time() - t0, True, len(prompt), usage)
+        out = []
+        for j, it in enumerate(batch):
+            try: n = int(raw[j])
+            except Exception: n = None
+            if n is None: out.append(None)
+            elif 1 <= n <= len(it["candidates"]): out.append(n-1)
+            elif n == 0: out.append(-1)
+            else: out.append(None)
+        _cset(ck, out)
+        return out
+    return None
 
 
 # ══ بناء صف نتيجة ════════════════════════════
@@ -292,6 +867,7 @@ def _build_row(product, our_price, our_id, brand, size, ptype,
             "الفرق": 0.0, "الفرق_بالنسبة": 0.0, "نسبة_التطابق": 0.0,
             "القرار": "🔵 مفقود عند المنافس", "الخطورة": "",
             "المنافس": "", "مصدر_المطابقة": "—", "جميع_المرشحين": [],
+            "رقم_اسم_المنافس": -1,
         }}
 
     cp    = float(best.get("price") or 0)
@@ -306,10 +882,11 @@ def _build_row(product, our_price, our_id, brand, size, ptype,
     else:                                   dec = "🟢 سعر أقل"
 
     # مراجعة إذا الثقة منخفضة وليس تلقائي
-    if score < 75 and src not in ("auto", "gemini"):
+    if score < 75 and src not in ("auto", "gemini", "user", "local"):
         dec = "⚠️ مراجعة"
 
-    src_label = {"auto": f"⚡({score:.0f}%)", "gemini": f"🤖({score:.0f}%)"}.get(src, f"{score:.0f}%")
+    src_label = {"auto": f"⚡({score:.0f}%)", "gemini": f"🤖({score:.0f}%)",
+                 "user": f"👤({score:.0f}%)", "local": f"🧮({score:.0f}%)"}.get(src, f"{score:.0f}%")
 
     return {**base, **{
         "منتج_المنافس": best["name"],
@@ -323,126 +900,455 @@ def _build_row(product, our_price, our_id, brand, size, ptype,
         "المنافس":      best.get("competitor", ""),
         "مصدر_المطابقة": src_label,
         "جميع_المرشحين": (all_cands or [best])[:5],
+        "رقم_اسم_المنافس": best.get("name_id", -1),
     }}
 
 
+# ══ وضع الدلتا: ما الذي تغيّر منذ آخر تحليل؟ ═══
+def _dirty_norms(catalog, indices, prev_comp, prev_rows):
+    """
+    منتجاتنا التي قد تتغير مطابقتها منذ اللقطة السابقة (صف منافس = الاسم المطبّع + المعرف):
+    - محذوف → فقط المنتجات التي كان بين مرشحيها المحفوظين (best + cands)
+    - مضاف  → المنتجات التي يجتازه فيها CompIndex.search كاملاً (عتبة البحث السريع،
+              فلاتر الماركة/الحجم/النوع، MATCH_THRESHOLD) على فهرس يضم المضاف فقط
+    → (مجموعة الأسماء المطبّعة, عدد المضاف, عدد المحذوف)
+    """
+    T = catalog.table
+    adds, gone, added, removed = {}, set(), 0, 0
+    for cname in set(indices) | set(prev_comp):
+        new = indices[cname].price_map() if cname in indices else {}
+        old = prev_comp.get(cname, {})
+        a, r = new.keys() - old.keys(), old.keys() - new.keys()
+        added += len(a); removed += len(r)
+        if a: adds[cname] = a
+        gone.update((cname, n, pid) for n, pid in r)
+    if not (adds or gone):
+        return set(), added, removed
+
+    nids = [n for n in dict.fromkeys(catalog.name_ids.tolist()) if T.valid[n]]
+    if added + removed >= sum(len(ix.price_map()) for ix in indices.values()) // 2:
+        return {T.norm[n] for n in nids}, added, removed   # تغيّر أغلب الملف → إعادة كاملة أرخص
+
+    dirty = set()
+    if gone:
+        for norm, v in prev_rows.values():
+            for c in [v.get("best")] + list(v.get("cands") or ()):
+                if c and (c.get("competitor", ""), T.norm_of(c["name"]),
+                          c.get("product_id", "")) in gone:
+                    dirty.add(norm); break
+
+    cut, names = max(MATCH_THRESHOLD - 15, 40), [T.norm[n] for n in nids]
+    for cname, keys in adds.items():
+        sub = indices[cname].subset(keys)
+        if not sub._valid_idx: continue
+        # تصفية أولى متجهة بنفس مقياس وعتبة البحث السريع، ثم search الكامل للمتبقي
+        for s0 in range(0, len(names), 2000):
+            block = names[s0:s0+2000]
+            m = rf_process.cdist(block, sub.valid_norms(), scorer=fuzz.token_set_ratio,
+                                 score_cutoff=cut, dtype=np.uint8, workers=-1)
+            for j in np.flatnonzero(m.max(axis=1)):
+                nid = nids[s0 + j]
+                if T.norm[nid] in dirty: continue
+                if sub.search(T.norm[nid], T.brand[nid], T.size[nid], T.type[nid], top_n=1):
+                    dirty.add(T.norm[nid])
+    return dirty, added, removed
+
+
+# ══ ذاكرة المطابقة ═══════════════════════════
+def _recall(pairs, our_norm, indices):
+    """
+    pairs: صفوف ذاكرة المطابقة لمنتجنا (المرفوضة لا تُعاد — انظر _rejected)
+    → ({منافس: (مرشح, المصدر)}, [مفاتيح أُبطلت لتغيّر الاسم المطبّع])
+    """
+    hits, stale = {}, []
+    for m in pairs:
+        idx = indices.get(m["competitor"])
+        if m["our_norm"] != our_norm:
+            stale.append((m["our_key"], m["competitor"])); continue
+        if idx is None or m["source"] == "rejected": continue
+        i = idx.lookup(m["comp_key"])
+        if i is None: continue
+        if idx.norm(i) != m["comp_norm"]:
+            stale.append((m["our_key"], m["competitor"])); continue
+        hits[m["competitor"]] = (idx.candidate(i, m["score"]), m["source"])
+    return hits, stale
+
+
+def _rejected(pairs, our_norm):
+    """أزواج رفضها المستخدم لمنتجنا → {(منافس, مفتاح المرشح)} لا تُقترح مجدداً"""
+    return {(m["competitor"], m["comp_key"]) for m in pairs
+            if m["source"] == "rejected" and m["our_norm"] == our_norm}
+
+
+def _cand_key(cand, table):
+    """مفتاح المرشح في ذاكرة المطابقة (نفس مفتاح CompIndex.key)"""
+    return cand.get("product_id") or table.norm_of(cand["name"])
+
+
+def _refresh(cand, indices):
+    """نسخة من المرشح بسعر المنافس الحالي (نفس الاسم والمعرف) ورقم الاسم في الجدول الحالي"""
+    idx = indices.get(cand.get("competitor", ""))
+    out = {**cand, "name_id": (idx.table if idx is not None else _NAMES).id_of(cand["name"])}
+    if idx is None: return out
+    price = idx.price_map().get((idx.table.norm_of(cand["name"]), cand.get("product_id", "")))
+    if price is not None: out["price"] = price
+    return out
+
+
 # ══ التحليل الكامل ════════════════════════════
-def run_analysis(our_df, comp_dfs, progress_cb=None, use_ai=True):
+@profiled("run_analysis")
+def run_analysis(our_df, comp_dfs, progress_cb=None, use_ai=True, delta=False,
+                 indices=None, catalog=None, on_chunk=None, chunk_size=200, stats=None):
     """
     our_df: DataFrame ملف مهووس
     comp_dfs: {اسم: DataFrame} ملفات المنافسين
     progress_cb: دالة تستقبل قيمة 0.0→1.0
+    on_chunk: دالة تستقبل (صفوف منتهية, "auto"|"gemini") فور جاهزيتها —
+              التلقائي كل chunk_size صف (أو كل ثانية)، ودفعات Gemini عند عودتها.
+              Gemini يعمل في الخلفية (AI_WORKERS) بينما يستمر Fuzzy.
+    indices: فهارس build_indices جاهزة (تُشارك مع find_missing)
+    catalog: OurCatalog جاهز (تُشارك مع find_missing)
+    delta: إعادة مطابقة ما تغيّر فقط منذ آخر تحليل؛ المطابقات الثابتة
+           يُعاد استخدامها مع تحديث الأسعار. التقرير في df.attrs["delta"]
+    stats: RunStats مشترك مع الصفحة (قراءة الملفات/المفقودات) — زمن كل مرحلة
+           وعدّادات المرشحين/الرفض/AI في df.attrs["stats"]
     """
     results = []
-    our_name_col  = best_col(our_df, ["المنتج","اسم المنتج","Product","Name","name","اسم"])
-    our_price_col = best_col(our_df, ["السعر","سعر","Price","price","PRICE"])
-    our_id_col    = best_col(our_df, ["no","NO","No","معرف","معرف_المنتج","ID","id","SKU","sku","الكود","كود"])
+    stats   = stats if stats is not None else RunStats()
+    t_run, spent0 = time.perf_counter(), stats.elapsed()
+    with stats.stage("index"):
+        if catalog is None:
+            catalog = OurCatalog(our_df)
+        # بناء فهارس المنافسين مرة واحدة
+        if indices is None:
+            indices = build_indices(comp_dfs)
 
-    # بناء فهارس المنافسين مرة واحدة
-    indices = {}
-    for cname, cdf in comp_dfs.items():
-        cn_col = best_col(cdf, ["المنتج","اسم المنتج","Product","Name","name","اسم"])
-        ci_col = best_col(cdf, ["ID","id","معرف","SKU","sku","الكود","code","no","NO"])
-        indices[cname] = CompIndex(cdf, cn_col, ci_col, cname)
+    total    = len(catalog)
+    pending  = []
+    pend_tok = [0]  # tokens البرومبت المقدّرة للدفعة المفتوحة
+    inflight = []   # [(future, items, أول خانة في results)]
+    buf, last_pub = [], [time.time()]
+    pool = ThreadPoolExecutor(max_workers=AI_WORKERS) if use_ai and GEMINI_API_KEYS else None
+    if pool:
+        from engines.llm_client import get_client
+    throttled0 = get_client().keys.throttled_total() if pool else 0
+    snapshot = {}
+    report   = dict(reused=0, recomputed=0, price_changed=0, added=0, removed=0, price_changes=[])
+
+    _dbm    = _db()
+    memory  = _dbm.load_match_memory() if _dbm else {}
+    mstats  = dict(lookups=0, hits=0, pairs=0)
+    planner = _new_planner()
+    if use_ai:
+        from engines import scorer as _scorer
+    local    = _scorer.LocalScorer.load() if use_ai else None
+    lstats   = dict(checked=0, resolved=0)
+    verdicts = []   # أحكام Gemini → تدريب المقيّم المحلي
+    learned, stale = [], []
+
+    prev_rows, dirty = {}, set()
+    if delta:
+        prev_comp, prev_rows = _load_snapshot()
+        if prev_rows:
+            dirty, report["added"], report["removed"] = _dirty_norms(catalog, indices, prev_comp, prev_rows)
+
+    def publish(force=False):
+        if not on_chunk or not buf: return
+        if force or len(buf) >= chunk_size or time.time() - last_pub[0] >= 1.0:
+            on_chunk(list(buf), "auto")
+            buf.clear(); last_pub[0] = time.time()
 
-    total   = len(our_df)
-    pending = []
+    def emit(product, our_price, our_id, brand, size, ptype, our_norm,
+             best=None, src="", all_cands=None, slot=None):
+        row = _build_row(product, our_price, our_id, brand, size, ptype,
+                         best=best, src=src, all_cands=all_cands)
+        # خانة محجوزة → نفس ترتيب النتائج مهما كان توقيت عودة Gemini
+        if slot is None: results.append(row)
+        else:            results[slot] = row
+        snapshot[our_id or our_norm] = (our_norm, {
+            "src": src, "best": best, "cands": (all_cands or ([best] if best else []))[:5]})
+        if best and (src == "gemini" or (src == "auto" and best["score"] >= AUTO_THRESHOLD)):
+            learned.append(dict(
+                our_key=our_id or our_norm, competitor=best.get("competitor", ""),
+                comp_key=_cand_key(best, catalog.table),
+                our_norm=our_norm, comp_norm=catalog.table.norm_of(best["name"]),
+                score=best["score"], source=src))
+        return row
+
+    def resolve(idxs, items, slot0):
+        rows = []
+        if idxs is not None:
+            # الأرقام غير المفهومة (None) ليست حكماً — لا تدخل بيانات تدريب المقيّم
+            verdicts.extend(dict(our_norm=it["norm"], comp_norm=catalog.table.norm_of(it["candidates"][0]["name"]),
+                                 features=it["f"], label=int(idxs[j] == 0), source="gemini")
+                            for j, it in enumerate(items) if j < len(idxs) and idxs[j] is not None)
+        idxs = idxs or []
+        for j, it in enumerate(items):
+            ci = idxs[j] if j < len(idxs) else None
+            if ci is not None and ci < 0:
+                rows.append(emit(it["product"], it["our_price"], it["our_id"],
+                                 it["brand"], it["size"], it["ptype"], it["norm"],
+                                 src="gemini_no_match", slot=slot0 + j))
+            else:
+                # بدون حكم (فشل الطلب/رقم غير مفهوم) → أفضل مرشح كـ gemini_fallback:
+                # لا يُحفظ في ذاكرة المطابقة ولا يُعاد استخدامه في الدلتا
+                best = it["candidates"][ci or 0]
+                rows.append(emit(it["product"], it["our_price"], it["our_id"],
+                                 it["brand"], it["size"], it["ptype"], it["norm"],
+                                 best=best, src="gemini" if ci is not None else "gemini_fallback",
+                                 all_cands=it["all_cands"], slot=slot0 + j))
+        if on_chunk: on_chunk(rows, "gemini")
+
+    def drain(wait=False):
+        for f, items, slot0 in list(inflight):
+            if not (wait or f.done()): continue
+            inflight.remove((f, items, slot0))
+            with stats.stage("gemini_wait"):
+                try: idxs = f.result()
+                except Exception: idxs = None
+            resolve(idxs, items, slot0)
 
     def flush():
         if not pending: return
-        idxs = _ai_batch(pending)
-        for j, it in enumerate(pending):
-            ci = idxs[j] if j < len(idxs) else 0
-            if ci < 0:
-                results.append(_build_row(
-                    it["product"], it["our_price"], it["our_id"],
-                    it["brand"], it["size"], it["ptype"],
-                    src="gemini_no_match"))
-            else:
-                best = it["candidates"][ci]
-                results.append(_build_row(
-                    it["product"], it["our_price"], it["our_id"],
-                    it["brand"], it["size"], it["ptype"],
-                    best=best, src="gemini", all_cands=it["all_cands"]))
-        pending.clear()
-
-    for i, (_, row) in enumerate(our_df.iterrows()):
-        product = str(row.get(our_name_col,"")).strip()
-        if not product or is_sample(product):
-            if progress_cb: progress_cb((i+1)/total)
-            continue
+        items = list(pending); pending.clear(); pend_tok[0] = 0
+        slot0 = len(results)
+        results.extend([None] * len(items))
+        stats.count("ai_items", len(items))
+        if pool:
+            inflight.append((pool.submit(_ai_batch, items, planner), items, slot0))
+        else:
+            with stats.stage("gemini_wait"):
+                idxs = _ai_batch(items, planner)
+            resolve(idxs, items, slot0)
+
+    T, nids = catalog.table, catalog.name_ids.tolist()
+    # أي استثناء (on_chunk/progress_cb عند إيقاف Streamlit للتشغيل) لا يترك الـ executor
+    # وطلبات Gemini المعلّقة خلفه
+    try:
+        for i in range(total):
+            publish(); drain()
+            nid = nids[i]
+            if not T.valid[nid]:
+                if progress_cb: progress_cb((i+1)/total)
+                continue
 
-        our_price = get_price(row) if our_price_col else 0.0
-        our_id    = get_id(row, our_id_col)
-        brand     = extract_brand(product)
-        size      = extract_size(product)
-        ptype     = extract_type(product)
-        our_norm  = normalize(product)
+            product   = T.raw[nid]
+            our_price = catalog.prices[i]
+            our_id    = catalog.ids[i]
+            brand     = T.brand[nid]
+            size      = T.size[nid]
+            ptype     = T.type[nid]
+            our_norm  = T.norm[nid]
 
-        # جمع المرشحين من كل المنافسين
-        all_cands = []
-        for idx_obj in indices.values():
-            all_cands.extend(idx_obj.search(our_norm, brand, size, ptype, top_n=5))
+            pairs    = memory.get(our_id or our_norm, ())
+            rejected = _rejected(pairs, our_norm) if pairs else ()
 
-        if not all_cands:
-            results.append(_build_row(product, our_price, our_id, brand, size, ptype))
-            if progress_cb: progress_cb((i+1)/total)
-            continue
+            # دلتا: نفس المنتج ولم يتغير شيء حوله → إعادة استخدام مع تحديث السعر
+            # (إلا إذا رفض المستخدم المطابقة السابقة منذ آخر تحليل)
+            prev = prev_rows.get(our_id or our_norm)
+            if (prev and prev[0] == our_norm and our_norm not in dirty
+                    and not (use_ai and prev[1]["src"] == "auto"
+                             and prev[1]["best"]["score"] < AUTO_THRESHOLD)
+                    and not (use_ai and prev[1]["src"] == "gemini_fallback")
+                    and not (rejected and prev[1]["best"] and
+                             (prev[1]["best"].get("competitor", ""), _cand_key(prev[1]["best"], T)) in rejected)):
+                p = prev[1]
+                best  = _refresh(p["best"], indices) if p["best"] else None
+                cands = [_refresh(c, indices) for c in p["cands"]]
+                if best and abs(float(best.get("price") or 0) - float(p["best"].get("price") or 0)) > 0.01:
+                    report["price_changed"] += 1
+                    report["price_changes"].append(dict(
+                        product=product, competitor=best.get("competitor", ""),
+                        old_price=p["best"].get("price"), price=best["price"],
+                        product_id=best.get("product_id", "")))
+                buf.append(emit(product, our_price, our_id, brand, size, ptype, our_norm,
+                                best=best, src=p["src"], all_cands=cands or None))
+                report["reused"] += 1
+                if progress_cb: progress_cb((i+1)/total)
+                continue
+            report["recomputed"] += 1
 
-        all_cands.sort(key=lambda x: x["score"], reverse=True)
-        best = all_cands[0]
+            # ذاكرة المطابقة أولاً (بحث دقيق)، ثم Fuzzy للمنافسين الباقين فقط
+            mstats["lookups"] += 1
+            hits, st_ = _recall(pairs, our_norm, indices)
+            stale.extend(st_)
+            if hits:
+                mstats["hits"] += 1
+                mstats["pairs"] += len(hits)
+            all_cands = [c for c, _ in hits.values()]
+            for cname, idx_obj in indices.items():
+                if cname not in hits:
+                    found = idx_obj.search(our_norm, brand, size, ptype, top_n=5, stats=stats)
+                    if rejected:
+                        found = [c for c in found if (cname, _cand_key(c, T)) not in rejected]
+                    all_cands.extend(found)
 
-        if best["score"] >= AUTO_THRESHOLD or not use_ai:
-            # واضح → تلقائي
-            results.append(_build_row(product, our_price, our_id, brand, size, ptype,
-                                      best=best, src="auto", all_cands=all_cands))
-        else:
-            # غامض → Gemini
-            pending.append(dict(product=product, our_price=our_price, our_id=our_id,
-                                brand=brand, size=size, ptype=ptype,
+            if not all_cands:
+                buf.append(emit(product, our_price, our_id, brand, size, ptype, our_norm))
+                if progress_cb: progress_cb((i+1)/total)
+                continue
+
+            all_cands.sort(key=lambda x: x["score"], reverse=True)
+            best = all_cands[0]
+            remembered = next((src for c, src in hits.values() if c is best), None)
+
+            if remembered:
+                # زوج مؤكد سابقاً → بدون Fuzzy ولا Gemini
+                buf.append(emit(product, our_price, our_id, brand, size, ptype, our_norm,
+                                best=best, src=remembered, all_cands=all_cands))
+            elif best["score"] >= AUTO_THRESHOLD or not use_ai:
+                # واضح → تلقائي
+                buf.append(emit(product, our_price, our_id, brand, size, ptype, our_norm,
+                                best=best, src="auto", all_cands=all_cands))
+            else:
+                # غامض → المقيّم المحلي أولاً (الحالات الواضحة)، والباقي فقط لـ Gemini
+                f = _scorer.features(our_norm, our_price, brand, size, ptype, all_cands)
+                lstats["checked"] += 1
+                if local.accept(f):
+                    lstats["resolved"] += 1
+                    buf.append(emit(product, our_price, our_id, brand, size, ptype, our_norm,
+                                    best=best, src="local", all_cands=all_cands))
+                else:
+                    item = dict(product=product, our_price=our_price, our_id=our_id,
+                                brand=brand, size=size, ptype=ptype, norm=our_norm,
                                 candidates=all_cands[:5], all_cands=all_cands,
-                                our=product, price=our_price))
-            if len(pending) >= AI_BATCH_SIZE:
-                flush()
+                                our=product, price=our_price, f=f)
+                    item["line"] = _item_line(item)
+                    pending.append(item)
+                    pend_tok[0] += planner.tokens(item["line"])
+                    if planner.full(len(pending), pend_tok[0]):
+                        flush()
 
-        if progress_cb: progress_cb((i+1)/total)
+            if progress_cb: progress_cb((i+1)/total)
 
-    flush()
-    df = pd.DataFrame(results)
+        flush()
+        publish(force=True)
+        drain(wait=True)
+    finally:
+        if pool: pool.shutdown(wait=False, cancel_futures=True)
+    if pool: _keep_learned(planner)
+    with stats.stage("persist"):
+        _save_snapshot(indices, snapshot)
+        if _dbm:
+            _dbm.forget_matches(stale)
+            _dbm.remember_matches(learned)
+            _dbm.log_verdicts(verdicts)
+    with stats.stage("assemble"):
+        df = pd.DataFrame(results)
+        if ARROW_STRINGS: df = arrow_strings(df)
+        # صف لكل منتج صالح بنفس الترتيب → رقم اسمنا في NameTable
+        ours = catalog.name_ids[np.fromiter(map(T.valid.__getitem__, nids), dtype=bool, count=total)]
+        if len(ours) == len(df) and len(df):
+            df["رقم_الاسم"] = ours
+            df["رقم_اسم_المنافس"] = df["رقم_اسم_المنافس"].astype(np.int32)
+    mstats["hit_rate"] = round(mstats["hits"] / mstats["lookups"], 3) if mstats["lookups"] else 0.0
+    df.attrs["match_memory"] = mstats
+    if pool:
+        ai = df.attrs["ai"] = {**planner.report(), "local_checked": lstats["checked"],
+                               "local_resolved": lstats["resolved"]}
+        log.info("[ai] batches=%s avg_batch=%s prompt_tokens=%s tokens/item=%s "
+                 "parse_failures=%s cached=%s local=%s/%s",
+                 ai["batches"], ai["avg_batch"], ai["prompt_tokens"], ai["tokens_per_item"],
+                 ai["parse_failures"], ai["cached"], lstats["resolved"], lstats["checked"])
+    if delta:
+        df.attrs["delta"] = report
+        log.info("[delta] reused=%s recomputed=%s price_changed=%s comp_added=%s comp_removed=%s",
+                 report["reused"], report["recomputed"], report["price_changed"],
+                 report["added"], report["removed"])
+    aist = planner.report() if pool else {}
+    stats.update(products=report["recomputed"] + report["reused"], memory_hits=mstats["hits"],
+                 local_resolved=lstats["resolved"], ai_batches=aist.get("batches", 0),
+                 ai_cache_hits=aist.get("cached", 0),
+                 ai_429=get_client().keys.throttled_total() - throttled0 if pool else 0)
+    # ما لم تغطّه المؤقّتات داخل التشغيل (ذاكرة/مقيّم محلي/بناء الصفوف)
+    stats.add_time("other", max(0.0, time.perf_counter() - t_run - (stats.elapsed() - spent0)))
+    df.attrs["stats"] = stats.report()
+    log.info("[stats] %s", stats.line())
     # إزالة عمود جميع_المرشحين من النتيجة النهائية للعرض (نحتفظ به للـ session)
     return df
 
 
 # ══ منتجات مفقودة عند المنافسين ══════════════
-def find_missing(our_df, comp_dfs):
-    our_name_col = best_col(our_df, ["المنتج","اسم المنتج","Product","Name","name"])
-    our_norms    = [normalize(str(r.get(our_name_col,"")))
-                   for _, r in our_df.iterrows()
-                   if not is_sample(str(r.get(our_name_col,"")))]
+def build_indices(comp_dfs):
+    """فهارس المنافسين — تُبنى مرة وتُمرَّر لـ run_analysis و find_missing"""
+    indices = {}
+    for cname, cdf in comp_dfs.items():
+        cn_col = best_col(cdf, ["المنتج","اسم المنتج","Product","Name","name","اسم"])
+        ci_col = best_col(cdf, ["ID","id","معرف","SKU","sku","الكود","code","no","NO"])
+        indices[cname] = comp_index(cdf, cn_col, ci_col, cname)
+    return indices
 
-    missing, seen = [], set()
+
+def _covered(norms, our_norms, cutoff=70):
+    """
+    لكل اسم منافس: هل يوجد منتج لدينا بتطابق ≥ cutoff (token_sort_ratio)؟
+    تطابق حرفي عبر set أولاً، ثم cdist دفعي للباقي.
+    token_sort_ratio(a, b) == ratio(فرز(a), فرز(b)) → نفرز الكلمات مرة واحدة
+    ونستخدم ratio (مسار cdist الأسرع) بدل إعادة الفرز لكل زوج.
+    """
+    ours = set(our_norms)
+    out  = np.array([n in ours for n in norms], dtype=bool)
+    rest = np.flatnonzero(~out)
+    if not len(rest) or not ours:
+        return out
+    srt = lambda t: " ".join(sorted(t.split()))
+    choices = [srt(n) for n in ours]
+    for s in range(0, len(rest), 2000):
+        blk = rest[s:s+2000]
+        m = rf_process.cdist([srt(norms[j]) for j in blk], choices, scorer=fuzz.ratio,
+                             score_cutoff=cutoff, dtype=np.uint8, workers=-1)
+        out[blk] = m.max(axis=1) > 0
+    return out
+
+
+@profiled("find_missing")
+def find_missing(our_df, comp_dfs, indices=None, catalog=None):
+    """
+    indices: فهارس build_indices (إن وُجدت) لإعادة استخدام التطبيع
+    catalog: OurCatalog المستخدم في run_analysis (إن وُجد)
+    """
+    if catalog is None:
+        catalog = OurCatalog(our_df)
+    our_norms = catalog.match_norms()
+
+    # أرقام أسماء المنافسين في NameTable — بدون فهرس تُسجَّل في جدول الكتالوج
+    # (الاسم المكرر عبر الملفات أو الموجود لدينا لا يُعاد تطبيعه)
+    per_comp = []
     for cname, cdf in comp_dfs.items():
         cn_col = best_col(cdf, ["المنتج","اسم المنتج","Product","Name","name"])
         ci_col = best_col(cdf, ["ID","id","معرف","SKU","sku","الكود","code"])
-        for _, row in cdf.iterrows():
-            cp = str(row.get(cn_col,"")).strip()
-            if not cp or is_sample(cp): continue
-            cn = normalize(cp)
-            if not cn or cn in seen: continue
-            m = rf_process.extractOne(cn, our_norms, scorer=fuzz.token_sort_ratio, score_cutoff=70)
-            if m: continue
+        idx = (indices or {}).get(cname)
+        if idx is None or idx.name_col != cn_col:
+            idx, tab = None, catalog.table
+            nids = tab.intern(cdf[cn_col].fillna("").astype(str).tolist()) if cn_col else np.zeros(0, np.int32)
+        else:
+            tab, nids = idx.table, idx.name_ids
+        per_comp.append((cname, cdf, ci_col, idx, tab, nids.tolist()))
+
+    uniq = list(dict.fromkeys(
+        tab.norm[j] for _, _, _, _, tab, nids in per_comp
+        for j in nids if tab.valid[j] and tab.norm[j]))
+    covered = dict(zip(uniq, _covered(uniq, our_norms)))
+
+    missing, seen = [], set()
+    for cname, cdf, ci_col, idx, tab, nids in per_comp:
+        for i, j in enumerate(nids):
+            cn = tab.norm[j]
+            if not tab.valid[j] or not cn or cn in seen: continue
+            if covered.get(cn, True): continue
             seen.add(cn)
-            sz = extract_size(cp)
+            sz = tab.size[j]
             missing.append({
-                "منتج المنافس": cp,
-                "معرف المنافس": get_id(row, ci_col),
-                "سعر المنافس":  get_price(row),
+                "منتج المنافس": tab.raw[j].strip(),
+                "معرف المنافس": idx.ids[i] if idx is not None and idx.id_col == ci_col else get_id(cdf.iloc[i], ci_col),
+                "سعر المنافس":  idx.prices[i] if idx is not None else get_price(cdf.iloc[i]),
                 "المنافس":       cname,
-                "الماركة":       extract_brand(cp),
+                "الماركة":       tab.brand[j],
                 "الحجم":         f"{int(sz)}ml" if sz else "",
-                "النوع":         extract_type(cp),
+                "النوع":         tab.type[j],
             })
-    return pd.DataFrame(missing) if missing else pd.DataFrame()
+    if not missing: return pd.DataFrame()
+    return arrow_strings(pd.DataFrame(missing)) if ARROW_STRINGS else pd.DataFrame(missing)
 
 
 # ══ تصدير Excel ملوّن ════════════════════════
@@ -451,7 +1357,7 @@ def export_excel(df, sheet="النتائج"):
     from openpyxl.utils import get_column_letter
     output = io.BytesIO()
     edf = df.copy()
-    for c in ["جميع_المرشحين","جميع المرشحين"]:
+    for c in ["جميع_المرشحين","جميع المرشحين", *NAME_ID_COLS]:
         if c in edf.columns: edf.drop(columns=[c], inplace=True)
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
         edf.to_excel(writer, sheet_name=sheet[:31], index=False)
@@ -0,0 +1,411 @@
+"""
+engines/llm_client.py — عميل موحّد لكل استدعاءات LLM (Gemini / OpenRouter / Cohere)
+- requests.Session واحدة مع pool اتصالات + keep-alive (بدون TLS جديد لكل طلب)
+- إعادة المحاولة بتأخير أسّي مع jitter
+- تدوير مفاتيح Gemini مع تتبع صحة كل مفتاح وفترة تبريد بعد 429/الأخطاء
+- Token bucket لكل مفتاح يتعلّم حدوده من 429 و Retry-After
+- Hedging بين المزودين: إذا تأخر الأول عن p95 زمنه يبدأ البديل بالتوازي
+- بث الردود (streamGenerateContent) كمولّد نصوص يُحلَّل تدريجياً
+- عناوين الخدمات قابلة للتغيير (GEMINI_BASE_URL ...) للاختبار ضد خادم محلي
+"""
+import codecs, json, os, random, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from config import (GEMINI_API_KEYS, GEMINI_MODEL, GEMINI_RPM,
+                        OPENROUTER_API_KEY, COHERE_API_KEY)
+except Exception:
+    GEMINI_API_KEYS = []; GEMINI_MODEL = "gemini-2.0-flash"; GEMINI_RPM = 15
+    OPENROUTER_API_KEY = ""; COHERE_API_KEY = ""
+
+GEMINI_BASE    = os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+OPENROUTER_URL = os.environ.get("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+COHERE_URL     = os.environ.get("COHERE_URL", "https://api.cohere.ai/v1/generate")
+
+
+# ══ صحة المفاتيح + Token Bucket لكل مفتاح ═══════
+class KeyPool:
+    """
+    لكل مفتاح bucket بمعدل (طلب/ثانية) يُتعلَّم: 429 → المعدل الذي رُفض يصبح سقف المفتاح،
+    خفض المعدل ×0.7 وتفريغ الرصيد والتبريد حتى Retry-After | نجاح → رفع ×1.05 حتى السقف
+    ثم ×1.002 فوقه (تجسّس بطيء). بلا 429 لا سقف ثابت: مفاتيح الخطة المدفوعة تصل لحدها الفعلي.
+    pick() يختار المفتاح صاحب أكبر رصيد متاح، وإلا يعيد الانتظار الأدنى اللازم فقط.
+    """
+    def __init__(self, keys, rpm=15):
+        self._lock = threading.Lock()
+        rate = max(rpm, 1) / 60.0
+        now  = time.time()
+        self.stats = {k: dict(requests=0, ok=0, failed=0, throttled=0, streak=0,
+                              cool_until=0.0, rate=rate, ceil=float("inf"), tokens=max(1.0, rpm / 4),
+                              burst=max(1.0, rpm / 4), at=now,
+                              latency_sum=0.0, latency_max=0.0)
+                      for k in keys if k}
+
+    def __len__(self):
+        return len(self.stats)
+
+    def _refill(self, st, now):
+        st["tokens"] = min(st["burst"], st["tokens"] + (now - st["at"]) * st["rate"])
+        st["at"] = now
+
+    def pick(self, exclude=()):
+        """→ (مفتاح أو None, ثوانٍ حتى يتوفر رصيد في أقرب مفتاح)"""
+        now = time.time()
+        with self._lock:
+            keys = [k for k in self.stats if k not in exclude] or list(self.stats)
+            if not keys:
+                return None, 0.0
+            for k in keys:
+                self._refill(self.stats[k], now)
+            ready = [k for k in keys
+                     if self.stats[k]["cool_until"] <= now and self.stats[k]["tokens"] >= 1.0]
+            if not ready:
+                return None, min(max(self.stats[k]["cool_until"] - now,
+                                     (1.0 - self.stats[k]["tokens"]) / self.stats[k]["rate"])
+                                 for k in keys)
+            k = max(ready, key=lambda k: (self.stats[k]["tokens"], -self.stats[k]["streak"]))
+            self.stats[k]["tokens"] -= 1.0
+            self.stats[k]["requests"] += 1
+            return k, 0.0
+
+    def success(self, key, latency=0.0):
+        with self._lock:
+            st = self.stats[key]
+            st["ok"] += 1; st["streak"] = 0; st["cool_until"] = 0.0
+            st["rate"] *= 1.05 if st["rate"] * 1.05 <= st["ceil"] else 1.002
+            st["latency_sum"] += latency
+            st["latency_max"]  = max(st["latency_max"], latency)
+
+    def throttled(self, key, retry_after=None):
+        with self._lock:
+            st = self.stats[key]
+            st["throttled"] += 1; st["streak"] += 1
+            st["ceil"]   = st["rate"]
+            st["rate"]   = max(st["rate"] * 0.7, 1 / 120.0)
+            st["tokens"] = 0.0; st["at"] = time.time()
+            wait = retry_after if retry_after else min(60.0, 2.0 ** st["streak"])
+            st["cool_until"] = time.time() + wait * random.uniform(1.0, 1.2)
+
+    def failed(self, key, cooldown=None):
+        with self._lock:
+            st = self.stats[key]
+            st["failed"] += 1; st["streak"] += 1
+            wait = cooldown if cooldown is not None else min(30.0, 0.5 * 2 ** st["streak"])
+            st["cool_until"] = time.time() + wait
+
+    def throttled_total(self):
+        """مجموع ردود 429 على كل المفاتيح منذ إنشاء العميل"""
+        with self._lock:
+            return sum(v["throttled"] for v in self.stats.values())
+
+    def snapshot(self):
+        """عدادات كل مفتاح للعرض — المفتاح مختصر"""
+        now = time.time()
+        with self._lock:
+            return [{
+                "المفتاح": f"…{k[-6:]}", "طلبات": v["requests"], "نجاح": v["ok"],
+                "429": v["throttled"], "أخطاء": v["failed"],
+                "متوسط الزمن (ث)": round(v["latency_sum"] / v["ok"], 2) if v["ok"] else 0.0,
+                "أقصى زمن (ث)": round(v["latency_max"], 2),
+                "المعدل (طلب/د)": round(v["rate"] * 60, 1),
+                "تبريد (ث)": round(max(0.0, v["cool_until"] - now), 1),
+            } for k, v in self.stats.items()]
+
+
+def _retry_after(r):
+    try:
+        return float(r.headers.get("Retry-After", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+# ══ العميل ═══════════════════════════════════
+class LLMClient:
+    def __init__(self, gemini_keys=None, model=None, gemini_base=None,
+                 openrouter_key=None, openrouter_url=None,
+                 cohere_key=None, cohere_url=None,
+                 retries=3, backoff=0.5, max_backoff=8.0, pool_size=16,
+                 rpm=None, max_wait=60.0, hedge_floor=1.0, hedge_default=4.0):
+        self.keys           = KeyPool(GEMINI_API_KEYS if gemini_keys is None else gemini_keys,
+                                      rpm=GEMINI_RPM if rpm is None else rpm)
+        self.max_wait       = max_wait
+        self.model          = model or GEMINI_MODEL
+        self.gemini_base    = (gemini_base or GEMINI_BASE).rstrip("/")
+        self.openrouter_key = OPENROUTER_API_KEY if openrouter_key is None else openrouter_key
+        self.openrouter_url = openrouter_url or OPENROUTER_URL
+        self.cohere_key     = COHERE_API_KEY if cohere_key is None else cohere_key
+        self.cohere_url     = cohere_url or COHERE_URL
+        self.retries        = retries
+        self.backoff        = backoff
+        self.max_backoff    = max_backoff
+        self.hedge_floor    = hedge_floor
+        self.hedge_default  = hedge_default
+        self._lat           = {}            # مزود → آخر 100 زمن ناجح
+        self._lat_lock      = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _sleep(self, attempt):
+        """تأخير أسّي مع full jitter"""
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    # ── طلب عام مع إعادة المحاولة (بدون مفاتيح) ──
+    def post(self, url, payload, headers=None, timeout=30):
+        """→ Response بحالة 2xx أو None. يعيد المحاولة على 429/5xx/انقطاع الاتصال."""
+        for attempt in range(self.retries):
+            try:
+                r = self.session.post(url, json=payload, headers=headers, timeout=timeout)
+                if r.status_code < 300:
+                    return r
+                if r.status_code != 429 and r.status_code < 500:
+                    return None
+                ra = _retry_after(r)
+                if ra is not None and attempt + 1 < self.retries:
+                    time.sleep(min(ra, self.max_backoff)); continue
+            except requests.RequestException:
+                pass
+            if attempt + 1 < self.retries:
+                self._sleep(attempt)
+        return None
+
+    # ── Gemini مع تدوير المفاتيح ──
+    def gemini_url(self, stream=False):
+        op = "streamGenerateContent" if stream else "generateContent"
+        return f"{self.gemini_base}/models/{self.model}:{op}"
+
+    def gemini(self, payload, timeout=30):
+        """
+        → JSON الرد أو None. 429 → تبريد المفتاح والانتقال فوراً لمفتاح آخر.
+        إذا لم يتوفر رصيد في أي مفتاح ننتظر فقط حتى يتوفر (بحد max_wait إجمالاً).
+        """
+        if not len(self.keys):
+            return None
+        attempts = self.retries * len(self.keys)
+        attempt, deadline = 0, time.time() + self.max_wait
+        while attempt < attempts:
+            key, wait = self.keys.pick()
+            if key is None:
+                if time.time() + wait > deadline: break
+                time.sleep(max(wait, 0.01)); continue
+            attempt += 1
+            t0 = time.time()
+            try:
+                r = self.session.post(self.gemini_url(), json=payload, timeout=timeout,
+                                      headers={"x-goog-api-key": key})
+            except requests.RequestException:
+                self.keys.failed(key)
+                self._sleep(attempt // len(self.keys))
+                continue
+            if r.status_code == 200:
+                self.keys.success(key, time.time() - t0)
+                try:
+                    return r.json()
+                except ValueError:
+                    continue
+            if r.status_code == 429:
+                self.keys.throttled(key, _retry_after(r))
+            elif r.status_code in (401, 403):
+                self.keys.failed(key, cooldown=300.0)   # مفتاح غير صالح → تبريد طويل
+            elif r.status_code >= 500:
+                self.keys.failed(key)
+                self._sleep(attempt // len(self.keys))
+            else:
+                return None                              # 400: الطلب نفسه خاطئ
+        return None
+
+    def gemini_text(self, payload, timeout=30):
+        data = self.gemini(payload, timeout=timeout)
+        return gemini_text_of(data)
+
+    def gemini_stream(self, payload, timeout=30):
+        """
+        مولّد أجزاء النص من streamGenerateContent فور وصولها.
+        تدوير المفاتيح كما في gemini() لكن فقط قبل أول جزء — بعده لا إعادة
+        (لا نكرر نصاً ظهر للمستخدم). لا شيء يُولَّد إذا فشلت كل المحاولات.
+        """
+        if not len(self.keys):
+            return
+        attempts = self.retries * len(self.keys)
+        attempt, deadline = 0, time.time() + self.max_wait
+        while attempt < attempts:
+            key, wait = self.keys.pick()
+            if key is None:
+                if time.time() + wait > deadline: return
+                time.sleep(max(wait, 0.01)); continue
+            attempt += 1
+            t0 = time.time()
+            try:
+                r = self.session.post(self.gemini_url(stream=True), json=payload, timeout=timeout,
+                                      headers={"x-goog-api-key": key}, stream=True)
+            except requests.RequestException:
+                self.keys.failed(key)
+                self._sleep(attempt // len(self.keys))
+                continue
+            if r.status_code == 200:
+                got = False
+                try:
+                    for obj in _json_array_items(r.iter_content(chunk_size=None)):
+                        text = gemini_text_of(obj)
+                        if text:
+                            if not got:
+                                got = True
+                                self.keys.success(key, time.time() - t0)   # زمن أول جزء
+                            yield text
+                except requests.RequestException:
+                    if not got:
+                        self.keys.failed(key); continue
+                finally:
+                    r.close()
+                return
+            r.close()
+            if r.status_code == 429:
+                self.keys.throttled(key, _retry_after(r))
+            elif r.status_code in (401, 403):
+                self.keys.failed(key, cooldown=300.0)
+            elif r.status_code >= 500:
+                self.keys.failed(key)
+                self._sleep(attempt // len(self.keys))
+            else:
+                return
+
+    # ── OpenRouter / Cohere ──
+    def openrouter(self, messages, model="google/gemini-2.0-flash-001",
+                   temperature=0.3, max_tokens=4096, timeout=35):
+        if not self.openrouter_key: return None
+        r = self.post(self.openrouter_url, {
+            "model": model, "messages": messages,
+            "temperature": temperature, "max_tokens": max_tokens,
+        }, headers={"Authorization": f"Bearer {self.openrouter_key}"}, timeout=timeout)
+        try:
+            return r.json()["choices"][0]["message"]["content"] if r is not None else None
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+
+    def cohere(self, prompt, model="command-r-plus", temperature=0.3,
+               max_tokens=4096, timeout=35):
+        if not self.cohere_key: return None
+        r = self.post(self.cohere_url, {
+            "model": model, "prompt": prompt,
+            "max_tokens": max_tokens, "temperature": temperature,
+        }, headers={"Authorization": f"Bearer {self.cohere_key}"}, timeout=timeout)
+        try:
+            return r.json().get("generations", [{}])[0].get("text", "") if r is not None else None
+        except (ValueError, IndexError, AttributeError):
+            return None
+
+
+    # ── Hedging بين المزودين ──
+    def p95(self, name):
+        """مهلة التحوّط لمزود: p95 لأزمنته الأخيرة (hedge_default قبل 5 عينات)"""
+        with self._lat_lock:
+            xs = sorted(self._lat.get(name, ()))
+        if len(xs) < 5:
+            return self.hedge_default
+        return max(self.hedge_floor, xs[int(0.95 * (len(xs) - 1))])
+
+    def _timed(self, name, fn):
+        t0 = time.time()
+        out = fn()
+        if out:
+            with self._lat_lock:
+                self._lat.setdefault(name, deque(maxlen=100)).append(time.time() - t0)
+        return out
+
+    def hedged(self, calls):
+        """
+        calls: [(اسم المزود, دالة بلا معاملات تعيد نصاً أو None)] بترتيب الأولوية.
+        يبدأ الأول؛ إذا فشل أو لم يرد خلال p95 زمنه يبدأ التالي بالتوازي.
+        أول رد صالح يفوز؛ ما لم يبدأ بعد يُلغى، وما هو قيد التنفيذ يُهمل.
+        كل استدعاء بـ executor خاص بحجم السلسلة: الطلب الخاسر يكمل حتى مهلته
+        في خيطه دون أن يحجز عاملاً مشتركاً عن الاستدعاءات التالية.
+        → (النص, اسم المزود) أو (None, None)
+        """
+        if not calls:
+            return None, None
+        pending, running = list(calls), {}
+        pool = ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="llm-hedge")
+
+        def launch():
+            name, fn = pending.pop(0)
+            running[pool.submit(self._timed, name, fn)] = name
+            return name
+
+        try:
+            last = launch()
+            while running:
+                done, _ = wait(running, timeout=self.p95(last) if pending else None,
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    last = launch(); continue        # تأخر → تحوّط
+                for f in done:
+                    name = running.pop(f)
+                    try: out = f.result()
+                    except Exception: out = None
+                    if out:
+                        return out, name
+                if pending:
+                    last = launch()                  # فشل → البديل فوراً
+            return None, None
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def latency_stats(self):
+        """{مزود: (عدد, p50, p95)} للعرض"""
+        out = {}
+        with self._lat_lock:
+            items = {k: sorted(v) for k, v in self._lat.items()}
+        for k, xs in items.items():
+            if xs:
+                out[k] = (len(xs), xs[len(xs) // 2], xs[int(0.95 * (len(xs) - 1))])
+        return out
+
+
+def gemini_text_of(data):
+    """نص أول مرشح في رد Gemini أو None"""
+    try:
+        parts = data["candidates"][0]["content"]["parts"]
+        return "".join(p.get("text", "") for p in parts) or None
+    except (TypeError, KeyError, IndexError):
+        return None
+
+
+def _json_array_items(chunks):
+    """
+    عناصر مصفوفة JSON تصل مجزأة ([{..},\r\n{..}]) — كل عنصر يُعاد فور اكتماله.
+    فك UTF-8 تدريجي لأن الحرف العربي قد ينقسم بين جزأين.
+    """
+    dec, utf8 = json.JSONDecoder(), codecs.getincrementaldecoder("utf-8")("replace")
+    buf = ""
+    for chunk in chunks:
+        buf += utf8.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in "[],\r\n\t ":
+                pos += 1
+            if pos >= len(buf): break
+            try:
+                obj, pos2 = dec.raw_decode(buf, pos)
+            except ValueError:
+                break                       # العنصر لم يكتمل بعد
+            yield obj
+            pos = pos2
+        buf = buf[pos:]
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+def get_client():
+    """العميل المشترك للعملية (pool واحد لكل الوحدات)"""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = LLMClient()
+    return _CLIENT
@@ -0,0 +1,145 @@
+"""
+engines/profiling.py — cProfile + tracemalloc عند الطلب لـ run_analysis و find_missing
+
+التفعيل:
+- مرة واحدة من ⚙️ النظام: arm() → التشغيل القادم فقط (run_analysis ثم find_missing)
+- دائماً: متغير البيئة MAHWOUS_PROFILE=1
+
+كل جلسة في مجلد بتوقيتها تحت MAHWOUS_PROFILE_DIR (افتراضياً profiles/):
+    run_analysis.prof        ← pstats خام (snakeviz / python -m pstats)
+    run_analysis.txt         ← أعلى الدوال بالزمن التراكمي والذاتي
+    run_analysis_memory.txt  ← أعلى أسطر تخصيص الذاكرة + الذروة
+    summary.json             ← الزمن والذروة لكل دالة
+عند الإيقاف: فحص قيمة منطقية واحدة قبل الاستدعاء الأصلي — بلا cProfile ولا tracemalloc.
+"""
+import io, json, logging, os, threading, time, zipfile
+from datetime import datetime
+from functools import wraps
+
+PROFILE_DIR = os.environ.get("MAHWOUS_PROFILE_DIR", "profiles")
+ALWAYS      = os.environ.get("MAHWOUS_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+TARGETS     = ("run_analysis", "find_missing")
+
+log = logging.getLogger(__name__)
+
+_lock  = threading.Lock()
+_state = {"armed": False, "dir": None, "done": set()}
+_on    = [ALWAYS]   # يُقرأ في كل استدعاء — القيمة الوحيدة على المسار السريع
+
+
+def arm(on=True):
+    """تفعيل/إلغاء profiling للتشغيل القادم"""
+    with _lock:
+        _state["armed"] = bool(on)
+        _on[0] = ALWAYS or _state["armed"]
+
+
+def is_armed():
+    return _on[0]
+
+
+def _session(name):
+    """مجلد الجلسة الحالية؛ جلسة جديدة إذا سبق تسجيل نفس الدالة فيها"""
+    with _lock:
+        if _state["dir"] is None or name in _state["done"]:
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            d, k = os.path.join(PROFILE_DIR, stamp), 1
+            while os.path.exists(d):
+                k += 1; d = os.path.join(PROFILE_DIR, f"{stamp}-{k}")
+            os.makedirs(d)
+            _state["dir"], _state["done"] = d, set()
+        _state["done"].add(name)
+        if _state["done"] >= set(TARGETS):
+            _state["armed"] = False          # المرة الواحدة استُهلكت
+            _on[0] = ALWAYS
+        return _state["dir"]
+
+
+def _write(d, name, prof, snap, peak, wall):
+    import pstats
+    prof.dump_stats(os.path.join(d, f"{name}.prof"))
+    buf = io.StringIO()
+    st = pstats.Stats(prof, stream=buf).strip_dirs()
+    buf.write("══ الزمن التراكمي ══\n");  st.sort_stats("cumulative").print_stats(50)
+    buf.write("\n══ الزمن الذاتي ══\n");    st.sort_stats("tottime").print_stats(30)
+    with open(os.path.join(d, f"{name}.txt"), "w", encoding="utf-8") as f:
+        f.write(buf.getvalue())
+
+    lines = [f"الذروة: {peak / 2**20:.1f} MiB", "", "══ أعلى التخصيصات (بالسطر) ══"]
+    for s in snap.statistics("lineno")[:30]:
+        fr = s.traceback[0]
+        lines.append(f"{s.size / 2**20:9.2f} MiB  {s.count:8,}  {fr.filename}:{fr.lineno}")
+    with open(os.path.join(d, f"{name}_memory.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    path = os.path.join(d, "summary.json")
+    try:
+        with open(path, encoding="utf-8") as f: summary = json.load(f)
+    except (OSError, ValueError):
+        summary = {}
+    summary[name] = {"seconds": round(wall, 3), "peak_mib": round(peak / 2**20, 1)}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1)
+
+
+def _run(name, fn, args, kwargs):
+    import cProfile, tracemalloc
+    d = _session(name)
+    own = not tracemalloc.is_tracing()
+    if own: tracemalloc.start()
+    tracemalloc.reset_peak()
+    prof = cProfile.Profile()
+    t0 = time.perf_counter()
+    try:
+        out = prof.runcall(fn, *args, **kwargs)
+    finally:
+        wall = time.perf_counter() - t0
+        snap = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if own: tracemalloc.stop()
+        try: _write(d, name, prof, snap, peak, wall)
+        except OSError as e: log.warning("[profile] تعذّر الحفظ: %s", e)
+    log.info("[profile] %s → %s", name, d)
+    if hasattr(out, "attrs"):
+        out.attrs["profile"] = d
+    return out
+
+
+def profiled(name):
+    """مُزخرف: الاستدعاء الأصلي كما هو إلا إذا كان profiling مفعّلاً"""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _on[0]:
+                return fn(*args, **kwargs)
+            return _run(name, fn, args, kwargs)
+        return wrapper
+    return deco
+
+
+# ══ العرض والتنزيل ════════════════════════════
+def list_sessions(limit=10):
+    """أحدث مجلدات الجلسات أولاً"""
+    try:
+        names = sorted(os.listdir(PROFILE_DIR), reverse=True)
+    except OSError:
+        return []
+    return [os.path.join(PROFILE_DIR, n) for n in names
+            if os.path.isdir(os.path.join(PROFILE_DIR, n))][:limit]
+
+
+def session_summary(d):
+    try:
+        with open(os.path.join(d, "summary.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def zip_session(d):
+    """→ bytes لملف zip يحوي كل ملفات الجلسة"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        for n in sorted(os.listdir(d)):
+            z.write(os.path.join(d, n), arcname=os.path.join(os.path.basename(d), n))
+    return buf.getvalue()
@@ -0,0 +1,202 @@
+"""
+engines/scorer.py — مرحلة محلية ثانية قبل طابور Gemini
+المرشحون في المنطقة الغامضة (MATCH_THRESHOLD → AUTO_THRESHOLD) يمرّون أولاً
+على مقيّم محلي؛ الحالات الواضحة تُحسم هنا والباقي فقط يذهب لـ Gemini.
+
+- بدون نموذج مُدرَّب: قواعد ثابتة محافظة (فارق واضح + ماركة/حجم/نوع متطابقة + سعر قريب)
+- مع نموذج: انحدار لوجستي صغير يُدرَّب offline على الأحكام المسجّلة (جدول ai_verdicts):
+  أحكام Gemini المفهومة + تأكيد/رفض المستخدم للمطابقات (source=user، تغلب حكم Gemini
+  لنفس الزوج) بعتبة تضمن دقة مستهدفة على بيانات التدريب
+
+التدريب والتقييم على عينة محجوزة:
+    python -m engines.scorer --train [--precision 0.97]
+"""
+import argparse, hashlib, json, math, os, sys
+import numpy as np
+from rapidfuzz import fuzz
+
+SCORER_PATH = os.environ.get("MAHWOUS_SCORER", "local_scorer.json")
+
+FEATURES = ("top_score", "margin", "name_sim", "name_jacc",
+            "brand_eq", "size_eq", "type_eq", "price_dev", "n_cands")
+
+# كلمات لا تميّز العطر نفسه (النوع/الحجم/الجمهور) — تُحذف قبل مقارنة «الاسم الأساسي»
+_FILLER = {"edp", "edt", "edc", "parfum", "perfume", "eau", "de", "du", "spray", "ml", "مل",
+           "for", "men", "women", "man", "woman", "unisex", "new", "original", "edition",
+           "عطر", "او", "دو", "بارفان", "تواليت", "للرجال", "للنساء", "رجالي", "نسائي", "الجديد"}
+
+
+def _agree(a, b):
+    """1 متطابقان | -1 مختلفان | 0 أحدهما مجهول"""
+    if not a or not b: return 0
+    return 1 if a == b else -1
+
+
+def _core(norm, brand_norm):
+    """الاسم الأساسي: بدون كلمات الماركة والأرقام والكلمات العامة"""
+    drop = set(brand_norm.split())
+    return [t for t in norm.split()
+            if t not in drop and t not in _FILLER and not any(ch.isdigit() for ch in t)]
+
+
+def features(our_norm, our_price, brand, size, ptype, cands):
+    """متجه خصائص أفضل مرشح مقابل منتجنا (cands مرتبة تنازلياً بالـ score)"""
+    from engines.engine import normalize
+    top = cands[0]
+    s2  = cands[1]["score"] if len(cands) > 1 else 0.0
+    cp  = float(top.get("price") or 0)
+    dev = abs(math.log(cp / our_price)) if cp > 0 and our_price > 0 else 0.0
+    bn  = normalize(brand) if brand else ""
+    a, b = _core(our_norm, bn), _core(normalize(top["name"]), bn)
+    sa, sb = set(a), set(b)
+    return [
+        top["score"] / 100.0,
+        (top["score"] - s2) / 100.0,
+        fuzz.token_sort_ratio(" ".join(a), " ".join(b)) / 100.0,
+        len(sa & sb) / len(sa | sb) if sa | sb else 0.0,
+        _agree(str(brand).lower(), str(top.get("brand") or "").lower()),
+        _agree(int(size or 0), int(top.get("size") or 0)),
+        _agree(ptype, top.get("type") or ""),
+        min(dev, 2.0),
+        min(len(cands), 10) / 10.0,
+    ]
+
+
+def decision_features(row):
+    """
+    صف نتيجة (run_analysis) قرّر فيه المستخدم → متجه خصائص المطابقة المعروضة
+    المطابق المعروض يوضع أولاً ثم بقية المرشحين بترتيبهم؛ None إذا لا مطابق
+    """
+    from engines.engine import _features
+    name = str(row.get("منتج_المنافس") or "")
+    if not name or name == "—":
+        return None
+    cands = [c for c in (row.get("جميع_المرشحين") or []) if isinstance(c, dict) and c.get("name")]
+    top = next((c for c in cands if c["name"] == name), None)
+    if top is None:
+        top = {"name": name, "score": float(row.get("نسبة_التطابق") or 0),
+               "price": float(row.get("سعر_المنافس") or 0)}
+    cands = [top] + [c for c in cands if c is not top]
+    (norm,), (brand,), (size,), (ptype,) = _features([str(row.get("المنتج") or "")])
+    return features(norm, float(row.get("السعر") or 0), brand, size, ptype, cands)
+
+
+# ══ المقيّم ═════════════════════════════════
+class LocalScorer:
+    """
+    accept(f) → True إذا كان أفضل مرشح مؤكداً بما يكفي لتجاوز Gemini.
+    weights=None → القواعد الافتراضية.
+    """
+    def __init__(self, weights=None, bias=0.0, mean=None, std=None, threshold=0.9):
+        self.weights   = None if weights is None else np.asarray(weights, dtype=float)
+        self.bias      = bias
+        self.mean      = None if mean is None else np.asarray(mean, dtype=float)
+        self.std       = None if std is None else np.asarray(std, dtype=float)
+        self.threshold = threshold
+
+    @staticmethod
+    def rule(f):
+        top, margin, name_sim, _, brand_eq, size_eq, type_eq, dev, _ = f
+        return (top >= 0.75 and margin >= 0.05 and name_sim >= 0.90 and brand_eq == 1
+                and size_eq == 1 and type_eq >= 0 and dev <= 0.35)
+
+    def prob(self, X):
+        X = (np.atleast_2d(np.asarray(X, dtype=float)) - self.mean) / self.std
+        return 1.0 / (1.0 + np.exp(-(X @ self.weights + self.bias)))
+
+    def accept(self, f):
+        if self.weights is None:
+            return self.rule(f)
+        return bool(self.prob(f)[0] >= self.threshold)
+
+    # ── تدريب ──
+    @classmethod
+    def fit(cls, X, y, target_precision=0.97, l2=1e-3, iters=3000, lr=0.5):
+        """انحدار لوجستي (gradient descent) + أقل عتبة تحقق الدقة المستهدفة"""
+        X = np.asarray(X, dtype=float); y = np.asarray(y, dtype=float)
+        mean, std = X.mean(0), X.std(0)
+        std[std == 0] = 1.0
+        Z = (X - mean) / std
+        w, b = np.zeros(Z.shape[1]), 0.0
+        for _ in range(iters):
+            p = 1.0 / (1.0 + np.exp(-(Z @ w + b)))
+            g = p - y
+            w -= lr * (Z.T @ g / len(y) + l2 * w)
+            b -= lr * g.mean()
+        m = cls(w, b, mean, std, threshold=1.0)
+        p = m.prob(X)
+        for t in np.unique(np.round(p, 3)):
+            sel = p >= t
+            if sel.any() and y[sel].mean() >= target_precision:
+                m.threshold = float(t); break
+        return m
+
+    def to_dict(self):
+        if self.weights is None: return {"mode": "rules"}
+        return {"mode": "logistic", "features": FEATURES, "weights": self.weights.tolist(),
+                "bias": self.bias, "mean": self.mean.tolist(), "std": self.std.tolist(),
+                "threshold": self.threshold}
+
+    def save(self, path=None):
+        with open(path or SCORER_PATH, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path=None):
+        """النموذج المحفوظ أو القواعد الافتراضية إذا لم يوجد/تعذّرت قراءته"""
+        try:
+            with open(path or SCORER_PATH, encoding="utf-8") as f:
+                d = json.load(f)
+            if d.get("mode") == "logistic" and tuple(d["features"]) == FEATURES:
+                return cls(d["weights"], d["bias"], d["mean"], d["std"], d["threshold"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return cls()
+
+
+def evaluate(scorer, X, y):
+    """
+    على عينة أحكام Gemini: accepted = طلبات AI كانت ستُوفَّر،
+    agreement = نسبة اتفاق المقيّم مع Gemini فيما قبله
+    """
+    acc = [i for i, f in enumerate(X) if scorer.accept(f)]
+    agree = sum(y[i] for i in acc)
+    return {"n": len(X), "accepted": len(acc),
+            "avoided_rate": round(len(acc) / len(X), 3) if X else 0.0,
+            "agreement": round(agree / len(acc), 3) if acc else None}
+
+
+def _held_out(key, k=5):
+    """تقسيم ثابت بالمنتج (نفس المنتج لا يظهر في التدريب والاختبار معاً)"""
+    return int(hashlib.md5(key.encode()).hexdigest(), 16) % k == 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="تدريب/تقييم المقيّم المحلي على أحكام Gemini والمستخدم المسجّلة")
+    ap.add_argument("--train", action="store_true", help="تدريب وحفظ النموذج")
+    ap.add_argument("--precision", type=float, default=0.97, help="الدقة المستهدفة عند العتبة")
+    ap.add_argument("--out", default=None)
+    a = ap.parse_args(argv)
+
+    from utils.db_manager import get_verdicts
+    rows = get_verdicts()
+    if not rows:
+        print(json.dumps({"error": "لا توجد أحكام مسجّلة — شغّل تحليلاً مع AI أولاً"}, ensure_ascii=False))
+        return 1
+    train = [r for r in rows if not _held_out(r["our_norm"])]
+    test  = [r for r in rows if _held_out(r["our_norm"])]
+    Xte, yte = [r["features"] for r in test], [r["label"] for r in test]
+
+    out = {"train": len(train), "test": len(test),
+           "user": sum(1 for r in rows if r.get("source") == "user"),
+           "rules": evaluate(LocalScorer(), Xte, yte)}
+    if a.train and train and len({r["label"] for r in train}) == 2:
+        m = LocalScorer.fit([r["features"] for r in train], [r["label"] for r in train], a.precision)
+        m.save(a.out)
+        out["model"] = {"threshold": round(m.threshold, 3), "path": a.out or SCORER_PATH, **evaluate(m, Xte, yte)}
+    print(json.dumps(out, ensure_ascii=False, indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+engines/stats.py — مؤقّتات مراحل وعدّادات خفيفة لتشغيل التحليل
+
+    stats = RunStats()
+    with stats.stage("parse"): ...
+    stats.update(candidates=12, rejected_brand=3)
+    stats.report() → {"stages": {مرحلة: ثوانٍ}, "counters": {...}, "total": ثوانٍ}
+
+كائن واحد يُمرَّر عبر الصفحة → run_analysis → CompIndex.search؛ الزمن يُجمَّع
+لكل مرحلة (المرحلة نفسها قد تُدخل عدة مرات). آمن للخيوط.
+"""
+import threading, time
+from contextlib import contextmanager
+
+# الترتيب = ترتيب العرض
+STAGES = {
+    "parse":        "قراءة الملفات",
+    "index":        "بناء الفهارس",
+    "fuzzy":        "استخراج Fuzzy",
+    "rescore":      "إعادة التقييم",
+    "gemini_wait":  "انتظار Gemini",
+    "assemble":     "تجميع DataFrame",
+    "persist":      "حفظ اللقطة والذاكرة",
+    "other":        "أخرى (ذاكرة/مقيّم/صفوف)",
+    "find_missing": "المفقودات",
+}
+
+COUNTERS = {
+    "products":        "منتجات",
+    "candidates":      "مرشحون قُيّموا",
+    "rejected_brand":  "رُفض: ماركة",
+    "rejected_size":   "رُفض: حجم",
+    "rejected_type":   "رُفض: نوع",
+    "below_threshold": "تحت العتبة",
+    "memory_hits":     "من ذاكرة المطابقة",
+    "local_resolved":  "حسمها المقيّم المحلي",
+    "ai_items":        "أُرسلت لـ Gemini",
+    "ai_batches":      "دفعات Gemini",
+    "ai_cache_hits":   "من cache الـ AI",
+    "ai_429":          "429",
+}
+
+
+class RunStats:
+    def __init__(self):
+        self._lock    = threading.Lock()
+        self.stages   = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def update(self, **counts):
+        with self._lock:
+            for k, n in counts.items():
+                self.counters[k] = self.counters.get(k, 0) + n
+
+    def elapsed(self):
+        with self._lock:
+            return sum(self.stages.values())
+
+    def report(self):
+        with self._lock:
+            stages = {k: round(v, 4) for k, v in self.stages.items()}
+            counters = dict(self.counters)
+        return {"stages": stages, "counters": counters, "total": round(sum(stages.values()), 4)}
+
+    def line(self):
+        """سطر واحد للـ log"""
+        r = self.report()
+        return (" ".join(f"{k}={v:.2f}s" for k, v in r["stages"].items()) + " | "
+                + " ".join(f"{k}={v}" for k, v in r["counters"].items()))
+
+
+def breakdown(report):
+    """report() → صفوف عرض [{المرحلة, الزمن, النسبة}] بترتيب STAGES"""
+    stages, total = report.get("stages", {}), report.get("total") or 0
+    order = list(STAGES) + [k for k in stages if k not in STAGES]
+    return [{"المرحلة": STAGES.get(k, k), "الزمن (ث)": round(stages[k], 3),
+             "النسبة %": round(stages[k] / total * 100, 1) if total else 0.0}
+            for k in order if k in stages]
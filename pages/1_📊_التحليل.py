@@ -1,6 +1,6 @@
 """صفحة التحليل — رفع الملفات + تشغيل المحرك"""
 import streamlit as st
-import pandas as pd
+import time
 
 st.set_page_config(page_title="التحليل | مهووس", page_icon="📊", layout="wide")
 
@@ -9,7 +9,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from styles import apply
 apply(st)
 
-from engines.engine import read_file, run_analysis, find_missing, best_col
+# المحرك (pandas/rapidfuzz/SQLite) يُستورد عند رفع أول ملف — لا عند فتح الصفحة
+from engines.stats import RunStats, COUNTERS, breakdown
+
+stats = RunStats()   # زمن المراحل لهذا التشغيل (قراءة الملفات تحدث في نفس الـ rerun)
 
 st.title("📊 التحليل")
 
@@ -33,7 +36,9 @@ our_df = None
 our_name_col = our_price_col = our_id_col = None
 
 if our_file:
-    our_df, err = read_file(our_file)
+    from utils.uploads import parse_upload
+    with stats.stage("parse"):
+        our_df, err, guess = parse_upload(our_file)
     if err:
         st.error(f"❌ {err}")
         st.stop()
@@ -44,13 +49,13 @@ if our_file:
     col1, col2, col3 = st.columns(3)
     with col1:
         our_name_col = st.selectbox("📦 عمود المنتج", cols,
-            index=cols.index(best_col(our_df, ["المنتج","اسم المنتج","Product","Name","name"])))
+            index=cols.index(guess["name"]))
     with col2:
         our_price_col = st.selectbox("💰 عمود السعر", cols,
-            index=cols.index(best_col(our_df, ["السعر","سعر","Price","price"])))
+            index=cols.index(guess["price"]))
     with col3:
         id_options = ["(بدون)"] + cols
-        default_id = best_col(our_df, ["no","NO","No","معرف","ID","id","SKU","sku","الكود","رقم المنتج"])
+        default_id = guess["id"]
         default_idx = id_options.index(default_id) if default_id in id_options else 0
         our_id_col_sel = st.selectbox("🔢 عمود رقم المنتج (no)", id_options, index=default_idx)
         our_id_col = our_id_col_sel if our_id_col_sel != "(بدون)" else None
@@ -72,8 +77,10 @@ comp_files = st.file_uploader("ارفع ملفات المنافسين (1-5 مل
 comp_dfs = {}
 
 if comp_files:
+    from utils.uploads import parse_upload
     for cf in comp_files[:5]:
-        cdf, err = read_file(cf)
+        with stats.stage("parse"):
+            cdf, err, cguess = parse_upload(cf)
         if err:
             st.error(f"❌ {cf.name}: {err}")
             continue
@@ -84,11 +91,11 @@ if comp_files:
         c1, c2 = st.columns(2)
         with c1:
             cn_col = st.selectbox(f"عمود المنتج — {cname}", ccols,
-                index=ccols.index(best_col(cdf, ["المنتج","اسم المنتج","Product","Name","name"])),
+                index=ccols.index(cguess["name"]),
                 key=f"cn_{cf.name}")
         with c2:
             cp_col = st.selectbox(f"عمود السعر — {cname}", ccols,
-                index=ccols.index(best_col(cdf, ["السعر","سعر","Price","price"])),
+                index=ccols.index(cguess["price"]),
                 key=f"cp_{cf.name}")
         cdf = cdf.rename(columns={cn_col: "المنتج", cp_col: "السعر"})
         comp_dfs[cname] = cdf
@@ -99,12 +106,20 @@ st.subheader("3️⃣ خيارات")
 col_opt1, col_opt2 = st.columns(2)
 with col_opt1:
     use_ai = st.toggle("🤖 استخدام Gemini للحالات الغامضة", value=True)
+    delta  = st.toggle("♻️ وضع الدلتا — إعادة مطابقة ما تغيّر فقط", value=False)
 with col_opt2:
     st.caption("سيُستخدم Gemini فقط للمنتجات ذات نسبة تطابق 62-96%")
+    st.caption("الدلتا: يقارن مع آخر تحليل ويحدّث أسعار المطابقات الثابتة في مكانها")
+    if st.button("🧹 تفريغ الملفات والفهارس المخزّنة", help="يُعاد قراءة الملفات وبناء الفهارس في التشغيل القادم"):
+        from utils.uploads import clear_upload_cache
+        clear_upload_cache()
+        st.toast("تم تفريغ الذاكرة المؤقتة")
 
 # ══ زر التحليل ════════════════════════════════
 can_analyze = our_df is not None and len(comp_dfs) > 0
 if st.button("🚀 بدء التحليل", type="primary", disabled=not can_analyze, use_container_width=True):
+    import pandas as pd
+    from engines.engine import run_analysis, find_missing, build_indices, our_catalog
 
     rename_map = {}
     if our_name_col  and our_name_col  != "المنتج":        rename_map[our_name_col]  = "المنتج"
@@ -123,13 +138,55 @@ if st.button("🚀 بدء التحليل", type="primary", disabled=not can_anal
         pct  = int(p * 100)
         status_text.markdown(f"⚡ **التحليل: {pct}%** — تم معالجة {done:,}/{total_products:,} منتج")
 
+    # ── نتائج حية أثناء التحليل ──
+    live_counts = st.empty()
+    live_table  = st.empty()
+    live_rows   = []
+    live_state  = {"t": 0.0}
+
+    def on_chunk(rows, kind):
+        live_rows.extend(rows)
+        dec = pd.Series([r["القرار"] for r in live_rows]).value_counts()
+        ai  = sum(1 for r in live_rows if str(r.get("مصدر_المطابقة", "")).startswith("🤖"))
+        live_counts.markdown(
+            f"🔴 {dec.get('🔴 سعر أعلى', 0):,} | 🟢 {dec.get('🟢 سعر أقل', 0):,} | "
+            f"✅ {dec.get('✅ موافق عليها', 0):,} | ⚠️ {dec.get('⚠️ مراجعة', 0):,} | "
+            f"🔵 {dec.get('🔵 مفقود عند المنافس', 0):,} — 🤖 Gemini: {ai:,}")
+        if time.time() - live_state["t"] >= 1.0 or kind == "gemini":
+            live_state["t"] = time.time()
+            preview = pd.DataFrame(live_rows[-100:]).drop(columns=["جميع_المرشحين", "رقم_اسم_المنافس"], errors="ignore")
+            live_table.dataframe(preview, use_container_width=True, height=300)
+
     status_text.markdown("⏳ جاري التحضير...")
     try:
-        results = run_analysis(our_df, comp_dfs, progress_cb=on_progress, use_ai=use_ai)
+        with stats.stage("index"):
+            catalog = our_catalog(our_df)
+            indices = build_indices(comp_dfs)
+        results = run_analysis(our_df, comp_dfs, progress_cb=on_progress, use_ai=use_ai,
+                               delta=delta, indices=indices, catalog=catalog, on_chunk=on_chunk,
+                               stats=stats)
+        live_table.empty()
+        report  = results.attrs.get("delta")
+        if report and report["price_changes"]:
+            from utils.db_manager import upsert_price_history
+            # باقي أعمدة السجل من صف النتيجة — وإلا صفّر تحديث نفس اليوم ما سجّله التشغيل الكامل
+            rows = {(r["المنتج"], r["المنافس"]): r for r in results.to_dict("records")}
+            for ch in report["price_changes"]:
+                r = rows.get((ch["product"], ch["competitor"]), {})
+                upsert_price_history(ch["product"], ch["competitor"], ch["price"],
+                                     our_price=r.get("السعر", 0), diff=r.get("الفرق", 0),
+                                     match_score=r.get("نسبة_التطابق", 0),
+                                     decision=r.get("القرار", ""), product_id=ch["product_id"])
         status_text.markdown("🔍 البحث عن المفقودة...")
-        missing  = find_missing(our_df, comp_dfs)
+        with stats.stage("find_missing"):
+            missing  = find_missing(our_df, comp_dfs, indices=indices, catalog=catalog)
         progress_bar.progress(1.0)
         status_text.markdown("✅ **اكتمل!**")
+        run_stats = results.attrs["stats"] = stats.report()
+        from utils.db_manager import log_analysis
+        log_analysis(our_file.name, ", ".join(comp_dfs), total_products,
+                     int((results["منتج_المنافس"] != "—").sum()) if "منتج_المنافس" in results.columns else 0,
+                     len(missing) if missing is not None else 0, stats=run_stats)
 
         st.session_state.results = results
         st.session_state.missing  = missing
@@ -141,6 +198,32 @@ if st.button("🚀 بدء التحليل", type="primary", disabled=not can_anal
         c3.metric("✅ موافق عليها", dec.get("✅ موافق عليها", 0))
         c4.metric("⚠️ مراجعة",     dec.get("⚠️ مراجعة", 0))
         c5.metric("🔵 مفقود",       len(missing) if missing is not None and len(missing) > 0 else 0)
+        mm = results.attrs.get("match_memory")
+        if mm and mm["lookups"]:
+            st.caption(f"🧠 ذاكرة المطابقة: {mm['hits']:,}/{mm['lookups']:,} منتج "
+                       f"({mm['hit_rate']*100:.0f}%) — {mm['pairs']:,} زوج مؤكد بدون Fuzzy/Gemini")
+        ai = results.attrs.get("ai")
+        if ai and ai["batches"]:
+            st.caption(f"🤖 Gemini: {ai['batches']} دفعة (متوسط {ai['avg_batch']} منتج) — "
+                       f"{ai['prompt_tokens']:,} token برومبت | {ai['tokens_per_item']} لكل منتج محسوم"
+                       + (f" | {ai['parse_failures']} رد غير صالح" if ai["parse_failures"] else ""))
+        if ai and ai.get("local_checked"):
+            st.caption(f"🧮 المقيّم المحلي حسم {ai['local_resolved']:,}/{ai['local_checked']:,} "
+                       f"منتج غامض بدون Gemini")
+        with st.expander(f"⏱️ توزيع الزمن — {run_stats['total']:.1f} ث", expanded=True):
+            bd = pd.DataFrame(breakdown(run_stats))
+            sc1, sc2 = st.columns([3, 2])
+            with sc1:
+                st.bar_chart(bd.set_index("المرحلة")["الزمن (ث)"], horizontal=True)
+            with sc2:
+                st.dataframe(bd, use_container_width=True, hide_index=True)
+            cnt = run_stats["counters"]
+            st.caption(" | ".join(f"{label}: {cnt[k]:,}" for k, label in COUNTERS.items() if cnt.get(k)))
+        if results.attrs.get("profile"):
+            st.caption(f"🔬 profile محفوظ في `{results.attrs['profile']}` — التنزيل من ⚙️ النظام")
+        if report:
+            st.info(f"♻️ الدلتا: أُعيد استخدام **{report['reused']:,}** | أُعيدت مطابقة **{report['recomputed']:,}** | "
+                    f"تغيّر سعر {report['price_changed']:,} | صفوف منافسين: +{report['added']:,} / -{report['removed']:,}")
         st.success("✅ انتقل للأقسام من القائمة الجانبية لعرض النتائج")
 
     except Exception as e:
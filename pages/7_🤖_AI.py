@@ -6,7 +6,6 @@ import sys, os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from styles import apply; apply(st)
 
-from utils.ai_helper import chat, analyze_product
 try:
     from config import GEMINI_API_KEYS
 except Exception:
@@ -39,9 +38,8 @@ with tab1:
         with st.chat_message("user"):
             st.write(user_msg)
         with st.chat_message("assistant"):
-            with st.spinner("🤖 جاري التفكير..."):
-                reply = chat(user_msg, st.session_state.chat_history)
-                st.write(reply)
+            from utils.ai_helper import chat_stream
+            reply = st.write_stream(chat_stream(user_msg, st.session_state.chat_history))
         st.session_state.chat_history.append({"u": user_msg, "a": reply})
 
     if st.button("🗑️ مسح المحادثة"):
@@ -59,5 +57,6 @@ with tab2:
 
     if st.button("🤖 تحليل", type="primary", disabled=not product_name):
         with st.spinner("🤖 جاري التحليل..."):
+            from utils.ai_helper import analyze_product
             result = analyze_product(product_name, our_price, comp_price, comp_name, page_type)
             st.markdown(result)
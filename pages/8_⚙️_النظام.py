@@ -6,7 +6,6 @@ import sys, os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from styles import apply; apply(st)
 
-from utils.make_helper import test_connection, send_price_updates
 try:
     from config import (GEMINI_API_KEYS, WEBHOOK_UPDATE_PRICES,
                         WEBHOOK_NEW_PRODUCTS, MATCH_THRESHOLD, PRICE_TOLERANCE,
@@ -29,6 +28,7 @@ with tab1:
 
     if st.button("🔌 اختبار الاتصال", type="primary"):
         with st.spinner("جاري الاختبار..."):
+            from utils.make_helper import test_connection
             result = test_connection()
             if result["success"]:
                 st.success("✅ Make.com متصل!")
@@ -52,12 +52,29 @@ with tab1:
             "نسبة_التطابق": 98.0,
         }
         with st.spinner("جاري الإرسال..."):
-            result = send_price_updates([test_product])
+            from utils.make_helper import send_test_update
+            result = send_test_update(test_product)
             if result["success"]:
                 st.success(result["message"])
             else:
                 st.error(result["message"])
 
+    st.divider()
+    st.subheader("📦 الصندوق الصادر")
+    from utils.db_manager import outbox_stats
+    ob = outbox_stats()
+    labels = {"sent": "✅ مرسلة", "pending": "⏳ معلّقة", "failed": "❌ فاشلة"}
+    cols = st.columns(3)
+    for col, (k, lbl) in zip(cols, labels.items()):
+        n, p = ob.get(k, (0, 0))
+        col.metric(lbl, f"{n} دفعة", f"{p:,} منتج", delta_color="off")
+    if st.button("🔁 استئناف الإرسال المعلّق",
+                 disabled=not (ob.get("pending") or ob.get("failed"))):
+        with st.spinner("جاري الإرسال..."):
+            from utils.make_helper import resume_outbox
+            result = resume_outbox()
+        (st.success if result["success"] else st.error)(result["message"])
+
 # ══ الإعدادات ══════════════════════════════════
 with tab2:
     st.subheader("🔧 الإعدادات الحالية")
@@ -69,6 +86,44 @@ with tab2:
         st.metric("نطاق الموافقة", f"±{PRICE_TOLERANCE} ر.س")
         st.metric("النموذج", GEMINI_MODEL)
 
+    from utils.db_manager import match_memory_stats, cache_stats
+    mem = match_memory_stats()
+    st.caption("🧠 ذاكرة المطابقة: " + (" | ".join(f"{k}: {v:,}" for k, v in mem.items()) or "فارغة"))
+    cst = cache_stats()
+    st.caption("💾 cache ردود AI: " + (" | ".join(f"{k}: {v:,}" for k, v in cst.items()) or "فارغ"))
+
+    st.divider()
+    st.subheader("🔑 مفاتيح Gemini — الطلبات والتقييد والزمن")
+    # العميل يُنشأ مع أول طلب AI — قبله لا عدادات، فلا نستورده (requests) للعرض فقط
+    llm = sys.modules.get("engines.llm_client")
+    key_stats = llm.get_client().keys.snapshot() if llm else []
+    if key_stats:
+        st.dataframe(key_stats, use_container_width=True, hide_index=True)
+        st.caption("المعدل يُتعلَّم من ردود 429 و Retry-After — كل طلب يذهب للمفتاح صاحب أكبر رصيد")
+    elif GEMINI_API_KEYS:
+        st.info(f"{len(GEMINI_API_KEYS)} مفتاح — لا طلبات بعد في هذه العملية")
+    else:
+        st.info("لا توجد مفاتيح Gemini")
+
+    st.divider()
+    st.subheader("🔬 Profiling (cProfile + tracemalloc)")
+    from engines import profiling
+    if profiling.ALWAYS:
+        st.info("MAHWOUS_PROFILE=1 — كل تحليل يُسجَّل")
+    else:
+        armed = st.toggle("تسجيل profile للتحليل القادم (run_analysis + find_missing)",
+                          value=profiling.is_armed())
+        if armed != profiling.is_armed():
+            profiling.arm(armed)
+        st.caption("يُلغى تلقائياً بعد تشغيل واحد — أبطأ بوضوح أثناء التسجيل، وبلا أي كلفة عند الإيقاف")
+    sessions = profiling.list_sessions()
+    if sessions:
+        sel = st.selectbox("الجلسات المحفوظة", sessions, format_func=os.path.basename)
+        summ = profiling.session_summary(sel)
+        st.caption(" | ".join(f"{k}: {v['seconds']} ث، ذروة {v['peak_mib']} MiB" for k, v in summ.items()))
+        st.download_button("⬇️ تنزيل الجلسة (zip)", profiling.zip_session(sel),
+                           file_name=f"profile-{os.path.basename(sel)}.zip", mime="application/zip")
+
     st.divider()
     st.subheader("📝 إضافة Secrets في Streamlit Cloud")
     st.code("""
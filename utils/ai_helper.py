@@ -1,13 +1,7 @@
 """
 utils/ai_helper.py — Gemini للتحليل في صفحات النتائج
 """
-import requests, json, re, time
-try:
-    from config import GEMINI_API_KEYS
-except Exception:
-    GEMINI_API_KEYS = []
-
-_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+from engines.llm_client import get_client
 
 _PROMPTS = {
     "higher": "خبير تسعير عطور. سعرنا أعلى من المنافس. قيّم هل الفرق مبرر، واقترح سعراً مثالياً. أجب بالعربية بإيجاز.",
@@ -18,24 +12,40 @@ _PROMPTS = {
 }
 
 
-def _call(prompt, page="chat"):
+def _request(prompt, page):
+    """→ (payload لـ Gemini, رسائل OpenRouter)"""
     sys_p = _PROMPTS.get(page, _PROMPTS["chat"])
-    full  = f"{sys_p}\n\n{prompt}"
     payload = {
-        "contents": [{"parts": [{"text": full}]}],
+        "contents": [{"parts": [{"text": f"{sys_p}\n\n{prompt}"}]}],
         "generationConfig": {"temperature": 0.3, "maxOutputTokens": 1024, "topP": 0.9},
     }
-    for key in GEMINI_API_KEYS:
-        if not key: continue
-        try:
-            r = requests.post(f"{_URL}?key={key}", json=payload, timeout=30)
-            if r.status_code == 200:
-                return r.json()["candidates"][0]["content"]["parts"][0]["text"]
-            elif r.status_code == 429:
-                time.sleep(1)
-        except Exception:
-            continue
-    return None
+    return payload, [{"role": "system", "content": sys_p}, {"role": "user", "content": prompt}]
+
+
+def _call(prompt, page="chat"):
+    payload, msgs = _request(prompt, page)
+    # Gemini أولاً؛ إذا تأخر عن p95 زمنه يبدأ OpenRouter بالتوازي وأول رد يفوز
+    client = get_client()
+    txt, _ = client.hedged([
+        ("Gemini",     lambda: client.gemini_text(payload, timeout=30)),
+        ("OpenRouter", lambda: client.openrouter(msgs, max_tokens=1024, timeout=30)),
+    ])
+    return txt
+
+
+def _stream(prompt, page="chat"):
+    """
+    مولّد نص الرد: Gemini مبثوث جزءاً بجزء؛ إذا لم يصل أي جزء
+    (لا مفاتيح / 429 على الكل) نرجع لـ OpenRouter كرد واحد.
+    """
+    payload, msgs = _request(prompt, page)
+    client = get_client()
+    got = False
+    for piece in client.gemini_stream(payload, timeout=30):
+        got = True
+        yield piece
+    if not got:
+        yield client.openrouter(msgs, max_tokens=1024, timeout=30) or "❌ فشل الاتصال بـ Gemini"
 
 
 def analyze_product(product, our_price, comp_price, comp_name, page="higher"):
@@ -63,11 +73,20 @@ def bulk_analyze(items, page="higher"):
     return result or "❌ فشل الاتصال بـ Gemini"
 
 
-def chat(message, history=None):
-    """دردشة حرة"""
+def _chat_prompt(message, history):
     ctx = ""
     if history:
         ctx = "\n".join(f"المستخدم: {h['u']}\nAI: {h['a']}" for h in history[-6:])
         ctx += "\n\n"
-    result = _call(ctx + f"المستخدم: {message}", "chat")
+    return ctx + f"المستخدم: {message}"
+
+
+def chat(message, history=None):
+    """دردشة حرة"""
+    result = _call(_chat_prompt(message, history), "chat")
     return result or "❌ فشل الاتصال بـ Gemini"
+
+
+def chat_stream(message, history=None):
+    """دردشة حرة — مولّد لـ st.write_stream"""
+    return _stream(_chat_prompt(message, history), "chat")
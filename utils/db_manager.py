@@ -6,7 +6,7 @@ utils/db_manager.py - v18.0
 - سجل كامل بالتاريخ والوقت
 """
 import sqlite3, json
-from datetime import datetime
+from datetime import datetime, timedelta
 
 DB_PATH = "pricing_v18.db"
 
@@ -19,14 +19,24 @@ def _date():
     return datetime.now().strftime("%Y-%m-%d")
 
 
-def get_db():
+_READY = None   # المسار الذي أُنشئت جداوله — التهيئة عند أول اتصال لا عند الاستيراد
+
+
+def _open():
     conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def get_db():
+    if _READY != DB_PATH:
+        init_db()
+    return _open()
+
+
 def init_db():
-    conn = get_db()
+    global _READY
+    conn = _open()
     c = conn.cursor()
 
     # أحداث عامة
@@ -76,6 +86,47 @@ def init_db():
         comp_file TEXT, total_products INTEGER,
         matched INTEGER, missing INTEGER, summary TEXT
     )""")
+    # قواعد قديمة: عمود زمن المراحل والعدّادات (engines/stats.py)
+    try: c.execute("ALTER TABLE analysis_history ADD COLUMN stats TEXT")
+    except sqlite3.OperationalError: pass
+
+    # ذاكرة المطابقة — أزواج مؤكدة (تلقائي/Gemini/مستخدم) تُعاد بين التشغيلات،
+    # وأزواج رفضها المستخدم (source=rejected) تُستبعد من المرشحين
+    c.execute("""CREATE TABLE IF NOT EXISTS match_memory (
+        our_key TEXT, competitor TEXT, comp_key TEXT,
+        our_norm TEXT, comp_norm TEXT,
+        score REAL, source TEXT, updated_at TEXT,
+        PRIMARY KEY (our_key, competitor)
+    )""")
+
+    # أحكام Gemini على أفضل مرشح — بيانات تدريب المقيّم المحلي (engines/scorer.py)
+    c.execute("""CREATE TABLE IF NOT EXISTS ai_verdicts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT, our_norm TEXT, comp_norm TEXT,
+        features TEXT, label INTEGER, source TEXT
+    )""")
+
+    # إثراء المنتجات المفقودة (Fragrantica + وصف مهووس) — مفتاحه الاسم المطبّع
+    c.execute("""CREATE TABLE IF NOT EXISTS enrichment (
+        norm TEXT PRIMARY KEY, name TEXT,
+        image_url TEXT, top_notes TEXT, middle_notes TEXT, base_notes TEXT,
+        description_ar TEXT, description TEXT, fragrantica_url TEXT,
+        source TEXT, updated_at TEXT
+    )""")
+
+    # صندوق صادر Make.com — كل دفعة بمفتاح idempotency؛ المعلّق يُستأنف
+    c.execute("""CREATE TABLE IF NOT EXISTS make_outbox (
+        key TEXT PRIMARY KEY, push_id TEXT, kind TEXT, url TEXT,
+        payload TEXT, products INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'pending', attempts INTEGER DEFAULT 0,
+        last_error TEXT DEFAULT '', created_at TEXT, updated_at TEXT
+    )""")
+
+    # آخر ما وصل Make لكل منتج — الإرسال التالي يقتصر على ما تغيّر
+    c.execute("""CREATE TABLE IF NOT EXISTS make_ledger (
+        product_no TEXT PRIMARY KEY, action TEXT,
+        target_price REAL, sent_at TEXT
+    )""")
 
     # AI cache
     c.execute("""CREATE TABLE IF NOT EXISTS ai_cache (
@@ -86,6 +137,7 @@ def init_db():
 
     conn.commit()
     conn.close()
+    _READY = DB_PATH
 
 
 # ─── أحداث ────────────────────────────────
@@ -102,7 +154,14 @@ def log_event(page, event_type, details="", product_name="", action=""):
 
 # ─── قرارات ────────────────────────────────
 def log_decision(product_name, old_status, new_status, reason="",
-                 our_price=0, comp_price=0, diff=0, competitor=""):
+                 our_price=0, comp_price=0, diff=0, competitor="",
+                 comp_product="", our_id="", comp_id="", score=0, features=None):
+    """
+    يسجل قرار المستخدم. إذا أُعطي comp_product:
+    موافق → يُحفظ الزوج في ذاكرة المطابقة (source=user)
+    إزالة → يُحفظ كزوج مرفوض (source=rejected) لا يُقترح لهذا المنافس مجدداً
+    features (scorer.decision_features) → حكم مُعلَّم للمقيّم المحلي: موافق=1 | إزالة=0
+    """
     try:
         conn = get_db()
         conn.execute(
@@ -116,6 +175,28 @@ def log_decision(product_name, old_status, new_status, reason="",
         conn.commit(); conn.close()
     except: pass
 
+    if not (comp_product and competitor):
+        return
+    from engines.engine import normalize
+    our_norm = normalize(product_name)
+    our_key  = our_id or our_norm
+    accepted, rejected = "موافق" in str(new_status), "إزالة" in str(new_status)
+    if features is not None and (accepted or rejected):
+        log_verdicts([dict(our_norm=our_norm, comp_norm=normalize(comp_product),
+                           features=features, label=int(accepted), source="user")])
+    if accepted:
+        remember_matches([dict(
+            our_key=our_key, competitor=competitor,
+            comp_key=comp_id or normalize(comp_product),
+            our_norm=our_norm, comp_norm=normalize(comp_product),
+            score=score, source="user")])
+    elif rejected:
+        remember_matches([dict(
+            our_key=our_key, competitor=competitor,
+            comp_key=comp_id or normalize(comp_product),
+            our_norm=our_norm, comp_norm=normalize(comp_product),
+            score=score, source="rejected")])
+
 
 def get_decisions(product_name=None, status=None, limit=100):
     try:
@@ -139,6 +220,244 @@ def get_decisions(product_name=None, status=None, limit=100):
     except: return []
 
 
+# ─── ذاكرة المطابقة ─────────────────────────
+def remember_matches(pairs):
+    """
+    pairs: [{our_key, competitor, comp_key, our_norm, comp_norm, score, source}]
+    قرار المستخدم (user | rejected) لا يُستبدل إلا بقرار مستخدم آخر —
+    المطابقات التلقائية/Gemini لا تمحو رفضاً سابقاً.
+    """
+    if not pairs: return
+    try:
+        conn = get_db()
+        conn.executemany(
+            """INSERT INTO match_memory
+               (our_key,competitor,comp_key,our_norm,comp_norm,score,source,updated_at)
+               VALUES (:our_key,:competitor,:comp_key,:our_norm,:comp_norm,:score,:source,:ts)
+               ON CONFLICT(our_key,competitor) DO UPDATE SET
+                 comp_key=excluded.comp_key, our_norm=excluded.our_norm,
+                 comp_norm=excluded.comp_norm, score=excluded.score,
+                 source=excluded.source, updated_at=excluded.updated_at
+               WHERE match_memory.source NOT IN ('user','rejected')
+                  OR excluded.source IN ('user','rejected')""",
+            [{**p, "ts": _ts()} for p in pairs]
+        )
+        conn.commit(); conn.close()
+    except: pass
+
+
+def forget_matches(keys):
+    """keys: [(our_key, competitor)] — إبطال أزواج تغيّر اسمها المطبّع"""
+    if not keys: return
+    try:
+        conn = get_db()
+        conn.executemany("DELETE FROM match_memory WHERE our_key=? AND competitor=?", list(keys))
+        conn.commit(); conn.close()
+    except: pass
+
+
+def load_match_memory():
+    """→ {our_key: [صفوف]}"""
+    out = {}
+    try:
+        conn = get_db()
+        for r in conn.execute("SELECT * FROM match_memory").fetchall():
+            out.setdefault(r["our_key"], []).append(dict(r))
+        conn.close()
+    except: pass
+    return out
+
+
+def match_memory_stats():
+    """عدد الأزواج المحفوظة حسب المصدر"""
+    try:
+        conn = get_db()
+        rows = conn.execute(
+            "SELECT source, COUNT(*) AS n FROM match_memory GROUP BY source"
+        ).fetchall()
+        conn.close()
+        return {r["source"]: r["n"] for r in rows}
+    except: return {}
+
+
+# ─── أحكام Gemini (تدريب المقيّم المحلي) ────
+def log_verdicts(rows):
+    """rows: [{our_norm, comp_norm, features[], label 1=اختار أفضل مرشح, source}]"""
+    if not rows: return
+    try:
+        conn = get_db()
+        conn.executemany(
+            """INSERT INTO ai_verdicts (timestamp,our_norm,comp_norm,features,label,source)
+               VALUES (?,?,?,?,?,?)""",
+            [(_ts(), r["our_norm"], r["comp_norm"], json.dumps(r["features"]),
+              int(r["label"]), r.get("source", "gemini")) for r in rows]
+        )
+        conn.commit(); conn.close()
+    except: pass
+
+
+def get_verdicts(limit=None):
+    """حكم واحد لكل (منتجنا, المرشح) — قرار المستخدم يغلب، ثم الأحدث"""
+    try:
+        conn = get_db()
+        rows = conn.execute(
+            """SELECT * FROM ai_verdicts WHERE id IN
+               (SELECT COALESCE(MAX(CASE WHEN source='user' THEN id END), MAX(id))
+                FROM ai_verdicts GROUP BY our_norm, comp_norm)
+               ORDER BY id DESC""" + (" LIMIT ?" if limit else ""),
+            (limit,) if limit else ()
+        ).fetchall()
+        conn.close()
+        out = []
+        for r in rows:
+            d = dict(r)
+            d["features"] = json.loads(d["features"])
+            out.append(d)
+        return out
+    except: return []
+
+
+# ─── إثراء المنتجات المفقودة ────────────────
+_NOTES = ("top_notes", "middle_notes", "base_notes")
+
+def save_enrichment(rows):
+    """rows: [{norm, name, image_url, top_notes[], middle_notes[], base_notes[], description_ar, description, fragrantica_url, source}]"""
+    if not rows: return
+    try:
+        conn = get_db()
+        conn.executemany(
+            """INSERT OR REPLACE INTO enrichment
+               (norm,name,image_url,top_notes,middle_notes,base_notes,
+                description_ar,description,fragrantica_url,source,updated_at)
+               VALUES (:norm,:name,:image_url,:top_notes,:middle_notes,:base_notes,
+                       :description_ar,:description,:fragrantica_url,:source,:ts)""",
+            [{"image_url": "", "description_ar": "", "description": "",
+              "fragrantica_url": "", "source": "", **r, "ts": _ts(),
+              **{k: json.dumps(r.get(k) or [], ensure_ascii=False) for k in _NOTES}}
+             for r in rows]
+        )
+        conn.commit(); conn.close()
+    except: pass
+
+
+def load_enrichment(norms=None):
+    """→ {norm: صف} — كل الجدول أو الأسماء المطلوبة فقط"""
+    out = {}
+    try:
+        conn = get_db()
+        if norms is None:
+            rows = conn.execute("SELECT * FROM enrichment").fetchall()
+        else:
+            norms, rows = list(norms), []
+            for i in range(0, len(norms), 500):
+                part = norms[i:i+500]
+                rows += conn.execute(
+                    f"SELECT * FROM enrichment WHERE norm IN ({','.join('?'*len(part))})", part
+                ).fetchall()
+        conn.close()
+        for r in rows:
+            d = dict(r)
+            for k in _NOTES:
+                try: d[k] = json.loads(d[k] or "[]")
+                except: d[k] = []
+            out[d["norm"]] = d
+    except: pass
+    return out
+
+
+# ─── صندوق صادر Make.com ───────────────────
+def outbox_add(rows, resend_after_s=86400):
+    """
+    rows: [{key, push_id, kind, url, payload(dict), products}]
+    دفعة بنفس المفتاح أُرسلت خلال resend_after_s لا تُعاد (idempotency).
+    """
+    if not rows: return
+    try:
+        since = (datetime.now() - timedelta(seconds=resend_after_s)).strftime("%Y-%m-%d %H:%M:%S")
+        conn = get_db()
+        conn.executemany(
+            """INSERT INTO make_outbox (key,push_id,kind,url,payload,products,status,created_at,updated_at)
+               VALUES (:key,:push_id,:kind,:url,:payload,:products,'pending',:ts,:ts)
+               ON CONFLICT(key) DO UPDATE SET
+                 push_id=excluded.push_id, url=excluded.url, payload=excluded.payload,
+                 status='pending', attempts=0, last_error='', updated_at=excluded.updated_at
+               WHERE make_outbox.status != 'sent' OR make_outbox.updated_at < :since""",
+            [{**r, "payload": json.dumps(r["payload"], ensure_ascii=False, default=str),
+              "ts": _ts(), "since": since} for r in rows]
+        )
+        conn.commit(); conn.close()
+    except: pass
+
+
+def outbox_pending(kind=None):
+    """الدفعات غير المرسلة (الأقدم أولاً)"""
+    try:
+        conn = get_db()
+        q = "SELECT * FROM make_outbox WHERE status != 'sent'"
+        rows = conn.execute(q + (" AND kind=?" if kind else "") + " ORDER BY created_at, key",
+                            (kind,) if kind else ()).fetchall()
+        conn.close()
+        out = []
+        for r in rows:
+            d = dict(r); d["payload"] = json.loads(d["payload"])
+            out.append(d)
+        return out
+    except: return []
+
+
+def outbox_mark(key, status, error=""):
+    try:
+        conn = get_db()
+        conn.execute(
+            """UPDATE make_outbox SET status=?, attempts=attempts+1, last_error=?, updated_at=?
+               WHERE key=?""", (status, error[:200], _ts(), key))
+        conn.commit(); conn.close()
+    except: pass
+
+
+def outbox_stats():
+    """{الحالة: (دفعات, منتجات)}"""
+    try:
+        conn = get_db()
+        rows = conn.execute(
+            "SELECT status, COUNT(*) AS n, SUM(products) AS p FROM make_outbox GROUP BY status"
+        ).fetchall()
+        conn.close()
+        return {r["status"]: (r["n"], r["p"] or 0) for r in rows}
+    except: return {}
+
+
+# ─── سجل ما أُرسل لـ Make ───────────────────
+def ledger_get(product_nos):
+    """→ {product_no: (action, target_price, sent_at)} للمنتجات المطلوبة"""
+    out = {}
+    try:
+        nos = list(product_nos)
+        conn = get_db()
+        for i in range(0, len(nos), 500):
+            part = nos[i:i+500]
+            for r in conn.execute(
+                f"SELECT * FROM make_ledger WHERE product_no IN ({','.join('?'*len(part))})", part
+            ).fetchall():
+                out[r["product_no"]] = (r["action"], r["target_price"], r["sent_at"])
+        conn.close()
+    except: pass
+    return out
+
+
+def ledger_record(items):
+    """items: [{product_no, action, competitor_price}] — بعد وصول الدفعة فعلاً"""
+    if not items: return
+    try:
+        conn = get_db()
+        conn.executemany(
+            "INSERT OR REPLACE INTO make_ledger (product_no,action,target_price,sent_at) VALUES (?,?,?,?)",
+            [(p["product_no"], p["action"], float(p["competitor_price"]), _ts()) for p in items]
+        )
+        conn.commit(); conn.close()
+    except: pass
+
+
 # ─── تاريخ الأسعار (الميزة الذكية) ──────────
 def upsert_price_history(product_name, competitor, price,
                           our_price=0, diff=0, match_score=0,
@@ -295,15 +614,57 @@ def get_last_job():
     return None
 
 
+# ─── cache ردود AI ─────────────────────────
+def cache_get(prompt_hash, max_age_s):
+    """الرد المخزّن إذا كان أحدث من max_age_s ثانية، وإلا None"""
+    try:
+        since = (datetime.now() - timedelta(seconds=max_age_s)).strftime("%Y-%m-%d %H:%M:%S")
+        conn = get_db()
+        row = conn.execute(
+            "SELECT response FROM ai_cache WHERE prompt_hash=? AND timestamp>=?",
+            (prompt_hash, since)
+        ).fetchone()
+        conn.close()
+        return json.loads(row["response"]) if row else None
+    except: return None
+
+
+def cache_set(prompt_hash, response, source=""):
+    try:
+        conn = get_db()
+        conn.execute(
+            """INSERT INTO ai_cache (timestamp,prompt_hash,response,source) VALUES (?,?,?,?)
+               ON CONFLICT(prompt_hash) DO UPDATE SET
+                 timestamp=excluded.timestamp, response=excluded.response, source=excluded.source""",
+            (_ts(), prompt_hash, json.dumps(response, ensure_ascii=False, default=str), source)
+        )
+        conn.commit(); conn.close()
+    except: pass
+
+
+def cache_stats():
+    """عدد الردود المخزّنة لكل نوع"""
+    try:
+        conn = get_db()
+        rows = conn.execute(
+            "SELECT source, COUNT(*) AS n FROM ai_cache GROUP BY source"
+        ).fetchall()
+        conn.close()
+        return {r["source"]: r["n"] for r in rows}
+    except: return {}
+
+
 # ─── سجل التحليلات ─────────────────────────
-def log_analysis(our_file, comp_file, total, matched, missing, summary=""):
+def log_analysis(our_file, comp_file, total, matched, missing, summary="", stats=None):
+    """stats: RunStats.report() — زمن كل مرحلة + العدّادات"""
     try:
         conn = get_db()
         conn.execute(
             """INSERT INTO analysis_history
-               (timestamp,our_file,comp_file,total_products,matched,missing,summary)
-               VALUES (?,?,?,?,?,?,?)""",
-            (_ts(), our_file, comp_file, total, matched, missing, summary)
+               (timestamp,our_file,comp_file,total_products,matched,missing,summary,stats)
+               VALUES (?,?,?,?,?,?,?,?)""",
+            (_ts(), our_file, comp_file, total, matched, missing, summary,
+             json.dumps(stats or {}, ensure_ascii=False))
         )
         conn.commit(); conn.close()
     except: pass
@@ -316,7 +677,13 @@ def get_analysis_history(limit=20):
             "SELECT * FROM analysis_history ORDER BY id DESC LIMIT ?", (limit,)
         ).fetchall()
         conn.close()
-        return [dict(r) for r in rows]
+        out = []
+        for r in rows:
+            d = dict(r)
+            try: d["stats"] = json.loads(d.get("stats") or "{}")
+            except: d["stats"] = {}
+            out.append(d)
+        return out
     except: return []
 
 
@@ -335,6 +702,3 @@ def get_events(page=None, limit=50):
         conn.close()
         return [dict(r) for r in rows]
     except: return []
-
-
-init_db()
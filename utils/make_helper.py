@@ -1,13 +1,27 @@
 """
 utils/make_helper.py — تكامل Make.com
+- الإرسال على دفعات محدودة الحجم بالتوازي (MAKE_PARALLEL)
+- مفتاح idempotency لكل دفعة + إعادة المحاولة بتأخير أسّي
+- صندوق صادر في SQLite: ما فشل يُستأنف في الإرسال التالي أو بـ resume_outbox()
+- سجل ما وصل (make_ledger): send_price_updates(only_changed=True) يرسل ما تغيّر فقط
 """
+import hashlib, json, random, time, uuid
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 try:
-    from config import WEBHOOK_UPDATE_PRICES, WEBHOOK_NEW_PRODUCTS
+    from config import (WEBHOOK_UPDATE_PRICES, WEBHOOK_NEW_PRODUCTS,
+                        MAKE_CHUNK_SIZE, MAKE_CHUNK_BYTES, MAKE_PARALLEL, MAKE_RETRIES)
 except Exception:
     WEBHOOK_UPDATE_PRICES = ""
     WEBHOOK_NEW_PRODUCTS  = ""
+    MAKE_CHUNK_SIZE = 200; MAKE_CHUNK_BYTES = 200_000; MAKE_PARALLEL = 3; MAKE_RETRIES = 4
+try:
+    from utils import db_manager as _dbm
+except Exception:
+    _dbm = None
+
+_session = requests.Session()
 
 
 def _action(decision):
@@ -17,67 +31,227 @@ def _action(decision):
     return "review"
 
 
-def send_price_updates(products):
+# ══ الإرسال على دفعات ═════════════════════════
+def _chunks(products, max_items=MAKE_CHUNK_SIZE, max_bytes=MAKE_CHUNK_BYTES):
+    """تقسيم بحد أقصى للعدد وللحجم (JSON) — منتج أكبر من الحد يُرسل وحده"""
+    out, cur, size = [], [], 0
+    for p in products:
+        n = len(json.dumps(p, ensure_ascii=False).encode()) + 1
+        if cur and (len(cur) >= max_items or size + n > max_bytes):
+            out.append(cur); cur, size = [], 0
+        cur.append(p); size += n
+    if cur: out.append(cur)
+    return out
+
+
+def _post(url, payload, key, retries=MAKE_RETRIES, backoff=1.0, timeout=30):
+    """→ (نجح؟, رسالة الخطأ). يعيد على انقطاع/مهلة/429/5xx فقط."""
+    err = ""
+    for attempt in range(retries):
+        try:
+            r = _session.post(url, json=payload, timeout=timeout,
+                              headers={"Content-Type": "application/json", "Idempotency-Key": key})
+            if r.status_code in (200, 201, 202):
+                return True, ""
+            err = f"Make رد بـ {r.status_code}"
+            if r.status_code != 429 and r.status_code < 500:
+                return False, err
+            try: wait = float(r.headers.get("Retry-After", ""))
+            except ValueError: wait = None
+        except requests.Timeout:
+            err, wait = "انتهت مهلة الاتصال", None
+        except requests.RequestException as e:
+            err, wait = str(e)[:120], None
+        if attempt + 1 < retries:
+            time.sleep(wait if wait is not None else random.uniform(0, backoff * 2 ** attempt))
+    return False, err
+
+
+def _send_outbox(rows, parallel=MAKE_PARALLEL):
+    """إرسال دفعات الصندوق بالتوازي وتحديث حالة كل دفعة → (منتجات أُرسلت, دفعات فشلت, آخر خطأ)"""
+    sent, failed, err = 0, 0, ""
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as ex:
+        futs = {ex.submit(_post, r["url"], r["payload"], r["key"]): r for r in rows}
+        for f in as_completed(futs):
+            r = futs[f]
+            ok, e = f.result()
+            if _dbm:
+                _dbm.outbox_mark(r["key"], "sent" if ok else "failed", e)
+                if ok and r["kind"] == "update":
+                    _dbm.ledger_record(r["payload"]["products"])
+            if ok: sent += r["products"]
+            else:  failed += 1; err = e
+    return sent, failed, err
+
+
+def _push(kind, url, products, noun="منتج", versions=None):
+    """
+    products → دفعات في الصندوق الصادر ثم إرسال كل المعلّق من نفس النوع
+    (بما فيه دفعات فشلت سابقاً). مفتاح الدفعة = hash المحتوى، لذلك إعادة
+    الضغط على «إرسال» لا تكرر دفعة وصلت خلال آخر 24 ساعة.
+    versions: {product_no: آخر قيد في السجل} — يدخل في المفتاح، فالسعر الذي
+    يعود لقيمة سابقة (90 → 80 → 90) يُرسل من جديد بدل اعتباره مكرراً.
+    """
+    if not url:
+        return {"success": False, "message": "❌ رابط Webhook غير مضبوط"}
+    push_id, ts = uuid.uuid4().hex[:12], datetime.now().isoformat()
+    parts = _chunks(products)
+    rows = []
+    for i, part in enumerate(parts):
+        ver = [versions.get(p.get("product_no")) for p in part] if versions is not None else None
+        key = hashlib.sha256(json.dumps([kind, url, part, ver], ensure_ascii=False,
+                                        sort_keys=True, default=str).encode()).hexdigest()[:32]
+        rows.append({"key": key, "push_id": push_id, "kind": kind, "url": url, "products": len(part),
+                     "payload": {"products": part, "timestamp": ts, "total": len(part),
+                                 "source": "mahwous_v20", "push_id": push_id,
+                                 "chunk": i + 1, "chunks": len(parts), "idempotency_key": key}})
+    if _dbm:
+        _dbm.outbox_add(rows)
+        pending = _dbm.outbox_pending(kind)
+    else:
+        pending = rows
+    keys = {r["key"] for r in rows}
+    resumed = sum(1 for r in pending if r["key"] not in keys)
+    skipped = len(rows) - sum(1 for r in pending if r["key"] in keys)
+
+    sent, failed, err = _send_outbox(pending)
+    note = (f" | استئناف {resumed} دفعة سابقة" if resumed else "") + \
+           (f" | {skipped} دفعة أُرسلت مسبقاً" if skipped else "")
+    if failed:
+        return {"success": False, "count": sent,
+                "message": f"⚠️ أُرسل {sent} {noun} — فشلت {failed} دفعة ({err}) وستُستأنف لاحقاً{note}"}
+    return {"success": True, "count": sent,
+            "message": f"✅ تم إرسال {sent} {noun} لـ Make.com على {len(pending)} دفعة{note}"}
+
+
+def resume_outbox():
+    """إعادة إرسال كل الدفعات المعلّقة/الفاشلة"""
+    pending = _dbm.outbox_pending() if _dbm else []
+    if not pending:
+        return {"success": True, "count": 0, "message": "✅ لا توجد دفعات معلّقة"}
+    sent, failed, err = _send_outbox(pending)
+    if failed:
+        return {"success": False, "count": sent,
+                "message": f"⚠️ أُرسل {sent} منتج — ما زالت {failed} دفعة معلّقة ({err})"}
+    return {"success": True, "count": sent, "message": f"✅ استُؤنف إرسال {sent} منتج"}
+
+
+def _price_items(products):
+    items = [{
+        "product_no":          str(p.get("معرف_المنتج", p.get("no", ""))),
+        "name":                str(p.get("المنتج", "")),
+        "current_price":       float(p.get("السعر", 0)),
+        "competitor_price":    float(p.get("سعر_المنافس", p.get("سعر المنافس", 0))),
+        "diff":                float(p.get("الفرق", 0)),
+        "action":              _action(p.get("القرار", "")),
+        "competitor":          str(p.get("المنافس", "")),
+        "brand":               str(p.get("الماركة", "")),
+        "match_score":         float(p.get("نسبة_التطابق", p.get("نسبة التطابق", 0))),
+    } for p in products]
+    # استبعاد المنتجات بدون رقم
+    return [p for p in items if p["product_no"]]
+
+
+def _changed(items, sent=None):
+    """ما تغيّر إجراؤه أو سعره المستهدف منذ آخر إرسال وصل (أو لم يُرسل قط)"""
+    if sent is None:
+        sent = _dbm.ledger_get({p["product_no"] for p in items}) if _dbm else {}
+    out = []
+    for p in items:
+        prev = sent.get(p["product_no"])
+        if prev is None or prev[0] != p["action"] or abs((prev[1] or 0) - p["competitor_price"]) > 0.01:
+            out.append(p)
+    return out
+
+
+def preview_price_updates(products):
+    """معاينة بدون إرسال → {total, changed, unchanged, no_id}"""
+    items = _price_items(products)
+    changed = len(_changed(items))
+    return {"total": len(items), "changed": changed,
+            "unchanged": len(items) - changed, "no_id": len(products) - len(items)}
+
+
+def send_price_updates(products, url=None, only_changed=False):
+    """
+    only_changed=True → ما تغيّر منذ آخر إرسال وصل فقط (make_ledger)؛
+    الافتراضي يرسل كل المنتجات كما كان (يبقى مفتاح الدفعة يمنع تكرار نفس المحتوى خلال 24 ساعة)
+    """
     if not products:
         return {"success": False, "message": "لا توجد منتجات"}
     try:
-        payload = {
-            "products": [{
-                "product_no":          str(p.get("معرف_المنتج", p.get("no", ""))),
-                "name":                str(p.get("المنتج", "")),
-                "current_price":       float(p.get("السعر", 0)),
-                "competitor_price":    float(p.get("سعر_المنافس", p.get("سعر المنافس", 0))),
-                "diff":                float(p.get("الفرق", 0)),
-                "action":              _action(p.get("القرار", "")),
-                "competitor":          str(p.get("المنافس", "")),
-                "brand":               str(p.get("الماركة", "")),
-                "match_score":         float(p.get("نسبة_التطابق", p.get("نسبة التطابق", 0))),
-            } for p in products],
-            "timestamp": datetime.now().isoformat(),
-            "total":     len(products),
-            "source":    "mahwous_v20",
-        }
-        # استبعاد المنتجات بدون رقم
-        payload["products"] = [p for p in payload["products"] if p["product_no"]]
-        if not payload["products"]:
+        items = _price_items(products)
+        if not items:
             return {"success": False, "message": "❌ لا يوجد معرف_المنتج — تأكد من اختيار عمود 'no'"}
-        r = requests.post(WEBHOOK_UPDATE_PRICES, json=payload,
-                          headers={"Content-Type": "application/json"}, timeout=30)
-        if r.status_code in (200, 201, 202):
-            return {"success": True,
-                    "message": f"✅ تم إرسال {len(payload['products'])} منتج لـ Make.com",
-                    "count": len(payload["products"])}
-        return {"success": False, "message": f"❌ Make رد بـ {r.status_code}"}
-    except requests.Timeout:
-        return {"success": False, "message": "❌ انتهت مهلة الاتصال"}
+        if only_changed:
+            # المعلّق من إرسال سابق يُرسل أولاً ليدخل السجل — وإلا لاعتُبر «متغيراً» وتكرر
+            pending = _dbm.outbox_pending("update") if _dbm else []
+            if pending: _send_outbox(pending)
+            skipped = len(items)
+            ledger = _dbm.ledger_get({p["product_no"] for p in items}) if _dbm else {}
+            items = _changed(items, ledger)
+            skipped -= len(items)
+            if not items:
+                return {"success": True, "count": 0,
+                        "message": f"✅ لا تغييرات منذ آخر إرسال ({skipped} منتج بدون تغيير)"}
+        result = _push("update", url or WEBHOOK_UPDATE_PRICES, items,
+                       versions=ledger if only_changed else None)
+        if only_changed and skipped:
+            result["message"] += f" | تخطي {skipped} بدون تغيير"
+        return result
     except Exception as e:
         return {"success": False, "message": f"❌ خطأ: {str(e)[:120]}"}
 
 
-def send_new_products(products):
+def send_test_update(product, url=None):
+    """
+    إرسال تجريبي لمنتج واحد مباشرة للـ webhook: مفتاح جديد لكل ضغطة،
+    بدون الصندوق الصادر ولا سجل ما وصل (لا يؤثر على فروقات الإرسال الحقيقي)
+    """
+    url = url or WEBHOOK_UPDATE_PRICES
+    if not url:
+        return {"success": False, "message": "❌ رابط Webhook غير مضبوط"}
+    items = _price_items([product])
+    key = uuid.uuid4().hex
+    ok, err = _post(url, {"products": items, "timestamp": datetime.now().isoformat(),
+                          "total": len(items), "source": "mahwous_v20", "test": True,
+                          "idempotency_key": key}, key, timeout=10)
+    if ok:
+        return {"success": True, "count": len(items), "message": "✅ وصل المنتج التجريبي لـ Make.com"}
+    return {"success": False, "message": f"❌ فشل الإرسال التجريبي ({err})"}
+
+
+def _enrichment_for(products):
+    """إثراء محفوظ (enrich_missing) لكل منتج حسب اسمه المطبّع — بدون أي استدعاء AI"""
+    try:
+        from engines.engine import normalize
+        from utils.db_manager import load_enrichment
+        norms = [normalize(p.get("منتج المنافس", "")) for p in products]
+        saved = load_enrichment(set(norms))
+        return [saved.get(n, {}) for n in norms]
+    except Exception:
+        return [{}] * len(products)
+
+
+def send_new_products(products, url=None):
     if not products:
         return {"success": False, "message": "لا توجد منتجات"}
     try:
-        payload = {
-            "products": [{
-                "name":       str(p.get("منتج المنافس", "")),
-                "price":      float(p.get("سعر المنافس", 0)),
-                "brand":      str(p.get("الماركة", "")),
-                "size":       str(p.get("الحجم", "")),
-                "type":       str(p.get("النوع", "")),
-                "competitor": str(p.get("المنافس", "")),
-            } for p in products],
-            "timestamp": datetime.now().isoformat(),
-            "total":     len(products),
-            "source":    "mahwous_v20",
-        }
-        r = requests.post(WEBHOOK_NEW_PRODUCTS, json=payload,
-                          headers={"Content-Type": "application/json"}, timeout=30)
-        if r.status_code in (200, 201, 202):
-            return {"success": True,
-                    "message": f"✅ تم إرسال {len(products)} منتج مفقود لـ Make.com",
-                    "count": len(products)}
-        return {"success": False, "message": f"❌ Make رد بـ {r.status_code}"}
+        extra = _enrichment_for(products)
+        items = [{
+            "name":         str(p.get("منتج المنافس", "")),
+            "price":        float(p.get("سعر المنافس", 0)),
+            "brand":        str(p.get("الماركة", "")),
+            "size":         str(p.get("الحجم", "")),
+            "type":         str(p.get("النوع", "")),
+            "competitor":   str(p.get("المنافس", "")),
+            "description":  e.get("description", ""),
+            "image_url":    e.get("image_url", ""),
+            "top_notes":    e.get("top_notes", []),
+            "middle_notes": e.get("middle_notes", []),
+            "base_notes":   e.get("base_notes", []),
+        } for p, e in zip(products, extra)]
+        return _push("new", url or WEBHOOK_NEW_PRODUCTS, items, noun="منتج مفقود")
     except Exception as e:
         return {"success": False, "message": f"❌ خطأ: {str(e)[:120]}"}
 
@@ -1,10 +1,9 @@
 """
 utils/results_page.py — مكون مشترك لصفحات النتائج الخمس
 v21: إصلاح خطأ color_row + إعادة الصفحة عند تغيير الفلاتر + تحسينات UI
+المحرك (pandas/rapidfuzz/openpyxl) يُستورد عند الحاجة فقط — زيارة صفحة بلا نتائج لا تحمّله.
 """
 import streamlit as st
-import pandas as pd
-from engines.engine import export_excel
 
 ROWS = 25
 
@@ -40,6 +39,7 @@ def _apply_filters(df, section):
         st.session_state[f"page_{section}"] = 1
         st.session_state[prev_key] = filter_state
 
+    import pandas as pd
     filtered = df.copy()
     if search:
         mask = (filtered["المنتج"].astype(str).str.contains(search, case=False, na=False) |
@@ -131,6 +131,7 @@ def _export_make_bar(df, section, make_type="update"):
     c1, c2, c3 = st.columns(3)
 
     with c1:
+        from engines.engine import export_excel
         data = export_excel(df, sheet=section[:31])
         st.download_button(
             f"📥 تصدير Excel ({len(df)})",
@@ -145,13 +146,22 @@ def _export_make_bar(df, section, make_type="update"):
             st.session_state[f"confirm_make_{section}"] = True
 
         if st.session_state.get(f"confirm_make_{section}"):
-            st.warning(f"⚠️ سيتم إرسال **{len(df)}** منتج — متأكد؟")
+            from utils.make_helper import send_price_updates, send_new_products, preview_price_updates
+            records = df.to_dict("records")
+            send_all = False
+            if make_type == "new":
+                st.warning(f"⚠️ سيتم إرسال **{len(df)}** منتج — متأكد؟")
+            else:
+                pv = preview_price_updates(records)
+                st.warning(f"⚠️ سيتم إرسال **{pv['changed']}** منتج تغيّر إجراؤه أو سعره "
+                           f"من أصل {pv['total']} ({pv['unchanged']} بدون تغيير منذ آخر إرسال"
+                           + (f"، {pv['no_id']} بدون معرف" if pv["no_id"] else "") + ") — متأكد؟")
+                send_all = st.checkbox("إرسال الكل (تجاهل سجل الإرسال)", key=f"make_all_{section}")
             cc1, cc2 = st.columns(2)
             if cc1.button("✅ نعم", key=f"confirm_yes_{section}"):
                 with st.spinner("جاري الإرسال..."):
-                    from utils.make_helper import send_price_updates, send_new_products
-                    records = df.to_dict("records")
-                    result = send_new_products(records) if make_type == "new" else send_price_updates(records)
+                    result = (send_new_products(records) if make_type == "new"
+                              else send_price_updates(records, only_changed=not send_all))
                     if result["success"]:
                         st.success(result["message"])
                     else:
@@ -169,6 +179,52 @@ def _export_make_bar(df, section, make_type="update"):
                 st.markdown(result)
 
 
+def _decision_bar(df, section):
+    """تأكيد أو رفض مطابقة → decisions + ذاكرة المطابقة (تُعاد في التحليل القادم)"""
+    if "منتج_المنافس" not in df.columns or len(df) == 0:
+        return
+    with st.expander("👤 تأكيد / رفض مطابقة", expanded=False):
+        labels = [f"{r['المنتج']} ↔ {r['منتج_المنافس']}" for _, r in df.iterrows()]
+        i = st.selectbox("المطابقة", range(len(labels)), format_func=lambda j: labels[j],
+                         key=f"dec_pick_{section}")
+        row = df.iloc[i]
+        c1, c2 = st.columns(2)
+        status = None
+        if c1.button("✅ مطابقة صحيحة", key=f"dec_ok_{section}"):
+            status = "✅ موافق عليها"
+        if c2.button("🗑️ مطابقة خاطئة", key=f"dec_rm_{section}"):
+            status = "🗑️ إزالة"
+        if status:
+            from utils.db_manager import log_decision
+            from engines.scorer import decision_features
+            log_decision(str(row["المنتج"]), str(row.get("القرار", "")), status,
+                         our_price=float(row.get("السعر", 0) or 0),
+                         comp_price=float(row.get("سعر_المنافس", 0) or 0),
+                         diff=float(row.get("الفرق", 0) or 0),
+                         competitor=str(row.get("المنافس", "")),
+                         comp_product=str(row["منتج_المنافس"]),
+                         our_id=str(row.get("معرف_المنتج", "") or ""),
+                         comp_id=str(row.get("معرف_المنافس", "") or ""),
+                         score=float(row.get("نسبة_التطابق", 0) or 0),
+                         features=decision_features(row))
+            st.success("✅ حُفظ القرار — سيُستخدم في التحليل القادم")
+
+
+def _enrich_bar(df, section):
+    """إثراء المفقودات من Fragrantica + وصف مهووس — يُحفظ ويُرسل مع Make لاحقاً"""
+    with st.expander("🌸 إثراء المنتجات (Fragrantica + وصف مهووس)", expanded=False):
+        st.caption("عدة عطور في كل طلب، والنتائج تُحفظ فوراً — إعادة التشغيل تكمل من حيث توقفت")
+        if st.button(f"🌸 إثراء ({len(df)})", key=f"enrich_{section}"):
+            from engines.ai_engine import enrich_missing
+            bar = st.progress(0.0)
+            done, stats = enrich_missing(df, progress_cb=lambda p: bar.progress(p))
+            bar.progress(1.0)
+            st.success(f"✅ مُثرى: {len(done)}/{stats['unique']} | جديد: {stats['enriched']} "
+                       f"| محفوظ سابقاً: {stats['cached']} | طلبات AI: {stats['calls']}")
+            if stats["failed"]:
+                st.warning(f"⚠️ {stats['failed']} منتج لم يُعثر عليه — أعد التشغيل لاحقاً")
+
+
 def show_results_page(title, decision_key, section_id, make_type="update"):
     """الدالة الرئيسية — تُستدعى من كل صفحة نتائج"""
     st.title(title)
@@ -189,6 +245,7 @@ def show_results_page(title, decision_key, section_id, make_type="update"):
         if len(filtered) == 0:
             st.info("لا توجد نتائج بهذه الفلاتر"); return
         _display_table(filtered, section_id)
+        _enrich_bar(filtered, section_id)
         _export_make_bar(filtered, section_id, make_type="new")
     else:
         section_df = df[df["القرار"].str.contains(decision_key, na=False)].copy()
@@ -205,4 +262,5 @@ def show_results_page(title, decision_key, section_id, make_type="update"):
         if len(filtered) == 0:
             st.info("لا توجد نتائج بهذه الفلاتر"); return
         _display_table(filtered, section_id)
+        _decision_bar(filtered, section_id)
         _export_make_bar(filtered, section_id, make_type)
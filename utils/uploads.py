@@ -0,0 +1,50 @@
+"""
+utils/uploads.py - قراءة الملفات المرفوعة مرة واحدة لكل محتوى
+
+كل تفاعل في صفحة التحليل يعيد تشغيل السكربت؛ بدون cache يُعاد تحليل CSV/Excel
+وتخمين الأعمدة (best_col) مع كل تغيير قائمة منسدلة.
+parse_upload(f) → (df, err, guess) مخزّن في st.cache_data بمفتاح بصمة المحتوى
+(+ اسم الملف لأنه يحدد الصيغة) — إعادة الرفع بنفس المحتوى لا تعيد القراءة.
+الحدود: UPLOAD_CACHE_ENTRIES ملفاً و UPLOAD_CACHE_TTL ثانية؛ clear_upload_cache()
+يفرّغ الملفات وفهارس المحرك معاً.
+"""
+import hashlib, io
+import streamlit as st
+
+try:
+    from config import UPLOAD_CACHE_ENTRIES, UPLOAD_CACHE_TTL
+except Exception:
+    UPLOAD_CACHE_ENTRIES = 12; UPLOAD_CACHE_TTL = 3600
+
+NAME_COLS  = ["المنتج","اسم المنتج","Product","Name","name"]
+PRICE_COLS = ["السعر","سعر","Price","price"]
+ID_COLS    = ["no","NO","No","معرف","ID","id","SKU","sku","الكود","رقم المنتج"]
+
+
+def _guess(df):
+    from engines.engine import best_col
+    return {"name": best_col(df, NAME_COLS), "price": best_col(df, PRICE_COLS),
+            "id": best_col(df, ID_COLS)}
+
+
+@st.cache_data(max_entries=UPLOAD_CACHE_ENTRIES, ttl=UPLOAD_CACHE_TTL, show_spinner=False)
+def _parse(digest, name, _data):
+    # _data لا يدخل في مفتاح الـ cache (البادئة _) — المفتاح هو digest + name
+    from engines.engine import read_file
+    f = io.BytesIO(_data)
+    f.name = name
+    df, err = read_file(f)
+    return df, err, (_guess(df) if df is not None and not err else {})
+
+
+def parse_upload(uploaded):
+    """UploadedFile → (df, err, {name, price, id}) — نسخة جديدة من df في كل استدعاء"""
+    data = uploaded.getvalue()
+    return _parse(hashlib.blake2b(data, digest_size=16).hexdigest(), uploaded.name, data)
+
+
+def clear_upload_cache():
+    """إبطال صريح: الملفات المقروءة + فهارس المنافسين/الكتالوج في المحرك"""
+    _parse.clear()
+    from engines.engine import clear_caches
+    clear_caches()